@@ -0,0 +1,382 @@
+"""
+Admission control for the LLM-bound endpoints, shared by all worker processes.
+
+Each limit is a small table in a memory-mapped file. Processes serialize
+access to it with flock(), and the threads of one process with a mutex. A
+check reads and writes a few dozen bytes, so it costs microseconds. No
+SQLite round trip is involved.
+
+- SharedTokenBuckets: token bucket rate limits per key (user ID, client IP).
+- SharedConcurrencyLimit: a global cap on requests in flight, plus a bounded
+  wait queue. Each process keeps its own counts in the table, so a worker
+  that dies does not leak slots: entries of dead processes are dropped when
+  the cap is reached. Entries are keyed by PID and process start time, so a
+  new process that gets a dead one's PID (common in containers, where the
+  server is often PID 1 after every restart) does not inherit its counts.
+"""
+import asyncio
+import fcntl
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'MBA2'  # changed whenever an entry layout changes, so old files start empty
+_HEADER = struct.Struct('<4sII')  # magic, table kind, entries
+_BUCKET = struct.Struct('<Qdd')  # key hash (0 = empty), tokens, updated at (epoch seconds)
+_PROCESS = struct.Struct('<iiiQ')  # pid (0 = empty), in flight, waiting, process start time
+
+BUCKET_PROBES = 8  # slots searched per key before evicting the least recently used one
+
+ACQUIRED = 'acquired'
+QUEUE_FULL = 'queue_full'
+QUEUE_TIMEOUT = 'queue_timeout'
+
+class _SharedTable:
+    """Fixed-size table in a memory-mapped file, locked across threads and processes"""
+
+    def __init__(self, path, kind, entries, entry_size):
+        self.path = path
+        self.kind = kind
+        self.entries = entries
+        self.size = _HEADER.size + entries * entry_size
+
+        self._lock = threading.Lock()
+        self._open()
+        # A forked child must not share the parent's open file: flock() would not
+        # tell the two processes apart
+        os.register_at_fork(after_in_child=self._reopen)
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < self.size:
+            os.ftruncate(self._fd, self.size)
+        self._map = mmap.mmap(self._fd, self.size)
+        with self._locked() as table:
+            if _HEADER.unpack_from(table, 0) != (_MAGIC, self.kind, self.entries):
+                # New file, or one written with another layout: start empty
+                table[:self.size] = bytes(self.size)
+                _HEADER.pack_into(table, 0, _MAGIC, self.kind, self.entries)
+
+    def _reopen(self):
+        self._lock = threading.Lock()
+        self._map.close()
+        os.close(self._fd)
+        self._open()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield self._map
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+class SharedTokenBuckets(_SharedTable):
+    """
+    Token buckets keyed by string: each key may spend burst requests at once
+    and rate per second after that. Keys are hashed into slots; when every
+    probed slot is in use, the least recently used one is taken over.
+    """
+
+    def __init__(self, path, rate, burst, slots=4096):
+        super().__init__(path, 1, slots, _BUCKET.size)
+        self.rate = rate
+        self.burst = burst
+
+    def take(self, key, cost=1.0):
+        """Spend cost tokens from key's bucket; returns 0.0, or the seconds until it could"""
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        now = time.time()
+        with self._locked() as table:
+            offset = self._find_slot(table, key_hash)
+            found, tokens, updated = _BUCKET.unpack_from(table, offset)
+            if found != key_hash:
+                tokens, updated = self.burst, now
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            if tokens >= cost:
+                _BUCKET.pack_into(table, offset, key_hash, tokens - cost, now)
+                return 0.0
+            _BUCKET.pack_into(table, offset, key_hash, tokens, now)
+        return (cost - tokens) / self.rate
+
+    def _find_slot(self, table, key_hash):
+        # Caller holds the lock
+        start = key_hash % self.entries
+        oldest_offset, oldest_updated = None, None
+        for probe in range(BUCKET_PROBES):
+            offset = _HEADER.size + ((start + probe) % self.entries) * _BUCKET.size
+            found, tokens, updated = _BUCKET.unpack_from(table, offset)
+            if found == key_hash or found == 0:
+                return offset
+            if oldest_updated is None or updated < oldest_updated:
+                oldest_offset, oldest_updated = offset, updated
+        return oldest_offset
+
+class SharedConcurrencyLimit(_SharedTable):
+    """
+    At most limit requests in flight across all processes. A request that
+    finds the limit reached waits (polling, not FIFO) for up to the queue
+    timeout, unless max_queue requests are already waiting.
+    """
+
+    def __init__(self, path, limit, max_queue, poll_interval=0.005, max_processes=64):
+        super().__init__(path, 2, max_processes, _PROCESS.size)
+        self.limit = limit
+        self.max_queue = max_queue
+        self.poll_interval = poll_interval
+
+    def try_acquire(self):
+        """Take a slot if one is free; returns True on success"""
+        with self._locked() as table:
+            offset, totals = self._own_entry(table)
+            if totals[0] >= self.limit:
+                totals = self._reap(table)
+                if totals[0] >= self.limit:
+                    return False
+            self._add(table, offset, 1, 0)
+            return True
+
+    def release(self):
+        with self._locked() as table:
+            offset, totals = self._own_entry(table)
+            self._add(table, offset, -1, 0)
+
+    def acquire(self, timeout):
+        """Take a slot, waiting up to timeout seconds; returns ACQUIRED, QUEUE_FULL or QUEUE_TIMEOUT"""
+        if self.try_acquire():
+            return ACQUIRED
+        if not self._enqueue():
+            return QUEUE_FULL
+        try:
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                if self.try_acquire():
+                    return ACQUIRED
+            return QUEUE_TIMEOUT
+        finally:
+            self._dequeue()
+
+    async def acquire_async(self, timeout):
+        """acquire() for the event loop: waits with asyncio.sleep instead of blocking"""
+        if self.try_acquire():
+            return ACQUIRED
+        if not self._enqueue():
+            return QUEUE_FULL
+        try:
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                if self.try_acquire():
+                    return ACQUIRED
+            return QUEUE_TIMEOUT
+        finally:
+            self._dequeue()
+
+    def usage(self):
+        """(in flight, waiting) over all live processes"""
+        with self._locked() as table:
+            return self._reap(table)
+
+    def _enqueue(self):
+        with self._locked() as table:
+            offset, totals = self._own_entry(table)
+            if totals[1] >= self.max_queue:
+                totals = self._reap(table)
+                if totals[1] >= self.max_queue:
+                    return False
+            self._add(table, offset, 0, 1)
+            return True
+
+    def _dequeue(self):
+        with self._locked() as table:
+            offset, totals = self._own_entry(table)
+            self._add(table, offset, 0, -1)
+
+    def _entries(self, table):
+        rows = _PROCESS.iter_unpack(table[_HEADER.size:self.size])
+        for index, (pid, in_flight, waiting, started) in enumerate(rows):
+            yield _HEADER.size + index * _PROCESS.size, pid, in_flight, waiting, started
+
+    def _own_entry(self, table):
+        # Caller holds the lock; returns (offset of this process's entry, (in flight, waiting) totals)
+        pid, started = _own_identity()
+        own = free = None
+        in_flight = waiting = 0
+        for offset, entry_pid, entry_in_flight, entry_waiting, entry_started in self._entries(table):
+            if (entry_pid, entry_started) == (pid, started):
+                own = offset
+            elif entry_pid == 0 and free is None:
+                free = offset
+            in_flight += entry_in_flight
+            waiting += entry_waiting
+        if own is None:
+            if free is None:
+                self._reap(table)
+                free = next((offset for offset, entry_pid, *_ in self._entries(table) if entry_pid == 0), None)
+                if free is None:
+                    raise RuntimeError(f"Admission table {self.path} has no room for another process")
+            _PROCESS.pack_into(table, free, pid, 0, 0, started)
+            own = free
+        return own, (in_flight, waiting)
+
+    def _add(self, table, offset, in_flight, waiting):
+        pid, current_in_flight, current_waiting, started = _PROCESS.unpack_from(table, offset)
+        _PROCESS.pack_into(table, offset, pid, max(0, current_in_flight + in_flight),
+                           max(0, current_waiting + waiting), started)
+
+    def _reap(self, table):
+        # Caller holds the lock; frees entries of dead processes and returns the live totals
+        own = _own_identity()
+        in_flight = waiting = 0
+        for offset, pid, entry_in_flight, entry_waiting, started in self._entries(table):
+            if pid == 0:
+                continue
+            if (pid, started) != own and not _alive(pid, started):
+                _PROCESS.pack_into(table, offset, 0, 0, 0, 0)
+                continue
+            in_flight += entry_in_flight
+            waiting += entry_waiting
+        return in_flight, waiting
+
+_HAVE_PROC = os.path.exists('/proc/self/stat')
+_identity = {}  # pid -> start time of this process (a forked child looks itself up again)
+
+def _process_start_time(pid):
+    """Start time of a process in clock ticks since boot; 0 without /proc, None if there is no such process"""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as stat:
+            data = stat.read()
+    except FileNotFoundError:
+        return None if _HAVE_PROC else 0
+    except OSError:
+        return 0
+    # The command name in parentheses may contain spaces; starttime is field 22
+    return int(data[data.rindex(b')') + 2:].split()[19])
+
+def _own_identity():
+    """(pid, start time) identifying this process's entry"""
+    pid = os.getpid()
+    started = _identity.get(pid)
+    if started is None:
+        started = _identity[pid] = _process_start_time(pid) or 0
+    return pid, started
+
+def _alive(pid, started):
+    if _HAVE_PROC:
+        return _process_start_time(pid) == started
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Rejection:
+    """Why a request was turned away, with the HTTP status and Retry-After seconds to send"""
+
+    def __init__(self, reason, status, retry_after):
+        self.reason = reason
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    @property
+    def message(self):
+        if self.status == 429:
+            return 'Too many requests, please slow down'
+        return 'Server is busy, please retry shortly'
+
+class AdmissionController:
+    """
+    Rate limits per user and per client IP, then a global in-flight cap.
+    A rate of 0 (or a limit of 0) turns that check off.
+    """
+
+    def __init__(self, directory, user_rate, user_burst, ip_rate, ip_burst, max_in_flight, max_queue,
+                 queue_timeout, overload_retry_after=2, enabled=True):
+        self.queue_timeout = queue_timeout
+        self.overload_retry_after = overload_retry_after
+        self.enabled = enabled
+
+        self.user_buckets = self.ip_buckets = self.in_flight = None
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+            if user_rate > 0:
+                self.user_buckets = SharedTokenBuckets(os.path.join(directory, 'user-rate.admission'),
+                                                       user_rate, user_burst)
+            if ip_rate > 0:
+                self.ip_buckets = SharedTokenBuckets(os.path.join(directory, 'ip-rate.admission'),
+                                                     ip_rate, ip_burst)
+            if max_in_flight > 0:
+                self.in_flight = SharedConcurrencyLimit(os.path.join(directory, 'in-flight.admission'),
+                                                        max_in_flight, max_queue)
+
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._rejected = {}
+
+    def check_rate(self, user_id, ip):
+        """Charge one request to the user's and the IP's buckets; returns a Rejection or None"""
+        if self.user_buckets is not None and user_id is not None:
+            wait = self.user_buckets.take(f"user:{user_id}")
+            if wait:
+                return self._reject('user_rate', 429, wait)
+        if self.ip_buckets is not None and ip:
+            wait = self.ip_buckets.take(f"ip:{ip}")
+            if wait:
+                return self._reject('ip_rate', 429, wait)
+        return None
+
+    def acquire(self):
+        """Take an in-flight slot, waiting in the queue if needed; returns a Rejection or None"""
+        if self.in_flight is None:
+            return self._admit()
+        return self._outcome(self.in_flight.acquire(self.queue_timeout))
+
+    async def acquire_async(self):
+        """acquire() for the event loop"""
+        if self.in_flight is None:
+            return self._admit()
+        return self._outcome(await self.in_flight.acquire_async(self.queue_timeout))
+
+    def release(self):
+        if self.in_flight is not None:
+            self.in_flight.release()
+
+    def stats(self):
+        """Admission counters for this process, and shared in-flight usage"""
+        with self._lock:
+            summary = {'enabled': self.enabled, 'admitted': self._admitted, 'rejected': dict(self._rejected)}
+        if self.in_flight is not None:
+            in_flight, waiting = self.in_flight.usage()
+            summary.update(in_flight=in_flight, waiting=waiting, max_in_flight=self.in_flight.limit,
+                           max_queue=self.in_flight.max_queue)
+        return summary
+
+    def _outcome(self, outcome):
+        if outcome == ACQUIRED:
+            return self._admit()
+        return self._reject(outcome, 503, self.overload_retry_after)
+
+    def _admit(self):
+        with self._lock:
+            self._admitted += 1
+        return None
+
+    def _reject(self, reason, status, retry_after):
+        with self._lock:
+            self._rejected[reason] = self._rejected.get(reason, 0) + 1
+        metrics.admission_rejections.labels(reason).inc()
+        return Rejection(reason, status, retry_after)
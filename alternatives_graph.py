@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import (
+    get_alternative_set, save_alternative_set, delete_alternative_sets, delete_expired_alternative_sets
+)
+from query_normalizer import canonicalize_query
+
+logger = logging.getLogger(__name__)
+
+# Drop hard-expired sets from SQLite once every this many stores
+EXPIRE_EVERY_STORES = 100
+
+def _calories(food):
+    try:
+        return float(food.get('nutriments', {}).get('energy-kcal_100g'))
+    except (TypeError, ValueError):
+        return None
+
+class AlternativesGraph:
+    """
+    Stored food -> healthier alternative graph with stale-while-revalidate.
+
+    A set younger than fresh_seconds is served as is. An older one is still
+    served straight away while refresh_fn(food_name, calories, category)
+    regenerates it on a small background pool (once per food at a time).
+    Sets older than max_age_seconds, and invalidated ones, count as missing,
+    so the caller generates them on the request path. refresh_fn is expected
+    to call store() with the new alternatives.
+    """
+
+    def __init__(self, refresh_fn, fresh_seconds, max_age_seconds, refresh_workers=2, enabled=True):
+        self.refresh_fn = refresh_fn
+        self.fresh_seconds = fresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.enabled = enabled
+
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='alternatives-refresh')
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stores = 0
+        self._fresh_hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._refreshes = 0
+
+    def get(self, food_name, calories, category):
+        """Stored alternatives for a food, or None when there is no servable set"""
+        if not self.enabled:
+            return None
+
+        food_key = canonicalize_query(food_name)
+        entry = get_alternative_set(food_key)
+        age = time.time() - entry[1] if entry else None
+
+        if entry is None or not entry[0] or age >= self.max_age_seconds:
+            with self._lock:
+                self._misses += 1
+            return None
+
+        if age >= self.fresh_seconds:
+            with self._lock:
+                self._stale_hits += 1
+            self._schedule_refresh(food_key, food_name, calories, category)
+        else:
+            with self._lock:
+                self._fresh_hits += 1
+        return entry[0]
+
+    def has(self, food_name):
+        """Whether get() would serve a stored set, without counting it or scheduling a refresh"""
+        if not self.enabled:
+            return False
+        entry = get_alternative_set(canonicalize_query(food_name))
+        return bool(entry and entry[0]) and time.time() - entry[1] < self.max_age_seconds
+
+    def store(self, food_name, calories, category, alternatives):
+        """Save a freshly generated set of alternatives as the food's edges"""
+        if not self.enabled or not alternatives:
+            return False
+
+        try:
+            original = float(calories)
+        except (TypeError, ValueError):
+            original = None
+
+        edges = []
+        for alternative in alternatives:
+            alternative_calories = _calories(alternative)
+            delta = alternative_calories - original if original is not None and alternative_calories is not None else None
+            edges.append((canonicalize_query(alternative.get('product_name', '')), delta, alternative))
+
+        saved = save_alternative_set(canonicalize_query(food_name), food_name, original, category, edges)
+
+        with self._lock:
+            self._stores += 1
+            should_expire = self._stores % EXPIRE_EVERY_STORES == 0
+        if should_expire:
+            removed = delete_expired_alternative_sets(self.max_age_seconds)
+            if removed:
+                logger.info(f"Expired {removed} stored alternative sets")
+        return saved
+
+    def invalidate(self, food_names=None):
+        """Forget stored alternatives for the given foods (all foods when None)"""
+        food_keys = None if food_names is None else [canonicalize_query(name) for name in food_names]
+        removed = delete_alternative_sets(food_keys)
+        logger.info(f"Invalidated {removed} stored alternative sets")
+        return removed
+
+    def stats(self):
+        """Hit/refresh counters for this process"""
+        with self._lock:
+            return {
+                'fresh_hits': self._fresh_hits,
+                'stale_hits': self._stale_hits,
+                'misses': self._misses,
+                'refreshes': self._refreshes,
+                'refreshing': len(self._refreshing)
+            }
+
+    def _schedule_refresh(self, food_key, food_name, calories, category):
+        with self._lock:
+            if food_key in self._refreshing:
+                return
+            self._refreshing.add(food_key)
+            self._refreshes += 1
+        logger.info(f"Alternatives for {food_name} are stale, refreshing in the background")
+        self._executor.submit(self._refresh, food_key, food_name, calories, category)
+
+    def _refresh(self, food_key, food_name, calories, category):
+        try:
+            self.refresh_fn(food_name, calories, category)
+        except Exception as e:
+            logger.error(f"Background alternatives refresh failed for {food_name}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(food_key)
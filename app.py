@@ -1,14 +1,42 @@
-from flask import Flask, render_template, request, jsonify, make_response, session
+from flask import Flask, render_template, request, jsonify, make_response, session, Response, g
+from concurrent.futures import ThreadPoolExecutor
+import click
+import contextvars
 import openai
 from openai import OpenAI
 import json
 import logging
+import math
+import os
+import re
+import threading
+import time
+
+from llm_cache import LLMResultCache, normalize_query
+from singleflight import SingleFlight
+from json_stream import JSONArrayStreamParser
+from prefetch import Prefetcher
+from alternatives_graph import AlternativesGraph
+from popularity import PopularityCounter
+from warmup import CacheWarmer
+from query_normalizer import TrigramIndex, canonicalize_query
+from llm_router import ModelRouter
+from admission import AdmissionController
+from comparison_engine import ComparisonEngine, RANKING_PRESETS, DEFAULT_RANKING
+from http_cache import ValidatorIndex, content_etag, etag_matches, choose_encoding, is_compressible, COMPRESS_MIN_BYTES
+from profile_metrics import profile_metrics
+import metrics
+import tracing
+from log_config import configure_logging, log_payload
 
 # Import database functions for user authentication 
 try:
     from database import (
         init_database, create_user, authenticate_user, create_session, 
-        get_user_from_session, delete_session, get_user_profile, update_user_profile
+        get_user_from_session, delete_session, get_user_profile, update_user_profile,
+        upsert_food, search_foods, get_food, get_food_names_since,
+        begin_request_scope, end_request_scope, start_session_sweeper,
+        recompute_profile_metrics, enable_incremental_vacuum, get_search_version, get_alternatives_version
     )
     DB_AVAILABLE = True
 except ImportError:
@@ -27,26 +55,348 @@ if DB_AVAILABLE:
     except Exception as e:
         print(f"Database initialization failed: {e}")
 
-# OpenRouter Configuration
+# One pooled database connection per request, shared by all database helpers
+if DB_AVAILABLE:
+    @app.before_request
+    def open_db_scope():
+        begin_request_scope()
+    
+    @app.teardown_request
+    def close_db_scope(exc):
+        end_request_scope()
+
+# Request latency per route for /metrics, and a trace per request whose ID is echoed
+# in the X-Request-ID response header
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    request_id = tracing.new_request_id(request.headers.get(tracing.REQUEST_ID_HEADER))
+    g.trace = tracing.start_trace(f"{request.method} {request.path}", request_id)
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    if started is not None:
+        metrics.http_request_duration.labels(route, request.method, str(response.status_code)).observe(
+            time.perf_counter() - started
+        )
+    trace = g.get('trace')
+    if trace is not None:
+        response.headers[tracing.REQUEST_ID_HEADER] = trace.request_id
+        trace.attrs.update(route=route, status=response.status_code)
+    return response
+
+@app.teardown_request
+def finish_request_trace(exc):
+    trace = g.pop('trace', None)
+    if trace is not None:
+        tracing.finish_trace(trace, error=repr(exc) if exc else None)
+
+# OpenRouter Configuration (set OPENROUTER_BASE_URL to point at another endpoint, e.g.
+# benchmarks/mock_openrouter.py for load tests)
+OPENROUTER_BASE_URL = os.environ.get('OPENROUTER_BASE_URL', "https://openrouter.ai/api/v1")
+OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY', "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")
 client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key="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",
+    base_url=OPENROUTER_BASE_URL,
+    api_key=OPENROUTER_API_KEY,
 )
 
-# Configure logging for debugging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (written by a background thread, traces included; LLM payloads are sampled
+# and truncated)
+configure_logging(logging.INFO, routes={tracing.TRACE_LOGGER: tracing.trace_file_handler()})
 logger = logging.getLogger(__name__)
 
+# Candidate models (primary first) and prompt version per LLM task (bump the prompt
+# version whenever a prompt changes)
+NUTRITION_MODELS = os.environ.get('MINDFULBITE_NUTRITION_MODELS', 'openai/gpt-4.1,openai/gpt-4.1-mini').split(',')
+NUTRITION_MODEL = NUTRITION_MODELS[0]
+NUTRITION_PROMPT_VERSION = 1
+ALTERNATIVES_MODELS = os.environ.get('MINDFULBITE_ALTERNATIVES_MODELS', 'openai/gpt-4.1,openai/gpt-4.1-mini').split(',')
+ALTERNATIVES_MODEL = ALTERNATIVES_MODELS[0]
+ALTERNATIVES_PROMPT_VERSION = 1
+
+# Per-task routing with deadlines (seconds) and hedged requests once the primary model
+# is slower than its rolling p95
+nutrition_router = ModelRouter('nutrition', client, NUTRITION_MODELS, timeout=20)
+meal_nutrition_router = ModelRouter('meal_nutrition', client, NUTRITION_MODELS, timeout=45)
+alternatives_router = ModelRouter('alternatives', client, ALTERNATIVES_MODELS, timeout=30)
+alternatives_stream_router = ModelRouter('alternatives_stream', client, ALTERNATIVES_MODELS, timeout=30)
+LLM_ROUTERS = [nutrition_router, meal_nutrition_router, alternatives_router, alternatives_stream_router]
+
+# Nutrition results cache: in-process LRU in front of the shared SQLite table
+nutrition_cache = LLMResultCache(
+    namespace='nutrition',
+    model=NUTRITION_MODEL,
+    prompt_version=NUTRITION_PROMPT_VERSION,
+    ttl_seconds=7*24*60*60,  # 7 days
+    max_memory_entries=2000,
+    max_persistent_entries=100000,
+    persistent=DB_AVAILABLE
+)
+
+# Coalesce concurrent identical LLM calls (set MINDFULBITE_SINGLEFLIGHT_CROSS_PROCESS=1
+# to also coalesce across worker processes through a lock row in SQLite)
+SINGLEFLIGHT_CROSS_PROCESS = DB_AVAILABLE and os.environ.get('MINDFULBITE_SINGLEFLIGHT_CROSS_PROCESS', '0') == '1'
+nutrition_flight = SingleFlight('nutrition', cross_process=SINGLEFLIGHT_CROSS_PROCESS)
+alternatives_flight = SingleFlight('alternatives', cross_process=SINGLEFLIGHT_CROSS_PROCESS)
+
+# Speculative alternatives generation kicked off by /api/food_search and claimed by the
+# follow-up alternatives request (MINDFULBITE_PREFETCH_WORKERS=0 disables it)
+alternatives_prefetcher = Prefetcher(
+    'alternatives',
+    lambda food_name, calories, category: get_healthier_alternatives_from_llm(food_name, calories, category),
+    max_workers=int(os.environ.get('MINDFULBITE_PREFETCH_WORKERS', 4)),
+    max_pending=int(os.environ.get('MINDFULBITE_PREFETCH_MAX_PENDING', 16)),
+    claim_ttl=int(os.environ.get('MINDFULBITE_PREFETCH_CLAIM_TTL', 60))
+)
+PREFETCH_CLAIM_TIMEOUT = 30  # seconds to wait for a claimed job that is still running
+
+# Stored food -> alternatives graph: sets older than the freshness window are served while
+# being regenerated in the background; past the hard expiry they are regenerated inline
+alternatives_graph = AlternativesGraph(
+    lambda food_name, calories, category: generate_healthier_alternatives(food_name, calories, category),
+    fresh_seconds=int(os.environ.get('MINDFULBITE_ALTERNATIVES_FRESH_SECONDS', 7*24*60*60)),  # 7 days
+    max_age_seconds=int(os.environ.get('MINDFULBITE_ALTERNATIVES_MAX_AGE_SECONDS', 30*24*60*60)),  # 30 days
+    enabled=DB_AVAILABLE
+)
+
+# Popularity of normalized search and alternatives queries, flushed to SQLite now and then
+food_popularity = PopularityCounter(flush_interval=60, enabled=DB_AVAILABLE)
+
+# After a start, warm nutrition and alternatives for the most popular foods in the background;
+# /api/ready reports ready once the coverage target is reached
+WARMUP_TOP_N = int(os.environ.get('MINDFULBITE_WARMUP_TOP_N', 50))  # 0 disables warm-up
+cache_warmer = CacheWarmer(
+    'foods',
+    lambda: [query for query, hits in food_popularity.top(WARMUP_TOP_N)],
+    lambda query: is_food_warm(query),
+    lambda query: warm_food(query),
+    rate=float(os.environ.get('MINDFULBITE_WARMUP_RATE', 0.5)),  # foods per second
+    token_budget=int(os.environ.get('MINDFULBITE_WARMUP_TOKEN_BUDGET', 200000)),
+    ready_coverage=float(os.environ.get('MINDFULBITE_WARMUP_READY_COVERAGE', 0.8)),
+    enabled=DB_AVAILABLE and WARMUP_TOP_N > 0
+)
+
+# The session sweeper and the warm-up start with the first request (or the ASGI lifespan
+# startup), so `flask <command>` maintenance runs don't start background threads
+_background_jobs = {'started': False}
+_background_jobs_lock = threading.Lock()
+
+def start_background_jobs():
+    """Start this process's background threads (once)"""
+    if _background_jobs['started']:
+        return
+    with _background_jobs_lock:
+        if _background_jobs['started']:
+            return
+        if DB_AVAILABLE:
+            start_session_sweeper()
+        cache_warmer.start()
+        _background_jobs['started'] = True
+
+@app.before_request
+def ensure_background_jobs():
+    start_background_jobs()
+
+# HTTP caching for the read-only API routes: a weak ETag computed from the response body,
+# 304 for a matching If-None-Match and a Cache-Control policy per route. Conditional
+# requests whose backing data (matched catalog rows, stored alternatives, profile) is
+# unchanged since the ETag was served get their 304 before the view runs; the version
+# is only looked up for conditional requests, so others pay nothing for it. Text responses
+# of MINDFULBITE_COMPRESS_MIN_BYTES or more are sent brotli or gzip encoded.
+CACHE_POLICIES = {
+    'food_search': 'public, max-age=300, stale-while-revalidate=3600',
+    'find_alternatives': 'private, max-age=60'  # ranked for the requester's profile
+}
+http_validators = ValidatorIndex(max_entries=int(os.environ.get('MINDFULBITE_HTTP_VALIDATOR_ENTRIES', 10000)))
+
+def http_validator_key(endpoint, args):
+    """Key of a cacheable response in http_validators: the route and its query parameters"""
+    return endpoint, tuple(sorted(args.items()))
+
+def response_version(endpoint, args, user_id):
+    """
+    Version of the data a cacheable response is built from, or None when it cannot
+    be known without running the view
+    """
+    if not DB_AVAILABLE:
+        return None
+    if endpoint == 'food_search':
+        # The matched row and the full-text matches the page is built from; a query the
+        # catalog cannot answer goes to the LLM, so its response has no version
+        query = args.get('query', '')
+        match = find_local_match(query, canonicalize_query(query)) if query else None
+        if match is None:
+            return None
+        version = get_search_version(query, match[0])
+        return (match[0],) + version if version is not None else None
+    
+    food_name = args.get('food_name', '')
+    if not food_name or not alternatives_graph.enabled:
+        return None
+    stored = get_alternatives_version(canonicalize_query(food_name), normalize_query(food_name))
+    if stored is None or time.time() - stored[0] >= alternatives_graph.max_age_seconds:
+        # The view would generate new alternatives
+        return None
+    return stored + (comparison_daily_calories(args, user_id),)
+
+def not_modified(etag, policy, response=None):
+    """
+    304 response for a request whose If-None-Match matches etag. A response the view
+    already built is turned into the 304 in place, so close callbacks registered on it
+    (the admission slot release) still run.
+    """
+    http_validators.count_not_modified()
+    if response is None:
+        response = Response(status=304)
+    else:
+        response.status_code = 304
+        response.set_data(b'')
+        response.headers.pop('Content-Type', None)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = policy
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.before_request
+def check_http_validators():
+    policy = CACHE_POLICIES.get(request.endpoint)
+    if policy is None or request.method not in ('GET', 'HEAD'):
+        return None
+    key = http_validator_key(request.endpoint, request.args)
+    version = None
+    if request.headers.get('If-None-Match'):
+        user = get_current_user() if request.endpoint == 'find_alternatives' else None
+        with tracing.span('validators'):
+            version = response_version(request.endpoint, request.args, user['id'] if user else None)
+    g.http_validator = (key, version)
+    
+    etag = http_validators.precheck(key, version, request.headers.get('If-None-Match'))
+    if etag is not None:
+        return not_modified(etag, policy)
+    return None
+
+@app.after_request
+def apply_http_caching(response):
+    validator = g.pop('http_validator', None)
+    if validator is not None and response.status_code == 200 and not response.is_streamed:
+        key, version = validator
+        policy = CACHE_POLICIES[request.endpoint]
+        etag = content_etag(response.get_data())
+        http_validators.remember(key, version, etag)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return not_modified(etag, policy, response)
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = policy
+    
+    compress_response(response)
+    return response
+
+def compress_response(response):
+    """
+    Encode a buffered text response with the best coding the client accepts, if it
+    is large enough to be worth it
+    """
+    if (response.direct_passthrough or response.is_streamed or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)):
+        return
+    response.vary.add('Accept-Encoding')
+    coding = choose_encoding(request.headers.get('Accept-Encoding'))
+    body = response.get_data()
+    if coding is None or len(body) < COMPRESS_MIN_BYTES:
+        return
+    with tracing.span('compress', encoding=coding):
+        response.set_data(http_validators.compress(body, coding, response.headers.get('ETag')))
+    response.headers['Content-Encoding'] = coding
+
+# Admission control for the LLM-bound endpoints, shared by all worker processes through
+# small memory-mapped tables: token buckets per signed-in user and per client IP (429 when
+# empty), then a global cap on requests in flight with a bounded wait queue (503 when full
+# or after the queue timeout). Set MINDFULBITE_ADMISSION_CONTROL=0 for load tests.
+LLM_ENDPOINTS = {'food_search', 'find_alternatives', 'find_alternatives_stream', 'meal_analysis', 'test_alternatives'}
+admission = AdmissionController(
+    os.environ.get('MINDFULBITE_ADMISSION_DIR', '.mindfulbite-admission'),
+    user_rate=float(os.environ.get('MINDFULBITE_USER_RATE_LIMIT', 2)),  # requests per second, 0 disables
+    user_burst=float(os.environ.get('MINDFULBITE_USER_RATE_BURST', 30)),
+    ip_rate=float(os.environ.get('MINDFULBITE_IP_RATE_LIMIT', 5)),  # requests per second, 0 disables
+    ip_burst=float(os.environ.get('MINDFULBITE_IP_RATE_BURST', 60)),
+    max_in_flight=int(os.environ.get('MINDFULBITE_MAX_IN_FLIGHT', 128)),  # 0 disables
+    max_queue=int(os.environ.get('MINDFULBITE_ADMISSION_QUEUE', 256)),
+    queue_timeout=float(os.environ.get('MINDFULBITE_ADMISSION_QUEUE_TIMEOUT', 5)),  # seconds
+    enabled=os.environ.get('MINDFULBITE_ADMISSION_CONTROL', '1') == '1'
+)
+
+# Personalized ranking of alternatives, cached per food and daily calorie bucket
+comparison_engine = ComparisonEngine(max_entries=int(os.environ.get('MINDFULBITE_COMPARISON_CACHE_ENTRIES', 5000)))
+
+# Local food catalog: a search is answered from the catalog only when a match has exactly
+# the query's words ("apple" must not be answered with "Apple Pie")
+CATALOG_CANDIDATES = 5
+MAX_PAGE_SIZE = 50
+
+# Typo-tolerant resolution of queries to known catalog names: each word may carry a typo,
+# but a different word never matches
+food_name_index = TrigramIndex(threshold=float(os.environ.get('MINDFULBITE_FUZZY_MATCH_THRESHOLD', 0.8)))
+FOOD_NAME_INDEX_REFRESH_SECONDS = 30  # picks up names added by other worker processes
+_food_name_index_state = {'last_id': 0, 'refreshed_at': 0.0}
+_food_name_index_lock = threading.Lock()
+
+MAX_MEAL_ITEMS = 12  # items accepted by /api/meal_analysis (all misses share one prompt)
+# Items a batched answer still misses after one batched retry are looked up concurrently
+meal_lookup_executor = ThreadPoolExecutor(max_workers=MAX_MEAL_ITEMS, thread_name_prefix='meal-lookup')
+
 # Helper function to get current user
 def get_current_user():
-    """Get current user from session token"""
+    """Get current user from session token (looked up once per request and kept in g)"""
     if not DB_AVAILABLE:
         return None
-    session_token = request.cookies.get('session_token')
-    if session_token:
-        return get_user_from_session(session_token)
+    if 'current_user' not in g:
+        user = None
+        session_token = request.cookies.get('session_token')
+        if session_token:
+            with tracing.span('get_current_user'):
+                user = get_user_from_session(session_token)
+        g.current_user = user
+    return g.current_user
+
+def admission_rejected(rejection):
+    """
+    429/503 response for a request turned away by admission control
+    """
+    response = jsonify({'error': rejection.message})
+    response.status_code = rejection.status
+    response.headers['Retry-After'] = str(rejection.retry_after)
+    return response
+
+@app.before_request
+def admit_llm_request():
+    if request.endpoint not in LLM_ENDPOINTS or not admission.enabled:
+        return None
+    user = get_current_user()
+    rejection = admission.check_rate(user['id'] if user else None, request.remote_addr)
+    if rejection is None:
+        with tracing.span('admission'):
+            rejection = admission.acquire()
+    if rejection is not None:
+        logger.warning(f"Rejected {request.path} ({rejection.reason}) for {request.remote_addr}")
+        return admission_rejected(rejection)
+    g.admission_slot = True
     return None
 
+@app.after_request
+def hand_off_admission_slot(response):
+    # Streamed responses keep their slot until the body has been sent
+    if g.pop('admission_slot', False):
+        response.call_on_close(admission.release)
+    return response
+
+@app.teardown_request
+def release_admission_slot(exc):
+    # Only still set when after_request did not run
+    if g.pop('admission_slot', False):
+        admission.release()
+
 # Login page
 @app.route('/login')
 def login_page():
@@ -84,6 +434,8 @@ def register():
         if result['success']:
             logger.info(f"New user registered: {username}")
             return jsonify({"success": True, "message": "Account created successfully! Please login."})
+        elif result.get('busy'):
+            return jsonify({"success": False, "error": result['error']}), 503, {'Retry-After': '1'}
         else:
             return jsonify({"success": False, "error": result['error']}), 400
         
@@ -112,7 +464,7 @@ def login():
             user = auth_result['user']
             
             # Create session
-            session_token = create_session(user['id'])
+            session_token = create_session(user['id'], user)
             
             if session_token:
                 # Create response with session cookie
@@ -136,6 +488,8 @@ def login():
                 return response
             else:
                 return jsonify({"success": False, "error": "Failed to create session"}), 500
+        elif auth_result.get('busy'):
+            return jsonify({"success": False, "error": auth_result['error']}), 503, {'Retry-After': '1'}
         else:
             return jsonify({"success": False, "error": auth_result['error']}), 401
         
@@ -304,29 +658,130 @@ def food_search():
     - Structured JSON with nutrition data and food details
     """
     query = request.args.get('query', '')
+    page = request.args.get('page', 1, type=int)
+    page_size = request.args.get('page_size', 10, type=int)
     
     if not query:
         return jsonify({'error': 'Query parameter is required'}), 400
     
+    food_popularity.record('food_search', query)
+    
+    if page < 1 or page_size < 1 or page_size > MAX_PAGE_SIZE:
+        return jsonify({'error': f'page must be >= 1 and page_size between 1 and {MAX_PAGE_SIZE}'}), 400
+    
     try:
-        # Get structured food data from LLM
-        food_data = get_food_nutrition_from_llm(query)
+        canonical_query = canonicalize_query(query)
         
-        if not food_data:
-            return jsonify({'error': 'Could not analyze this food item'}), 404
+        # Answer from the local catalog when the query resolves to a known name
+        # (typos included) or full-text search finds a confident match
+        match = find_local_match(query, canonical_query)
+        if match:
+            primary_key, food_data, match_score = match
+            source = 'catalog'
+        else:
+            # Get structured food data from LLM
+            food_data = get_food_nutrition_from_llm(query)
+            
+            if not food_data:
+                return jsonify({'error': 'Could not analyze this food item'}), 404
+            
+            primary_key = normalize_query(food_data.get('product_name', query))
+            match_score = None
+            source = 'llm'
         
-        # Return in expected format
-        return jsonify({
-            'products': [food_data],
-            'count': 1,
-            'page': 1,
-            'page_size': 1
-        })
+        # The frontend asks for alternatives next, so start generating them now
+        prefetch_alternatives(food_data)
+        
+        results = food_search_results(query, canonical_query, food_data, primary_key, source, match_score,
+                                      page, page_size)
+        with tracing.span('serialize'):
+            return jsonify(results)
         
     except Exception as e:
         logger.error(f"Food search error: {e}")
         return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
 
+def comparison_daily_calories(args, user_id):
+    """
+    Daily calories of the profile to compare for: from profile query parameters when
+    they are complete, else from the signed-in user's saved profile (None if unknown)
+    """
+    try:
+        bmi, daily_calories = profile_metrics(
+            float(args.get('weight') or 0), float(args.get('height') or 0), float(args.get('age') or 0),
+            args.get('gender'), args.get('activity')
+        )
+    except (TypeError, ValueError):
+        daily_calories = None
+    if daily_calories:
+        return daily_calories
+    
+    if DB_AVAILABLE and user_id is not None:
+        profile = get_user_profile(user_id)
+        if profile and profile.get('daily_calories'):
+            return profile['daily_calories']
+    return None
+
+def comparison_original(food_name, calories):
+    """
+    The original food to compare against: its catalog record when there is one, with
+    the calories the client sent taking precedence
+    """
+    original = (get_food(normalize_query(food_name)) if DB_AVAILABLE else None) or {}
+    original = dict(original, product_name=food_name, nutriments=dict(original.get('nutriments') or {}))
+    try:
+        if float(calories) > 0:
+            original['nutriments']['energy-kcal_100g'] = float(calories)
+    except (TypeError, ValueError):
+        pass
+    return original
+
+def rank_alternatives(food_name, calories, alternatives, rank_by, args, user_id):
+    """
+    Rank alternatives for the requester's profile; returns (ranked alternatives, comparison)
+    """
+    with tracing.span('rank', count=len(alternatives)):
+        return comparison_engine.rank(
+            comparison_original(food_name, calories), alternatives,
+            comparison_daily_calories(args, user_id), rank_by
+        )
+
+def find_local_match(query, canonical_query):
+    """
+    Match a search query against the local catalog, by trigram similarity first and
+    then full-text search; returns (name_key, food, match_score or None) or None
+    """
+    match = resolve_food_name(canonical_query)
+    if match:
+        return match
+    match = find_catalog_match(query)
+    if match:
+        return match[0], match[1], None
+    return None
+
+def food_search_results(query, canonical_query, food_data, primary_key, source, match_score, page, page_size):
+    """
+    Build a food search response page: the best match first, other catalog matches after it
+    """
+    products = [food_data] if page == 1 else []
+    others, total_others = [], 0
+    if DB_AVAILABLE:
+        offset = max(0, (page - 1) * page_size - 1)
+        limit = page_size - len(products)
+        others, total_others = search_foods(query, limit=limit, offset=offset, exclude_key=primary_key)
+    products.extend(food for name_key, food in others)
+    
+    return {
+        'products': products,
+        'count': total_others + 1,
+        'page': page,
+        'page_size': page_size,
+        'source': source,
+        'canonical_query': canonical_query,
+        'matched_name': primary_key if source == 'catalog' else None,
+        'match_score': match_score
+    }
+
 @app.route('/api/find_alternatives')
 def find_alternatives():
     """
@@ -336,30 +791,164 @@ def find_alternatives():
     - food_name: Original food name (required)
     - calories: Original food calories (optional)
     - category: Food category (optional)
+    - rank_by: Ranking preset (optional, default 'balanced')
+    - weight, height, age, gender, activity: Profile for personalized metrics (optional,
+      the signed-in user's saved profile is used otherwise)
     
     Returns:
-    - List of healthier alternatives with nutrition data
+    - Healthier alternatives with nutrition data, best ranked first, and their
+      comparison metrics against the original food
     """
     food_name = request.args.get('food_name', '')
     calories = request.args.get('calories', 0)
     category = request.args.get('category', '')
+    rank_by = request.args.get('rank_by', DEFAULT_RANKING)
     
     if not food_name:
         return jsonify({'error': 'food_name parameter is required'}), 400
     
+    if rank_by not in RANKING_PRESETS:
+        return jsonify({'error': f'rank_by must be one of {", ".join(sorted(RANKING_PRESETS))}'}), 400
+    
+    food_popularity.record('alternatives', food_name)
+    
     try:
-        # Get alternative suggestions from LLM
-        alternatives = get_healthier_alternatives_from_llm(food_name, calories, category)
+        # Attach to the prefetch started by food_search, or ask the LLM directly
+        alternatives = claim_prefetched_alternatives(food_name, calories, category)
+        if alternatives is None:
+            alternatives = get_healthier_alternatives_from_llm(food_name, calories, category)
         
-        return jsonify({
-            'alternatives': alternatives,
-            'count': len(alternatives)
-        })
+        user = get_current_user()
+        alternatives, comparison = rank_alternatives(food_name, calories, alternatives, rank_by, request.args,
+                                                     user['id'] if user else None)
+        
+        with tracing.span('serialize'):
+            return jsonify({
+                'alternatives': alternatives,
+                'count': len(alternatives),
+                'comparison': comparison
+            })
         
     except Exception as e:
         logger.error(f"Alternative search error: {e}")
         return jsonify({'error': f'Alternative search failed: {str(e)}'}), 500
 
+@app.route('/api/meal_analysis', methods=['POST'])
+def meal_analysis():
+    """
+    Nutrition analysis for a whole meal, with all cache misses sent in one batched LLM call
+    
+    JSON Body:
+    - items: list of food names, or objects with "name" and optional "grams" (default 100)
+    
+    Returns:
+    - Per-item nutrition data and meal totals scaled by portion size
+    """
+    data = request.get_json(silent=True) or {}
+    raw_items = data.get('items')
+    
+    if not isinstance(raw_items, list) or not raw_items:
+        return jsonify({'error': 'items must be a non-empty list'}), 400
+    
+    if len(raw_items) > MAX_MEAL_ITEMS:
+        return jsonify({'error': f'At most {MAX_MEAL_ITEMS} items per meal'}), 400
+    
+    items = []
+    try:
+        for raw in raw_items:
+            if isinstance(raw, dict):
+                name = str(raw.get('name', '')).strip()
+                grams = float(raw.get('grams', 100))
+            else:
+                name = str(raw).strip()
+                grams = 100.0
+            if not name or not math.isfinite(grams) or grams <= 0:
+                return jsonify({'error': 'Each item needs a name and a positive grams value'}), 400
+            items.append((name, grams))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid grams value'}), 400
+    
+    try:
+        results = get_meal_nutrition([name for name, grams in items])
+        
+        meal_items = []
+        totals = {}
+        for name, grams in items:
+            food_data, source = results.get(name, (None, 'llm'))
+            meal_items.append({
+                'query': name,
+                'grams': grams,
+                'source': source,
+                'product': food_data
+            })
+            if not food_data:
+                continue
+            for nutrient, value in (food_data.get('nutriments') or {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[nutrient] = totals.get(nutrient, 0) + value * grams / 100
+        
+        return jsonify({
+            'items': meal_items,
+            'count': len(meal_items),
+            'analyzed': sum(1 for item in meal_items if item['product']),
+            'total_grams': sum(grams for name, grams in items),
+            'totals': {nutrient: round(value, 4) for nutrient, value in totals.items()}
+        })
+        
+    except Exception as e:
+        logger.error(f"Meal analysis error: {e}")
+        return jsonify({'error': f'Meal analysis failed: {str(e)}'}), 500
+
+@app.route('/api/find_alternatives/stream')
+def find_alternatives_stream():
+    """
+    Stream healthier alternative suggestions as Server-Sent Events
+    
+    Query Parameters:
+    - food_name: Original food name (required)
+    - calories: Original food calories (optional)
+    - category: Food category (optional)
+    
+    Returns:
+    - text/event-stream with one 'alternative' event per validated alternative,
+      followed by a 'done' event carrying the total count
+    """
+    food_name = request.args.get('food_name', '')
+    calories = request.args.get('calories', 0, type=float)
+    category = request.args.get('category', '')
+    
+    if not food_name:
+        return jsonify({'error': 'food_name parameter is required'}), 400
+    
+    food_popularity.record('alternatives', food_name)
+    
+    # A stored or finished prefetched result is already complete, so it is sent in one
+    # burst. A prefetch that is still running is left unclaimed: the stream below joins
+    # its LLM call through alternatives_flight instead of starting a second one.
+    prefetched = alternatives_graph.get(food_name, calories, category)
+    if prefetched is None:
+        prefetched = claim_prefetched_alternatives(food_name, calories, category, finished_only=True)
+    
+    def generate():
+        count = 0
+        if prefetched is not None:
+            alternatives = prefetched
+        else:
+            # Identical concurrent requests (streamed or not) share this LLM call
+            alternatives = alternatives_flight.stream(
+                alternatives_flight_key(food_name, calories, category),
+                lambda: stream_healthier_alternatives_from_llm(food_name, calories, category)
+            )
+        for alt in alternatives:
+            count += 1
+            yield f"event: alternative\ndata: {json.dumps(alt)}\n\n"
+        yield f"event: done\ndata: {json.dumps({'count': count})}\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop reverse proxies from buffering the stream
+    })
+
 @app.route('/api/test_alternatives')
 def test_alternatives():
     """
@@ -392,22 +981,218 @@ def test_alternatives():
             }
         }), 500
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus metrics, aggregated over all worker processes in multiprocess mode"""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route('/api/ready')
+def readiness():
+    """Readiness probe: 200 once the startup warm-up has covered enough popular foods"""
+    status = cache_warmer.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/api/cache_stats')
+def cache_stats():
+    """Report LLM cache, coalescing and model routing counters for this worker process"""
+    return jsonify({
+        'nutrition': nutrition_cache.stats(),
+        'inflight': [nutrition_flight.stats(), alternatives_flight.stats()],
+        'prefetch': alternatives_prefetcher.stats(),
+        'alternatives_graph': alternatives_graph.stats(),
+        'popularity': food_popularity.stats(),
+        'warmup': cache_warmer.status(),
+        'admission': admission.stats(),
+        'comparison': comparison_engine.stats(),
+        'http': http_validators.stats(),
+        'routing': [router.stats() for router in LLM_ROUTERS]
+    })
+
 def get_food_nutrition_from_llm(food_query):
+    """
+    Get comprehensive nutrition data for a food item, served from cache when possible
+    """
+    cached = nutrition_cache.get(food_query)
+    if cached is not None:
+        logger.info(f"Nutrition cache hit for: {food_query}")
+        return cached
+    
+    def fetch():
+        # Another caller may have filled the cache while we waited for the flight
+        cached = nutrition_cache.get(food_query)
+        if cached is not None:
+            return cached
+        food_data = _fetch_food_nutrition_from_llm(food_query)
+        if food_data:
+            store_food_nutrition(food_query, food_data)
+        return food_data
+    
+    return nutrition_flight.do(normalize_query(food_query), fetch)
+
+def store_food_nutrition(food_query, food_data):
+    """
+    Cache a nutrition result and write it through to the catalog
+    """
+    nutrition_cache.set(food_data, food_query)
+    add_to_catalog(food_data, 'nutrition')
+
+def _fetch_food_nutrition_from_llm(food_query):
     """
     Get comprehensive nutrition data for a food item using LLM
     """
     try:
-        prompt = f"""
-        Analyze the food item: "{food_query}"
+        response = nutrition_router.create(
+            messages=build_nutrition_messages(food_query),
+            temperature=0.3,
+            max_tokens=800
+        )
+    except Exception as e:
+        logger.error(f"LLM nutrition analysis error: {e}")
+        return None
+    return parse_nutrition_response(response)
+
+def parse_nutrition_response(response):
+    """
+    Parse a nutrition completion into food data, or None when it is not valid JSON
+    """
+    try:
+        with tracing.span('parse', task='nutrition'):
+            response_text = response.choices[0].message.content.strip()
+            log_payload(logger, "LLM nutrition response", response_text)
+            
+            # Clean the response (remove any markdown formatting)
+            if response_text.startswith('```json'):
+                response_text = response_text.replace('```json', '').replace('```', '').strip()
+            
+            food_data = json.loads(response_text)
+        return food_data
         
-        Provide comprehensive nutrition data in JSON format with this exact structure:
-        {{
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON parsing error: {e}")
+        metrics.llm_json_parse_failures.labels('nutrition').inc()
+        return None
+    except Exception as e:
+        logger.error(f"LLM nutrition analysis error: {e}")
+        return None
+
+def get_healthier_alternatives_from_llm(food_name, original_calories, category):
+    """
+    Get healthier alternative suggestions from the alternatives graph, generating them on a miss
+    """
+    stored = alternatives_graph.get(food_name, original_calories, category)
+    if stored is not None:
+        logger.info(f"Alternatives graph hit for: {food_name}")
+        return stored
+    return generate_healthier_alternatives(food_name, original_calories, category)
+
+def generate_healthier_alternatives(food_name, original_calories, category):
+    """
+    Generate alternatives with the LLM and store them in the graph, sharing one LLM call
+    between identical concurrent requests
+    """
+    flight_key = alternatives_flight_key(food_name, original_calories, category)
+    def fetch():
+        alternatives = _fetch_healthier_alternatives_from_llm(food_name, original_calories, category)
+        store_generated_alternatives(food_name, original_calories, category, alternatives)
+        return alternatives
+    
+    return alternatives_flight.do(flight_key, fetch)
+
+def alternatives_flight_key(food_name, original_calories, category):
+    """
+    Key under which identical concurrent alternatives generations share one LLM call,
+    normalized like alternatives_request_key so 300.0 and "300" calories share it too
+    """
+    return json.dumps(list(alternatives_request_key(food_name, original_calories, category)))
+
+def store_generated_alternatives(food_name, original_calories, category, alternatives):
+    """
+    Catalog LLM-generated alternatives and store them in the graph (fallbacks are skipped)
+    """
+    generated = [alt for alt in alternatives if not is_fallback_alternative(alt)]
+    for alt in generated:
+        add_to_catalog(alt, 'alternative')
+    alternatives_graph.store(food_name, original_calories, category, generated)
+
+def _fetch_healthier_alternatives_from_llm(food_name, original_calories, category):
+    """
+    Get healthier alternative suggestions using LLM
+    """
+    try:
+        logger.info(f"Finding alternatives for: {food_name}, calories: {original_calories}, category: {category}")
+        logger.info(f"Sending prompt to OpenRouter...")
+        
+        response = alternatives_router.create(
+            messages=build_alternatives_messages(food_name, original_calories, category),
+            temperature=0.4,
+            max_tokens=2000
+        )
+    except Exception as e:
+        logger.error(f"LLM alternative analysis error: {e}")
+        return create_fallback_alternatives(food_name, original_calories, category)
+    return parse_alternatives_response(response, food_name, original_calories, category)
+
+def parse_alternatives_response(response, food_name, original_calories, category):
+    """
+    Parse an alternatives completion into the valid alternatives, falling back to
+    generic suggestions when it is not valid JSON
+    """
+    try:
+        # Parse the LLM response
+        with tracing.span('parse', task='alternatives'):
+            response_text = response.choices[0].message.content.strip()
+            log_payload(logger, "Raw LLM alternatives response", response_text)
+            
+            # Clean the response (remove any markdown formatting)
+            if response_text.startswith('```json'):
+                response_text = response_text.replace('```json', '').replace('```', '').strip()
+            elif response_text.startswith('```'):
+                response_text = response_text.replace('```', '').strip()
+            
+            # Try to parse JSON
+            alternatives = json.loads(response_text)
+        
+        # Validate the response
+        if not isinstance(alternatives, list):
+            logger.error(f"Expected list, got {type(alternatives)}")
+            return []
+        
+        if len(alternatives) == 0:
+            logger.warning(f"LLM returned empty alternatives list")
+            return []
+        
+        # Validate each alternative has required fields
+        valid_alternatives = []
+        for alt in alternatives:
+            if is_valid_alternative(alt):
+                valid_alternatives.append(alt)
+            else:
+                log_payload(logger, "Skipping invalid alternative", alt, logging.WARNING)
+        
+        logger.info(f"Successfully parsed {len(valid_alternatives)} valid alternatives")
+        return valid_alternatives
+        
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON parsing error for alternatives: {e}")
+        metrics.llm_json_parse_failures.labels('alternatives').inc()
+        logger.error(f"Raw response was: {response_text if 'response_text' in locals() else 'No response'}")
+        
+        # Return a fallback alternative if JSON parsing fails
+        return create_fallback_alternatives(food_name, original_calories, category)
+        
+    except Exception as e:
+        logger.error(f"LLM alternative analysis error: {e}")
+        return create_fallback_alternatives(food_name, original_calories, category)
+
+# JSON structure the nutrition prompts ask for (one object per food item)
+NUTRITION_JSON_SCHEMA = """{
             "product_name": "Full product name",
             "brands": "Brand name if applicable",
             "categories": "Food category (e.g., 'Snacks', 'Beverages', 'Frozen Foods')",
             "nutriscore_grade": "A, B, C, D, or E (healthiness rating)",
             "code": "unique_identifier_for_this_product",
-            "nutriments": {{
+            "nutriments": {
                 "energy-kcal_100g": calories_per_100g,
                 "proteins_100g": protein_grams_per_100g,
                 "carbohydrates_100g": carbs_grams_per_100g,
@@ -420,9 +1205,21 @@ def get_food_nutrition_from_llm(food_query):
                 "vitamin-c_100g": vitamin_c_grams_per_100g,
                 "potassium_100g": potassium_grams_per_100g,
                 "vitamin-a_100g": vitamin_a_grams_per_100g
-            }},
+            },
             "ingredients_text": "Detailed ingredient list if known, or 'Ingredient information not available'"
-        }}
+        }"""
+
+NUTRITION_SYSTEM_MESSAGE = "You are a nutrition expert. Provide accurate food nutrition data in the exact JSON format requested. Return only valid JSON with no additional text."
+
+def build_nutrition_messages(food_query):
+    """
+    Build the chat messages asking the LLM for one food item's nutrition data
+    """
+    prompt = f"""
+        Analyze the food item: "{food_query}"
+        
+        Provide comprehensive nutrition data in JSON format with this exact structure:
+        {NUTRITION_JSON_SCHEMA}
         
         Requirements:
         - Use realistic nutrition values based on typical foods
@@ -431,43 +1228,223 @@ def get_food_nutrition_from_llm(food_query):
         - If exact data unknown, provide reasonable estimates
         - No explanatory text, just the JSON object
         """
+    
+    return [
+        {"role": "system", "content": NUTRITION_SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ]
+
+def build_meal_nutrition_messages(food_queries):
+    """
+    Build the chat messages asking the LLM for several food items' nutrition data in one call
+    """
+    item_list = '\n'.join(f'        {i + 1}. "{query}"' for i, query in enumerate(food_queries))
+    prompt = f"""
+        Analyze each of these {len(food_queries)} food items:
+{item_list}
+        
+        Return ONLY a JSON array with exactly {len(food_queries)} objects, in the same order as the list.
+        Each object must have this exact structure, plus a "query" field repeating the item text exactly as listed:
+        {NUTRITION_JSON_SCHEMA}
+        
+        Requirements:
+        - Use realistic nutrition values based on typical foods
+        - Nutri-Score: A (healthiest) to E (least healthy)
+        - All nutrient values per 100g
+        - If exact data unknown, provide reasonable estimates
+        - No explanatory text, just the JSON array
+        """
+    
+    return [
+        {"role": "system", "content": NUTRITION_SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ]
+
+def strip_markdown_fences(response_text):
+    """
+    Remove ```json / ``` fences the LLM sometimes wraps around JSON
+    """
+    response_text = response_text.strip()
+    if response_text.startswith('```json'):
+        return response_text.replace('```json', '').replace('```', '').strip()
+    if response_text.startswith('```'):
+        return response_text.replace('```', '').strip()
+    return response_text
+
+def get_meal_nutrition(food_queries):
+    """
+    Get nutrition data for several food items, answering cached ones locally and
+    sending all misses to the LLM in a single batched prompt. Items the answer
+    leaves out are retried once as a smaller batch; any still missing after that
+    are looked up concurrently.
+    
+    Returns a dict mapping each query to (food_data or None, source).
+    """
+    results = {}
+    misses = {}  # normalized query -> queries spelled that way
+    for query in food_queries:
+        cached = nutrition_cache.get(query)
+        if cached is not None:
+            results[query] = (cached, 'cache')
+        else:
+            misses.setdefault(normalize_query(query), []).append(query)
+    
+    if not misses:
+        return results
+    
+    pending = [spellings[0] for spellings in misses.values()]
+    found = {}
+    if len(pending) > 1:
+        found = _fetch_meal_nutrition_from_llm(pending)
+        pending = [query for query in pending if query not in found]
+        if len(pending) > 1:
+            retried = _fetch_meal_nutrition_from_llm(pending)
+            found.update(retried)
+            pending = [query for query in pending if query not in retried]
+    
+    for query, food_data in found.items():
+        store_food_nutrition(query, food_data)
+        for spelling in misses[normalize_query(query)]:
+            results[spelling] = (food_data, 'llm_batch')
+    
+    # A single item, or what the batches did not cover
+    lookups = {
+        query: meal_lookup_executor.submit(contextvars.copy_context().run, get_food_nutrition_from_llm, query)
+        for query in pending
+    }
+    for query, future in lookups.items():
+        food_data = future.result()
+        for spelling in misses[normalize_query(query)]:
+            results[spelling] = (food_data, 'llm')
+    
+    return results
+
+def _fetch_meal_nutrition_from_llm(food_queries):
+    """
+    Get nutrition data for several food items with one LLM call; returns {query: food_data}
+    """
+    try:
+        logger.info(f"Batched nutrition lookup for {len(food_queries)} items")
         
-        response = client.chat.completions.create(
-            model="openai/gpt-4.1",  # Using Claude through OpenRouter
-            messages=[
-                {"role": "system", "content": "You are a nutrition expert. Provide accurate food nutrition data in the exact JSON format requested. Return only valid JSON with no additional text."},
-                {"role": "user", "content": prompt}
-            ],
+        response = meal_nutrition_router.create(
+            messages=build_meal_nutrition_messages(food_queries),
             temperature=0.3,
-            max_tokens=800
+            max_tokens=min(700 * len(food_queries), 8000)
         )
         
-        # Parse the LLM response
-        response_text = response.choices[0].message.content.strip()
-        logger.info(f"LLM nutrition response: {response_text}")
+        with tracing.span('parse', task='meal_nutrition'):
+            response_text = strip_markdown_fences(response.choices[0].message.content)
+            items = json.loads(response_text)
         
-        # Clean the response (remove any markdown formatting)
-        if response_text.startswith('```json'):
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
+        if not isinstance(items, list):
+            logger.error(f"Expected list for meal analysis, got {type(items)}")
+            return {}
         
-        food_data = json.loads(response_text)
-        return food_data
+        # Match results by the echoed query, falling back to position
+        by_query = {normalize_query(query): query for query in food_queries}
+        results = {}
+        for index, item in enumerate(items):
+            if not is_valid_nutrition(item):
+                continue
+            query = by_query.get(normalize_query(item.pop('query', '')))
+            if query is None and index < len(food_queries) and len(items) == len(food_queries):
+                query = food_queries[index]
+            if query is not None and query not in results:
+                results[query] = item
+        
+        logger.info(f"Batched nutrition lookup returned {len(results)}/{len(food_queries)} items")
+        return results
         
     except json.JSONDecodeError as e:
-        logger.error(f"JSON parsing error: {e}")
+        logger.error(f"JSON parsing error for meal analysis: {e}")
+        metrics.llm_json_parse_failures.labels('meal_nutrition').inc()
+        return {}
+    except Exception as e:
+        logger.error(f"LLM meal analysis error: {e}")
+        return {}
+
+def frontend_calories(food):
+    """
+    Calories per 100g formatted the way getCalories() in script.js sends them back
+    """
+    nutriments = food.get('nutriments') or {}
+    try:
+        value = float(nutriments.get('energy-kcal_100g') or nutriments.get('energy_100g') or 0)
+    except (TypeError, ValueError):
+        value = 0
+    if value < 0.1:
+        value = 0
+    elif value < 1:
+        value = round(value, 1)
+    else:
+        value = round(value, 2)
+    return f"{value:g}"
+
+def alternatives_request_key(food_name, calories, category):
+    """
+    Key identifying an alternatives request by its normalized arguments
+    """
+    try:
+        calories = f"{float(calories):g}"
+    except (TypeError, ValueError):
+        calories = normalize_query(calories)
+    return (normalize_query(food_name), calories, normalize_query(category or ''))
+
+def prefetch_alternatives(food_data):
+    """
+    Start generating alternatives for a food in the background
+    """
+    food_name = food_data.get('product_name')
+    if not food_name:
+        return False
+    calories = frontend_calories(food_data)
+    category = food_data.get('categories') or ''
+    key = alternatives_request_key(food_name, calories, category)
+    return alternatives_prefetcher.submit(key, food_name, calories, category)
+
+def claim_prefetched_alternatives(food_name, calories, category, finished_only=False):
+    """
+    Get the prefetched alternatives for these arguments, or None if there is no usable
+    prefetch or it is still running after PREFETCH_CLAIM_TIMEOUT seconds. With
+    finished_only a prefetch that is still running is not waited for or claimed.
+    """
+    key = alternatives_request_key(food_name, calories, category)
+    future = alternatives_prefetcher.claim(key, finished_only=finished_only)
+    if future is None:
         return None
+    try:
+        alternatives = future.result(timeout=PREFETCH_CLAIM_TIMEOUT)
+        logger.info(f"Using prefetched alternatives for: {food_name}")
+        return alternatives
     except Exception as e:
-        logger.error(f"LLM nutrition analysis error: {e}")
+        logger.warning(f"Prefetched alternatives unavailable for {food_name}: {e}")
         return None
 
-def get_healthier_alternatives_from_llm(food_name, original_calories, category):
+def warm_food(query):
     """
-    Get healthier alternative suggestions using LLM
+    Fill the nutrition cache and the alternatives graph for a popular query
     """
-    try:
-        logger.info(f"Finding alternatives for: {food_name}, calories: {original_calories}, category: {category}")
-        
-        prompt = f"""
+    food_data = get_food_nutrition_from_llm(query)
+    if food_data and food_data.get('product_name'):
+        get_healthier_alternatives_from_llm(
+            food_data['product_name'], frontend_calories(food_data), food_data.get('categories') or ''
+        )
+
+def is_food_warm(query):
+    """
+    Check whether a query's nutrition and alternatives would be served without an LLM call
+    (without touching cache metrics or scheduling refreshes)
+    """
+    food_data = nutrition_cache.peek(query)
+    if not food_data or not food_data.get('product_name'):
+        return False
+    return alternatives_graph.has(food_data['product_name'])
+
+def build_alternatives_messages(food_name, original_calories, category):
+    """
+    Build the chat messages asking the LLM for healthier alternatives
+    """
+    prompt = f"""
         Find 4-5 healthier alternatives for: "{food_name}"
         Original food has {original_calories} calories per 100g
         Category: {category}
@@ -507,71 +1484,170 @@ def get_healthier_alternatives_from_llm(food_name, original_calories, category):
         
         IMPORTANT: Return ONLY the JSON array, no other text.
         """
+    
+    return [
+        {"role": "system", "content": "You are a nutrition expert. Return only valid JSON arrays for food alternatives. No explanations, just the JSON."},
+        {"role": "user", "content": prompt}
+    ]
+
+def is_valid_alternative(alt):
+    """
+    Check that an alternative has the fields the frontend needs
+    """
+    return (isinstance(alt, dict) and 
+            'product_name' in alt and 
+            isinstance(alt.get('nutriments'), dict) and
+            'energy-kcal_100g' in alt['nutriments'])
+
+def is_valid_nutrition(food):
+    """
+    Check that a batched nutrition answer names the product and gives its energy
+    """
+    if not isinstance(food, dict) or not isinstance(food.get('nutriments'), dict):
+        return False
+    energy = food['nutriments'].get('energy-kcal_100g')
+    return (bool(str(food.get('product_name') or '').strip()) and
+            isinstance(energy, (int, float)) and not isinstance(energy, bool) and math.isfinite(energy))
+
+def is_fallback_alternative(alt):
+    """
+    Check whether an alternative came from create_fallback_alternatives rather than the LLM
+    """
+    return str(alt.get('code', '')).startswith('fallback_')
+
+def add_to_catalog(food, source):
+    """
+    Write a successful LLM result through to the local food catalog
+    """
+    if not DB_AVAILABLE or not isinstance(food, dict) or not food.get('product_name'):
+        return False
+    name_key = normalize_query(food['product_name'])
+    if not upsert_food(name_key, food, source):
+        return False
+    # Suggested alternatives are stored for lookups and listings, but never answer a search
+    if source != 'alternative':
+        food_name_index.add(name_key)
+    return True
+
+def refresh_food_name_index(force=False):
+    """
+    Load catalog names added since the last refresh into the trigram index
+    """
+    if not DB_AVAILABLE:
+        return 0
+    
+    state = _food_name_index_state
+    if not force and time.monotonic() - state['refreshed_at'] < FOOD_NAME_INDEX_REFRESH_SECONDS:
+        return 0
+    
+    # Only one thread refreshes; the others keep using the current index
+    if not _food_name_index_lock.acquire(blocking=force):
+        return 0
+    try:
+        state['refreshed_at'] = time.monotonic()
+        added = 0
+        while True:
+            names = get_food_names_since(state['last_id'])
+            if not names:
+                break
+            for food_id, name_key in names:
+                food_name_index.add(name_key)
+            state['last_id'] = names[-1][0]
+            added += len(names)
+        return added
+    finally:
+        _food_name_index_lock.release()
+
+def resolve_food_name(canonical_query):
+    """
+    Resolve a canonical query to a catalog entry by trigram similarity;
+    returns (name_key, food, score) or None
+    """
+    if not DB_AVAILABLE or not canonical_query:
+        return None
+    
+    refresh_food_name_index()
+    match = food_name_index.lookup(canonical_query)
+    if not match:
+        return None
+    
+    name_key, score = match
+    food = get_food(name_key)
+    if food is None:
+        return None
+    return name_key, food, score
+
+def find_catalog_match(query):
+    """
+    Find a catalog entry whose name has exactly the query's words, in any order;
+    returns (name_key, food) or None
+    """
+    if not DB_AVAILABLE:
+        return None
+    
+    query_words = set(re.findall(r'\w+', query.lower()))
+    if not query_words:
+        return None
+    
+    candidates, total = search_foods(query, limit=CATALOG_CANDIDATES, include_alternatives=False)
+    for name_key, food in candidates:
+        name_words = set(re.findall(r'\w+', name_key))
+        if name_words == query_words:
+            return name_key, food
+    return None
+
+def stream_healthier_alternatives_from_llm(food_name, original_calories, category):
+    """
+    Stream healthier alternatives from the LLM, yielding each valid one as soon as it is complete
+    """
+    streamed = []
+    try:
+        logger.info(f"Streaming alternatives for: {food_name}, calories: {original_calories}, category: {category}")
         
-        logger.info(f"Sending prompt to OpenRouter...")
-        
-        response = client.chat.completions.create(
-            model="openai/gpt-4.1",  # Using same model as nutrition function
-            messages=[
-                {"role": "system", "content": "You are a nutrition expert. Return only valid JSON arrays for food alternatives. No explanations, just the JSON."},
-                {"role": "user", "content": prompt}
-            ],
+        stream = alternatives_stream_router.create(
+            messages=build_alternatives_messages(food_name, original_calories, category),
             temperature=0.4,
-            max_tokens=2000
+            max_tokens=2000,
+            stream=True
         )
         
-        # Parse the LLM response
-        response_text = response.choices[0].message.content.strip()
-        logger.info(f"Raw LLM alternatives response: {response_text[:200]}...")
-        
-        # Clean the response (remove any markdown formatting)
-        if response_text.startswith('```json'):
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
-        elif response_text.startswith('```'):
-            response_text = response_text.replace('```', '').strip()
-        
-        # Try to parse JSON
-        alternatives = json.loads(response_text)
-        
-        # Validate the response
-        if not isinstance(alternatives, list):
-            logger.error(f"Expected list, got {type(alternatives)}")
-            return []
-        
-        if len(alternatives) == 0:
-            logger.warning(f"LLM returned empty alternatives list")
-            return []
-        
-        # Validate each alternative has required fields
-        valid_alternatives = []
-        for alt in alternatives:
-            if (isinstance(alt, dict) and 
-                'product_name' in alt and 
-                'nutriments' in alt and
-                'energy-kcal_100g' in alt['nutriments']):
-                valid_alternatives.append(alt)
-            else:
-                logger.warning(f"Skipping invalid alternative: {alt}")
-        
-        logger.info(f"Successfully parsed {len(valid_alternatives)} valid alternatives")
-        return valid_alternatives
-        
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON parsing error for alternatives: {e}")
-        logger.error(f"Raw response was: {response_text if 'response_text' in locals() else 'No response'}")
+        parser = JSONArrayStreamParser()
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if not text:
+                continue
+            
+            for alt in parser.feed(text):
+                if is_valid_alternative(alt):
+                    streamed.append(alt)
+                    add_to_catalog(alt, 'alternative')
+                    yield alt
+                else:
+                    log_payload(logger, "Skipping invalid alternative", alt, logging.WARNING)
+            
+            if parser.finished:
+                break
         
-        # Return a fallback alternative if JSON parsing fails
-        return create_fallback_alternatives(food_name, original_calories, category)
+        if parser.finished:
+            alternatives_graph.store(food_name, original_calories, category, streamed)
+        else:
+            metrics.llm_json_parse_failures.labels('alternatives_stream').inc()
+        logger.info(f"Streamed {len(streamed)} valid alternatives")
         
     except Exception as e:
-        logger.error(f"LLM alternative analysis error: {e}")
-        return create_fallback_alternatives(food_name, original_calories, category)
+        logger.error(f"LLM alternative streaming error: {e}")
+    
+    if not streamed:
+        yield from create_fallback_alternatives(food_name, original_calories, category)
 
 def create_fallback_alternatives(food_name, original_calories, category):
     """
     Create fallback alternatives when LLM fails
     """
     logger.info(f"Creating fallback alternatives for {food_name}")
+    metrics.fallback_alternatives.inc()
     
     # Simple fallback based on food type
     fallback_alternatives = []
@@ -659,5 +1735,32 @@ def create_fallback_alternatives(food_name, original_calories, category):
     logger.info(f"Created {len(fallback_alternatives)} fallback alternatives")
     return fallback_alternatives
 
+@app.cli.command('recompute-profile-metrics')
+@click.option('--chunk-size', default=50000, show_default=True, help='Profiles loaded per batch')
+def recompute_profile_metrics_command(chunk_size):
+    """Recompute BMI and daily calories for all user profiles"""
+    started = time.perf_counter()
+    scanned, updated = recompute_profile_metrics(chunk_size=chunk_size)
+    click.echo(f"Recomputed {scanned} profiles ({updated} changed) in {time.perf_counter() - started:.2f}s")
+
+@app.cli.command('enable-incremental-vacuum')
+def enable_incremental_vacuum_command():
+    """Enable incremental auto-vacuum (one full VACUUM under an exclusive lock)"""
+    started = time.perf_counter()
+    if enable_incremental_vacuum():
+        click.echo(f"Incremental auto-vacuum enabled in {time.perf_counter() - started:.2f}s")
+    else:
+        click.echo("Incremental auto-vacuum was already enabled")
+
+@app.cli.command('invalidate-alternatives')
+@click.argument('food_names', nargs=-1)
+@click.option('--all', 'invalidate_all', is_flag=True, help='Forget every stored alternative set')
+def invalidate_alternatives_command(food_names, invalidate_all):
+    """Forget stored alternatives so they are regenerated on next request"""
+    if not food_names and not invalidate_all:
+        raise click.UsageError('Give one or more food names, or --all')
+    removed = alternatives_graph.invalidate(None if invalidate_all else list(food_names))
+    click.echo(f"Invalidated {removed} stored alternative sets")
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,400 @@
+"""
+ASGI entry point with an async path for the LLM-bound routes.
+
+/api/food_search, /api/find_alternatives and /api/test_alternatives are
+served as coroutines. They make LLM calls through one shared AsyncOpenAI
+client, whose connection pool is reused by every request. A request waiting
+on the LLM costs a task on the event loop rather than a worker thread, so one
+worker process can keep hundreds of LLM calls in flight. The blocking
+helpers (SQLite, the result caches) run on a thread pool. Every other path
+is handed to the Flask app unchanged.
+
+    OPENROUTER_BASE_URL=http://127.0.0.1:5055/api/v1 uvicorn asgi_app:app --port 5000
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from openai import AsyncOpenAI
+
+import metrics
+import tracing
+from app import (
+    app as flask_app, DB_AVAILABLE, OPENROUTER_BASE_URL, OPENROUTER_API_KEY, MAX_PAGE_SIZE, PREFETCH_CLAIM_TIMEOUT,
+    admission, nutrition_router, alternatives_router, nutrition_cache, alternatives_graph, alternatives_prefetcher,
+    food_popularity, build_nutrition_messages, build_alternatives_messages, parse_nutrition_response,
+    parse_alternatives_response, create_fallback_alternatives, store_food_nutrition,
+    store_generated_alternatives, alternatives_flight_key, alternatives_request_key, frontend_calories,
+    find_local_match, food_search_results, rank_alternatives, CACHE_POLICIES, http_validators, http_validator_key,
+    response_version, start_background_jobs
+)
+from comparison_engine import RANKING_PRESETS, DEFAULT_RANKING
+from database import get_user_from_session
+from http_cache import content_etag, etag_matches, choose_encoding, COMPRESS_MIN_BYTES
+from llm_cache import normalize_query
+from llm_router import AsyncModelRouter
+from prefetch import AsyncPrefetcher
+from query_normalizer import canonicalize_query
+from singleflight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+# One client, and so one HTTP connection pool, for every async LLM call in the process
+async_client = AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=OPENROUTER_API_KEY)
+
+# Same models, deadlines, hedging state and counters as the sync routers
+async_nutrition_router = AsyncModelRouter(nutrition_router, async_client)
+async_alternatives_router = AsyncModelRouter(alternatives_router, async_client)
+
+async_nutrition_flight = AsyncSingleFlight('nutrition')
+async_alternatives_flight = AsyncSingleFlight('alternatives')
+
+# food_search prefetches alternatives as a task on the loop, so the speculative call goes
+# through the async client and joins async_alternatives_flight like find_alternatives does
+async_alternatives_prefetcher = AsyncPrefetcher(
+    'alternatives',
+    lambda food_name, calories, category: get_healthier_alternatives_from_llm(food_name, calories, category),
+    max_pending=alternatives_prefetcher.max_pending,
+    claim_ttl=alternatives_prefetcher.claim_ttl,
+    enabled=alternatives_prefetcher.enabled
+)
+
+# Threads for the blocking helpers; they only wait on SQLite, never on the LLM
+BLOCKING_WORKERS = int(os.environ.get('MINDFULBITE_ASGI_BLOCKING_WORKERS', 32))
+_blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix='asgi-blocking')
+
+async def run_blocking(fn, *args):
+    """Run a blocking helper on the thread pool, keeping the request's trace context"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_blocking_executor, context.run, fn, *args)
+
+def _int_arg(args, name, default):
+    # Same leniency as request.args.get(name, default, type=int)
+    try:
+        return int(args[name])
+    except (KeyError, ValueError):
+        return default
+
+async def food_search(args, user_id):
+    """Async /api/food_search; see app.food_search"""
+    query = args.get('query', '')
+    page = _int_arg(args, 'page', 1)
+    page_size = _int_arg(args, 'page_size', 10)
+
+    if not query:
+        return 400, {'error': 'Query parameter is required'}
+
+    food_popularity.record('food_search', query)
+
+    if page < 1 or page_size < 1 or page_size > MAX_PAGE_SIZE:
+        return 400, {'error': f'page must be >= 1 and page_size between 1 and {MAX_PAGE_SIZE}'}
+
+    try:
+        canonical_query = canonicalize_query(query)
+
+        match = await run_blocking(find_local_match, query, canonical_query)
+        if match:
+            primary_key, food_data, match_score = match
+            source = 'catalog'
+        else:
+            food_data = await get_food_nutrition_from_llm(query)
+
+            if not food_data:
+                return 404, {'error': 'Could not analyze this food item'}
+
+            primary_key = normalize_query(food_data.get('product_name', query))
+            match_score = None
+            source = 'llm'
+
+        prefetch_alternatives(food_data)
+
+        return 200, await run_blocking(food_search_results, query, canonical_query, food_data, primary_key,
+                                       source, match_score, page, page_size)
+
+    except Exception as e:
+        logger.error(f"Food search error: {e}")
+        return 500, {'error': f'Analysis failed: {str(e)}'}
+
+async def find_alternatives(args, user_id):
+    """Async /api/find_alternatives; see app.find_alternatives"""
+    food_name = args.get('food_name', '')
+    calories = args.get('calories', 0)
+    category = args.get('category', '')
+    rank_by = args.get('rank_by', DEFAULT_RANKING)
+
+    if not food_name:
+        return 400, {'error': 'food_name parameter is required'}
+
+    if rank_by not in RANKING_PRESETS:
+        return 400, {'error': f'rank_by must be one of {", ".join(sorted(RANKING_PRESETS))}'}
+
+    food_popularity.record('alternatives', food_name)
+
+    try:
+        alternatives = await claim_prefetched_alternatives(food_name, calories, category)
+        if alternatives is None:
+            alternatives = await get_healthier_alternatives_from_llm(food_name, calories, category)
+
+        alternatives, comparison = await run_blocking(rank_alternatives, food_name, calories, alternatives,
+                                                      rank_by, args, user_id)
+
+        return 200, {
+            'alternatives': alternatives,
+            'count': len(alternatives),
+            'comparison': comparison
+        }
+
+    except Exception as e:
+        logger.error(f"Alternative search error: {e}")
+        return 500, {'error': f'Alternative search failed: {str(e)}'}
+
+async def test_alternatives(args, user_id):
+    """Async /api/test_alternatives; see app.test_alternatives"""
+    debug_info = {
+        'food_name': 'pizza',
+        'original_calories': 280,
+        'category': 'Frozen Foods'
+    }
+    try:
+        alternatives = await get_healthier_alternatives_from_llm("pizza", 280, "Frozen Foods")
+
+        return 200, {
+            'success': True,
+            'alternatives_count': len(alternatives),
+            'alternatives': alternatives,
+            'debug_info': debug_info
+        }
+
+    except Exception as e:
+        logger.error(f"Test alternatives error: {e}")
+        return 500, {
+            'success': False,
+            'error': str(e),
+            'debug_info': debug_info
+        }
+
+async def get_food_nutrition_from_llm(food_query):
+    """Nutrition data for a food item, from the cache or one shared LLM call"""
+    cached = await run_blocking(nutrition_cache.get, food_query)
+    if cached is not None:
+        logger.info(f"Nutrition cache hit for: {food_query}")
+        return cached
+
+    async def fetch():
+        cached = await run_blocking(nutrition_cache.get, food_query)
+        if cached is not None:
+            return cached
+        food_data = await _fetch_food_nutrition_from_llm(food_query)
+        if food_data:
+            await run_blocking(store_food_nutrition, food_query, food_data)
+        return food_data
+
+    return await async_nutrition_flight.do(normalize_query(food_query), fetch)
+
+async def _fetch_food_nutrition_from_llm(food_query):
+    try:
+        response = await async_nutrition_router.create(
+            messages=build_nutrition_messages(food_query),
+            temperature=0.3,
+            max_tokens=800
+        )
+    except Exception as e:
+        logger.error(f"LLM nutrition analysis error: {e}")
+        return None
+    return parse_nutrition_response(response)
+
+async def get_healthier_alternatives_from_llm(food_name, original_calories, category):
+    """Alternatives from the stored graph, generating them on a miss"""
+    stored = await run_blocking(alternatives_graph.get, food_name, original_calories, category)
+    if stored is not None:
+        logger.info(f"Alternatives graph hit for: {food_name}")
+        return stored
+
+    async def fetch():
+        alternatives = await _fetch_healthier_alternatives_from_llm(food_name, original_calories, category)
+        await run_blocking(store_generated_alternatives, food_name, original_calories, category, alternatives)
+        return alternatives
+
+    flight_key = alternatives_flight_key(food_name, original_calories, category)
+    return await async_alternatives_flight.do(flight_key, fetch)
+
+async def _fetch_healthier_alternatives_from_llm(food_name, original_calories, category):
+    try:
+        logger.info(f"Finding alternatives for: {food_name}, calories: {original_calories}, category: {category}")
+        response = await async_alternatives_router.create(
+            messages=build_alternatives_messages(food_name, original_calories, category),
+            temperature=0.4,
+            max_tokens=2000
+        )
+    except Exception as e:
+        logger.error(f"LLM alternative analysis error: {e}")
+        return create_fallback_alternatives(food_name, original_calories, category)
+    return parse_alternatives_response(response, food_name, original_calories, category)
+
+def prefetch_alternatives(food_data):
+    """Start generating alternatives for a food in the background; see app.prefetch_alternatives"""
+    food_name = food_data.get('product_name')
+    if not food_name:
+        return False
+    calories = frontend_calories(food_data)
+    category = food_data.get('categories') or ''
+    key = alternatives_request_key(food_name, calories, category)
+    return async_alternatives_prefetcher.submit(key, food_name, calories, category)
+
+async def claim_prefetched_alternatives(food_name, calories, category):
+    """Await the alternatives prefetched by food_search, or None if there is no usable prefetch"""
+    task = async_alternatives_prefetcher.claim(alternatives_request_key(food_name, calories, category))
+    if task is None:
+        return None
+    try:
+        alternatives = await asyncio.wait_for(task, PREFETCH_CLAIM_TIMEOUT)
+        logger.info(f"Using prefetched alternatives for: {food_name}")
+        return alternatives
+    except Exception as e:
+        logger.warning(f"Prefetched alternatives unavailable for {food_name}: {e}")
+        return None
+
+ASYNC_ROUTES = {
+    '/api/food_search': food_search,
+    '/api/find_alternatives': find_alternatives,
+    '/api/test_alternatives': test_alternatives
+}
+
+_wsgi_app = WsgiToAsgi(flask_app)
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD') and scope['path'] in ASYNC_ROUTES:
+        await _serve(ASYNC_ROUTES[scope['path']], scope, send)
+    else:
+        await _wsgi_app(scope, receive, send)
+
+async def _serve(view, scope, send):
+    # Mirrors the Flask request hooks: HTTP validators and compression, admission control,
+    # latency metric, trace and X-Request-ID header
+    started = time.perf_counter()
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    request_id = tracing.new_request_id(headers.get(tracing.REQUEST_ID_HEADER.lower()))
+    trace = tracing.start_trace(f"{scope['method']} {scope['path']}", request_id)
+
+    args = {}
+    for name, value in parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True):
+        args.setdefault(name, value)
+
+    policy = CACHE_POLICIES.get(view.__name__)
+    error = None
+    admitted = False
+    etag = None
+    extra_headers = []
+    try:
+        user_id = await _current_user_id(headers)
+        if policy is not None:
+            key = http_validator_key(view.__name__, args)
+            version = None
+            if headers.get('if-none-match'):
+                with tracing.span('validators'):
+                    version = await run_blocking(response_version, view.__name__, args, user_id)
+            etag = http_validators.precheck(key, version, headers.get('if-none-match'))
+
+        if etag is not None:
+            status, body = 304, b''
+        else:
+            rejection = await _admit(scope, user_id)
+            if rejection is not None:
+                status, payload = rejection.status, {'error': rejection.message}
+                extra_headers.append((b'retry-after', str(rejection.retry_after).encode('latin-1')))
+            else:
+                admitted = True
+                status, payload = await view(args, user_id)
+            with tracing.span('serialize'):
+                # Same encoding as jsonify() outside debug mode
+                body = (flask_app.json.dumps(payload, separators=(',', ':')) + '\n').encode('utf-8')
+
+            if policy is not None and status == 200:
+                etag = content_etag(body)
+                http_validators.remember(key, version, etag)
+                if etag_matches(headers.get('if-none-match'), etag):
+                    status, body = 304, b''
+    except Exception as e:
+        logger.error(f"Unhandled error in {scope['path']}: {e}")
+        error = e
+        status, body = 500, b'{"error":"Internal Server Error"}\n'
+
+    if status == 304:
+        http_validators.count_not_modified()
+        response_headers = []
+    else:
+        response_headers = [(b'content-type', b'application/json')]
+        coding = choose_encoding(headers.get('accept-encoding'))
+        if coding is not None and len(body) >= COMPRESS_MIN_BYTES:
+            with tracing.span('compress', encoding=coding):
+                body = http_validators.compress(body, coding, etag)
+            response_headers.append((b'content-encoding', coding.encode('latin-1')))
+        response_headers.append((b'content-length', str(len(body)).encode('latin-1')))
+    response_headers.append((b'vary', b'Accept-Encoding'))
+    if etag is not None and status in (200, 304):
+        response_headers += [(b'etag', etag.encode('latin-1')), (b'cache-control', policy.encode('latin-1'))]
+
+    metrics.http_request_duration.labels(scope['path'], scope['method'], str(status)).observe(
+        time.perf_counter() - started
+    )
+    trace.attrs.update(route=scope['path'], status=status)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': response_headers + [
+                (tracing.REQUEST_ID_HEADER.encode('latin-1'), request_id.encode('latin-1'))
+            ] + extra_headers
+        })
+        await send({'type': 'http.response.body', 'body': body if scope['method'] != 'HEAD' else b''})
+    finally:
+        if admitted:
+            admission.release()
+        tracing.finish_trace(trace, error=repr(error) if error else None)
+
+async def _current_user_id(headers):
+    """ID of the signed-in user from the session cookie, like app.get_current_user"""
+    if not DB_AVAILABLE:
+        return None
+    try:
+        morsel = SimpleCookie(headers.get('cookie', '')).get('session_token')
+    except CookieError:
+        return None
+    if morsel is None or not morsel.value:
+        return None
+    with tracing.span('get_current_user'):
+        user = await run_blocking(get_user_from_session, morsel.value)
+    return user['id'] if user else None
+
+async def _admit(scope, user_id):
+    """Same checks as app.admit_llm_request; returns a Rejection or None"""
+    if not admission.enabled:
+        return None
+    client_ip = scope['client'][0] if scope.get('client') else None
+    rejection = admission.check_rate(user_id, client_ip)
+    if rejection is None:
+        with tracing.span('admission'):
+            rejection = await admission.acquire_async()
+    if rejection is not None:
+        logger.warning(f"Rejected {scope['path']} ({rejection.reason}) for {client_ip}")
+    return rejection
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            start_background_jobs()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_client.close()
+            _blocking_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
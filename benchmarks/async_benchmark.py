@@ -0,0 +1,105 @@
+"""
+Sync vs async comparison for the LLM-bound routes.
+
+Keeps a fixed number of requests in flight (closed loop) against each target
+and reports throughput and p50/p95/p99 latency. Every request uses a food
+name no target has seen, so each one waits on the (mock) LLM; this measures
+how many slow upstream calls a single worker can keep going, not cache
+speed. Start one single-process server per target against the mock:
+
+    python benchmarks/mock_openrouter.py --port 5055 --latency-median-ms 1000 &
+    export OPENROUTER_BASE_URL=http://127.0.0.1:5055/api/v1 MINDFULBITE_ADMISSION_CONTROL=0
+    python app.py &
+    uvicorn asgi_app:app --port 5001 &
+    python benchmarks/async_benchmark.py --target sync=http://127.0.0.1:5000 \\
+        --target async=http://127.0.0.1:5001 --concurrency 200 --requests 1000
+
+The names are random letters rather than a food plus a counter: names that
+share words or most of their trigrams would be answered from the catalog
+(full-text or fuzzy match) after the first one, and one target's catalog
+could answer the other's queries when both servers share the mindfulbite.db
+in their working directory.
+"""
+import argparse
+import itertools
+import random
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from load_test import percentile
+
+ROUTES = {
+    'food_search': lambda name: ('/api/food_search', {'query': name}),
+    'find_alternatives': lambda name: ('/api/find_alternatives', {'food_name': name, 'calories': 300, 'category': 'Snacks'})
+}
+
+def random_food_name(words=2, letters=10):
+    """A name that shares no word and almost no trigram with any other"""
+    return ' '.join(''.join(random.choices(string.ascii_lowercase, k=letters)) for _ in range(words))
+
+def parse_target(text):
+    label, _, url = text.partition('=')
+    if not url:
+        raise argparse.ArgumentTypeError('targets look like label=http://host:port')
+    return label, url.rstrip('/')
+
+def run_target(base_url, route, concurrency, total, timeout):
+    """Issue total requests with concurrency in flight; returns (latencies, errors, wall seconds)"""
+    counter = itertools.count()
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def client():
+        nonlocal errors
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        while True:
+            i = next(counter)
+            if i >= total:
+                return
+            # A name no server has seen: always an LLM call
+            path, params = ROUTES[route](random_food_name())
+            started = time.perf_counter()
+            try:
+                response = local.session.get(base_url + path, params=params, timeout=timeout)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(client)
+    return latencies, errors, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', type=parse_target, action='append', required=True,
+                        help='label=base_url, repeat once per server to compare')
+    parser.add_argument('--route', choices=sorted(ROUTES), default='food_search')
+    parser.add_argument('--concurrency', type=int, default=200, help='requests kept in flight')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per target')
+    parser.add_argument('--timeout', type=float, default=120.0, help='per-request timeout in seconds')
+    args = parser.parse_args()
+
+    print(f"{'target':<12} {'ok':>6} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for label, base_url in args.target:
+        latencies, errors, wall = run_target(base_url, args.route, args.concurrency, args.requests, args.timeout)
+        p50, p95, p99 = (percentile(latencies, pct) * 1000 if latencies else 0 for pct in (50, 95, 99))
+        print(f"{label:<12} {len(latencies):>6} {errors:>7} {len(latencies) / wall:>8.1f} "
+              f"{p50:>9.1f} {p95:>9.1f} {p99:>9.1f}")
+
+if __name__ == '__main__':
+    main()
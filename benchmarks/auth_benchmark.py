@@ -0,0 +1,100 @@
+"""
+Login throughput benchmark for password KDF settings.
+
+Creates a throwaway database, registers users with each candidate KDF and
+drives authenticate_user from concurrent threads, reporting logins/second
+and latency percentiles so cost parameters can be matched to the peak login
+rate.
+
+    python benchmarks/auth_benchmark.py
+    python benchmarks/auth_benchmark.py --kdf scrypt:32768:8:1 --kdf pbkdf2_sha256:600000 --threads 32
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import passwords
+
+DEFAULT_KDFS = [
+    'scrypt:8192:8:1',
+    'scrypt:16384:8:1',
+    'scrypt:32768:8:1',
+    'pbkdf2_sha256:300000',
+    'pbkdf2_sha256:600000',
+]
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_setting(kdf, users, threads, duration, workers):
+    passwords.default_hasher = passwords.hasher_from_spec(kdf)
+    database.hashing_pool = passwords.HashingPool(workers=workers, queue_size=threads)
+
+    for i in range(users):
+        database.create_user(f"bench_{kdf}_{i}", f"bench_{kdf}_{i}@example.com", 'benchmark-password')
+
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(worker_id):
+        i = worker_id
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            result = database.authenticate_user(f"bench_{kdf}_{i % users}", 'benchmark-password')
+            elapsed = time.perf_counter() - start
+            with lock:
+                if result['success']:
+                    latencies.append(elapsed)
+                else:
+                    failures[0] += 1
+            i += threads
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.monotonic()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    wall = time.monotonic() - started
+
+    return {
+        'kdf': kdf,
+        'logins_per_second': len(latencies) / wall,
+        'p50_ms': percentile(latencies, 50) * 1000 if latencies else 0,
+        'p95_ms': percentile(latencies, 95) * 1000 if latencies else 0,
+        'mean_ms': statistics.mean(latencies) * 1000 if latencies else 0,
+        'failures': failures[0],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--kdf', action='append', help='KDF spec to test (repeatable), e.g. scrypt:16384:8:1')
+    parser.add_argument('--users', type=int, default=20, help='accounts created per setting')
+    parser.add_argument('--threads', type=int, default=16, help='concurrent login threads')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per setting')
+    parser.add_argument('--workers', type=int, default=passwords.HASH_WORKERS, help='hashing pool workers')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_NAME = os.path.join(tmp, 'auth_benchmark.db')
+        database.init_database()
+
+        print(f"{'kdf':<24} {'logins/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'failed':>7}")
+        for kdf in args.kdf or DEFAULT_KDFS:
+            result = run_setting(kdf, args.users, args.threads, args.duration, args.workers)
+            print(f"{result['kdf']:<24} {result['logins_per_second']:>10.1f} {result['p50_ms']:>9.1f} "
+                  f"{result['p95_ms']:>9.1f} {result['mean_ms']:>9.1f} {result['failures']:>7}")
+
+if __name__ == '__main__':
+    main()
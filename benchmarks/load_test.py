@@ -0,0 +1,137 @@
+"""
+End-to-end load generator for the MindfulBite API.
+
+Drives the real endpoints of a running app at a fixed request rate (open
+loop, so a slow server does not lower the offered load) and reports
+throughput and p50/p95/p99 latency per route. Latency is measured from each
+request's scheduled start, so queueing inside the generator counts too.
+Run the app against benchmarks/mock_openrouter.py for reproducible numbers:
+
+    python benchmarks/mock_openrouter.py --port 5055 &
+    OPENROUTER_BASE_URL=http://127.0.0.1:5055/api/v1 MINDFULBITE_ADMISSION_CONTROL=0 python app.py &
+    python benchmarks/load_test.py --rps 20 --duration 60 --mix food_search=6,find_alternatives=3,meal_analysis=1
+"""
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+FOODS = [
+    'pizza', 'burger', 'french fries', 'ice cream', 'chocolate bar', 'potato chips', 'donut', 'cheesecake',
+    'fried chicken', 'hot dog', 'pancakes', 'croissant', 'milkshake', 'nachos', 'lasagna', 'mac and cheese',
+    'cola', 'muffin', 'bagel', 'burrito', 'ramen', 'pad thai', 'butter chicken', 'paneer butter masala',
+]
+MODIFIERS = ['', 'spicy', 'cheesy', 'frozen', 'homemade', 'large', 'vegan', 'double', 'mini', 'classic']
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def build_vocabulary(size, seed):
+    """size distinct food names; a small vocabulary means mostly cache hits"""
+    names = [f"{modifier} {food}".strip() for modifier in MODIFIERS for food in FOODS]
+    rng = random.Random(seed)
+    rng.shuffle(names)
+    while len(names) < size:
+        names.append(f"{rng.choice(FOODS)} variant {len(names)}")
+    return names[:size]
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        route, weight = item.split('=')
+        mix[route.strip()] = float(weight)
+    return mix
+
+class LoadTest:
+    def __init__(self, base_url, vocabulary, timeout, seed):
+        self.base_url = base_url.rstrip('/')
+        self.vocabulary = vocabulary
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.results = {}  # route -> {'latencies': [...], 'errors': n}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def request_for(self, route):
+        """(method, path, kwargs) for one request to route"""
+        name = self.rng.choice(self.vocabulary)
+        if route == 'food_search':
+            return 'GET', '/api/food_search', {'params': {'query': name}}
+        if route == 'find_alternatives':
+            return 'GET', '/api/find_alternatives', {'params': {'food_name': name, 'calories': 300, 'category': 'Snacks'}}
+        if route == 'find_alternatives_stream':
+            return 'GET', '/api/find_alternatives/stream', {'params': {'food_name': name, 'calories': 300, 'category': 'Snacks'}}
+        if route == 'meal_analysis':
+            items = self.rng.sample(self.vocabulary, min(3, len(self.vocabulary)))
+            return 'POST', '/api/meal_analysis', {'json': {'items': items}}
+        raise ValueError(f"Unknown route: {route}")
+
+    def run_one(self, route, scheduled_at, method, path, kwargs):
+        ok = False
+        try:
+            response = self._session().request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            _ = response.content  # read streamed bodies to the end
+            ok = response.status_code < 400
+        except requests.RequestException:
+            pass
+        elapsed = time.perf_counter() - scheduled_at
+        with self._lock:
+            entry = self.results.setdefault(route, {'latencies': [], 'errors': 0})
+            if ok:
+                entry['latencies'].append(elapsed)
+            else:
+                entry['errors'] += 1
+
+    def run(self, rps, duration, mix, concurrency):
+        routes = list(mix)
+        weights = [mix[route] for route in routes]
+        interval = 1 / rps
+        total = int(rps * duration)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for i in range(total):
+                scheduled_at = started + i * interval
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                route = self.rng.choices(routes, weights)[0]
+                method, path, kwargs = self.request_for(route)
+                executor.submit(self.run_one, route, scheduled_at, method, path, kwargs)
+        return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--rps', type=float, default=10.0, help='target requests per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of load')
+    parser.add_argument('--mix', default='food_search=6,find_alternatives=3,meal_analysis=1',
+                        help='route weights: food_search, find_alternatives, find_alternatives_stream, meal_analysis')
+    parser.add_argument('--vocabulary', type=int, default=100, help='distinct food names used')
+    parser.add_argument('--concurrency', type=int, default=200, help='max requests in flight')
+    parser.add_argument('--timeout', type=float, default=60.0, help='per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    test = LoadTest(args.base_url, build_vocabulary(args.vocabulary, args.seed), args.timeout, args.seed)
+    wall = test.run(args.rps, args.duration, parse_mix(args.mix), args.concurrency)
+
+    print(f"{'route':<26} {'ok':>6} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, entry in sorted(test.results.items()):
+        latencies = entry['latencies']
+        p50, p95, p99 = (percentile(latencies, pct) * 1000 if latencies else 0 for pct in (50, 95, 99))
+        print(f"{route:<26} {len(latencies):>6} {entry['errors']:>7} {len(latencies) / wall:>8.1f} "
+              f"{p50:>9.1f} {p95:>9.1f} {p99:>9.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Local stand-in for the OpenRouter chat-completions API, for load tests.
+
+Answers POST /api/v1/chat/completions (streaming and non-streaming) with
+canned nutrition, meal and alternatives JSON in the schemas app.py's prompts
+ask for, derived deterministically from the food names. Latency, error rate
+and malformed-JSON rate are configurable so upstream behaviour is
+reproducible. Point the app at it with:
+
+    python benchmarks/mock_openrouter.py --port 5055 --latency-median-ms 800 --error-rate 0.02
+    OPENROUTER_BASE_URL=http://127.0.0.1:5055/api/v1 python app.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+# Runtime settings, filled from the command line in main()
+settings = {
+    'latency_dist': 'lognormal',
+    'latency_median_ms': 800.0,
+    'latency_sigma': 0.5,
+    'model_latency_ms': {},  # model -> median latency override
+    'stream_chunk_chars': 24,
+    'stream_chunk_delay_ms': 15.0,
+    'error_rate': 0.0,
+    'malformed_rate': 0.0,
+    'seed': None,
+}
+
+_rng = random.Random()
+_rng_lock = threading.Lock()
+_counters = {'requests': 0, 'errors': 0, 'malformed': 0, 'streams': 0}
+
+CATEGORIES = ['Snacks', 'Beverages', 'Frozen Foods', 'Fast Food', 'Dairy', 'Bakery', 'Fruits', 'Vegetables']
+GRADES = ['A', 'B', 'C', 'D', 'E']
+
+def _count(name):
+    with _rng_lock:
+        _counters[name] += 1
+
+def _random():
+    with _rng_lock:
+        return _rng.random()
+
+def _latency_seconds(model):
+    median = settings['model_latency_ms'].get(model, settings['latency_median_ms']) / 1000
+    with _rng_lock:
+        if settings['latency_dist'] == 'fixed':
+            return median
+        if settings['latency_dist'] == 'uniform':
+            return _rng.uniform(0, 2 * median)
+        # lognormal: the median stays put while sigma stretches the tail
+        return _rng.lognormvariate(0, settings['latency_sigma']) * median
+
+def _food_rng(name):
+    # Same name, same numbers: responses are stable across runs and processes
+    return random.Random(hashlib.sha256(name.lower().encode()).digest())
+
+def _nutrition(name, rng, max_kcal=None):
+    kcal = rng.uniform(30, 600)
+    if max_kcal:
+        kcal = rng.uniform(max(10.0, max_kcal * 0.4), max(11.0, max_kcal * 0.9))
+    return {
+        'energy-kcal_100g': round(kcal),
+        'proteins_100g': round(rng.uniform(0, 30), 1),
+        'carbohydrates_100g': round(rng.uniform(0, 80), 1),
+        'fat_100g': round(rng.uniform(0, 40), 1),
+        'fiber_100g': round(rng.uniform(0, 12), 1),
+        'sugars_100g': round(rng.uniform(0, 40), 1),
+        'sodium_100g': round(rng.uniform(0, 1.5), 3),
+        'calcium_100g': round(rng.uniform(0, 0.3), 3),
+        'iron_100g': round(rng.uniform(0, 0.005), 4),
+        'vitamin-c_100g': round(rng.uniform(0, 0.05), 4),
+        'potassium_100g': round(rng.uniform(0, 0.6), 3),
+        'vitamin-a_100g': round(rng.uniform(0, 0.0002), 6),
+    }
+
+def food_item(name):
+    """Nutrition object for one food, as asked for by build_nutrition_messages"""
+    rng = _food_rng(name)
+    return {
+        'product_name': name.title(),
+        'brands': 'Generic',
+        'categories': rng.choice(CATEGORIES),
+        'nutriscore_grade': rng.choice(GRADES),
+        'code': 'mock_' + hashlib.sha1(name.lower().encode()).hexdigest()[:10],
+        'nutriments': _nutrition(name, rng),
+        'ingredients_text': 'Ingredient information not available',
+    }
+
+def alternatives(name, calories, category):
+    """Alternatives array, as asked for by build_alternatives_messages"""
+    rng = _food_rng('alternatives:' + name)
+    try:
+        max_kcal = float(calories) or None
+    except ValueError:
+        max_kcal = None
+    items = []
+    for i, prefix in enumerate(['Baked', 'Grilled', 'Light', 'Whole Grain', 'Homemade'][:rng.randint(4, 5)]):
+        items.append({
+            'product_name': f"{prefix} {name.title()}",
+            'brands': 'Generic',
+            'categories': category or rng.choice(CATEGORIES),
+            'nutriscore_grade': rng.choice(['A', 'B']),
+            'code': f"alt_{i + 1:03d}",
+            'nutriments': _nutrition(name, rng, max_kcal),
+            'ingredients_text': 'List of ingredients',
+            'health_benefits': f"Lower in calories and fat than regular {name}",
+        })
+    return items
+
+def answer_for(prompt):
+    """Pick the canned answer matching the prompt that was sent"""
+    match = re.search(r'Find 4-5 healthier alternatives for: "(.*)"', prompt)
+    if match:
+        calories = re.search(r'Original food has (\S+) calories', prompt)
+        category = re.search(r'Category: (.*)', prompt)
+        return alternatives(match.group(1), calories.group(1) if calories else 0,
+                            category.group(1).strip() if category else '')
+
+    if 'Analyze each of these' in prompt:
+        queries = re.findall(r'^\s*\d+\. "(.*)"\s*$', prompt, re.MULTILINE)
+        return [dict(food_item(query), query=query) for query in queries]
+
+    match = re.search(r'Analyze the food item: "(.*)"', prompt)
+    return food_item(match.group(1) if match else 'unknown food')
+
+def _usage(prompt, content):
+    prompt_tokens = len(prompt) // 4
+    completion_tokens = len(content) // 4
+    return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens}
+
+@app.route('/api/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    body = request.get_json(silent=True) or {}
+    model = body.get('model', 'mock/model')
+    prompt = '\n'.join(str(message.get('content', '')) for message in body.get('messages', []))
+    _count('requests')
+
+    time.sleep(_latency_seconds(model))
+
+    if _random() < settings['error_rate']:
+        _count('errors')
+        status = 429 if _random() < 0.5 else 502
+        return jsonify({'error': {'message': 'Mock upstream error', 'code': status}}), status
+
+    content = json.dumps(answer_for(prompt), indent=2)
+    if _random() < settings['malformed_rate']:
+        _count('malformed')
+        content = content[:len(content) // 2]
+
+    completion_id = f"gen-mock-{uuid.uuid4().hex[:16]}"
+    created = int(time.time())
+
+    if body.get('stream'):
+        _count('streams')
+        return Response(_stream(completion_id, created, model, content), mimetype='text/event-stream')
+
+    return jsonify({
+        'id': completion_id,
+        'object': 'chat.completion',
+        'created': created,
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop'
+        }],
+        'usage': _usage(prompt, content)
+    })
+
+def _stream(completion_id, created, model, content):
+    def chunk(delta, finish_reason=None):
+        payload = {
+            'id': completion_id,
+            'object': 'chat.completion.chunk',
+            'created': created,
+            'model': model,
+            'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    yield chunk({'role': 'assistant', 'content': ''})
+    size = settings['stream_chunk_chars']
+    for start in range(0, len(content), size):
+        time.sleep(settings['stream_chunk_delay_ms'] / 1000)
+        yield chunk({'content': content[start:start + size]})
+    yield chunk({}, 'stop')
+    yield "data: [DONE]\n\n"
+
+@app.route('/stats')
+def stats():
+    return jsonify(_counters)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--latency-dist', choices=['lognormal', 'uniform', 'fixed'], default='lognormal')
+    parser.add_argument('--latency-median-ms', type=float, default=800.0)
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='lognormal shape (tail length)')
+    parser.add_argument('--model-latency', action='append', default=[], metavar='MODEL=MS',
+                        help='median latency override for one model (repeatable)')
+    parser.add_argument('--stream-chunk-chars', type=int, default=24)
+    parser.add_argument('--stream-chunk-delay-ms', type=float, default=15.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of calls answered with 429/502')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='fraction of answers with truncated JSON')
+    parser.add_argument('--seed', type=int, help='seed for reproducible latency and error sequences')
+    args = parser.parse_args()
+
+    settings.update({
+        'latency_dist': args.latency_dist,
+        'latency_median_ms': args.latency_median_ms,
+        'latency_sigma': args.latency_sigma,
+        'model_latency_ms': {model: float(ms) for model, ms in (item.rsplit('=', 1) for item in args.model_latency)},
+        'stream_chunk_chars': args.stream_chunk_chars,
+        'stream_chunk_delay_ms': args.stream_chunk_delay_ms,
+        'error_rate': args.error_rate,
+        'malformed_rate': args.malformed_rate,
+        'seed': args.seed,
+    })
+    if args.seed is not None:
+        _rng.seed(args.seed)
+
+    app.run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import cache_lookups
+from query_normalizer import canonicalize_query
+
+logger = logging.getLogger(__name__)
+
+# Compared nutrients (per 100g), whether more of them is better, and the daily reference
+# amount used to put their deltas on one scale. Energy is scaled by the profile's own
+# daily calories instead.
+NUTRIENTS = ['energy-kcal_100g', 'proteins_100g', 'carbohydrates_100g', 'fat_100g', 'fiber_100g',
+             'sugars_100g', 'sodium_100g']
+NUTRIENT_NAMES = ['calories', 'protein', 'carbohydrates', 'fat', 'fiber', 'sugars', 'sodium']
+HIGHER_IS_BETTER = np.array([False, True, False, False, True, False, False])
+DAILY_REFERENCE = np.array([np.nan, 50, 260, 70, 30, 90, 2.4])
+
+NUTRISCORE_POINTS = {'a': 0, 'b': 1, 'c': 2, 'd': 3, 'e': 4}
+
+# Score weights per ranking preset, over NUTRIENT_NAMES plus 'nutriscore' (grades gained)
+RANKING_PRESETS = {
+    'balanced': {'calories': 1.0, 'protein': 0.5, 'fiber': 0.5, 'sugars': 0.5, 'fat': 0.3, 'sodium': 0.3,
+                 'nutriscore': 0.1},
+    'calories': {'calories': 1.0},
+    'protein': {'calories': 0.3, 'protein': 1.0},
+    'low_sugar': {'calories': 0.3, 'sugars': 1.0},
+    'fiber': {'calories': 0.3, 'fiber': 1.0}
+}
+DEFAULT_RANKING = 'balanced'
+
+DEFAULT_DAILY_CALORIES = 2000  # same default as calculateDailyCalories() in script.js
+CALORIES_PER_KG = 7700
+DAILY_CALORIES_BUCKET = 100  # profiles within this many kcal/day share cached rankings
+
+def _preset_weights(rank_by):
+    weights = RANKING_PRESETS[rank_by]
+    return np.array([weights.get(name, 0.0) for name in NUTRIENT_NAMES]), weights.get('nutriscore', 0.0)
+
+def _nutrient_vector(food):
+    nutriments = food.get('nutriments') if isinstance(food, dict) else None
+    nutriments = nutriments if isinstance(nutriments, dict) else {}
+    values = []
+    for nutrient in NUTRIENTS:
+        try:
+            values.append(float(nutriments.get(nutrient)))
+        except (TypeError, ValueError):
+            values.append(np.nan)
+    return values
+
+def _nutriscore(food):
+    grade = str(food.get('nutriscore_grade') or '').strip().lower()[:1] if isinstance(food, dict) else ''
+    return NUTRISCORE_POINTS.get(grade, np.nan)
+
+def _rounded(value, digits):
+    return None if value != value else round(float(value), digits)
+
+def _known(daily_calories):
+    return daily_calories is not None and daily_calories > 0
+
+def profile_bucket(daily_calories):
+    """
+    Daily calorie bucket of a profile, the part of the cache key that stands for it
+    (None for an unknown profile)
+    """
+    return int(daily_calories // DAILY_CALORIES_BUCKET) if _known(daily_calories) else None
+
+def _scoring_budget(bucket):
+    # Scores, and so the cached order, are computed for the middle of the bucket
+    return DEFAULT_DAILY_CALORIES if bucket is None else (bucket + 0.5) * DAILY_CALORIES_BUCKET
+
+class ComparisonEngine:
+    """
+    Personalized comparison of alternatives against the original food.
+
+    For every alternative it computes calorie and macro deltas, the share of
+    the profile's daily calorie budget, and the weight change of eating it
+    daily instead of the original, all in one pass over an alternatives x
+    nutrients matrix. Alternatives are ranked by a weighted score from
+    RANKING_PRESETS. Results are kept in an in-process LRU keyed by food,
+    daily calorie bucket, preset and the alternatives themselves, so a
+    regenerated set of alternatives is never served a stale ranking. The
+    budget-dependent metrics are filled in from the profile's own daily
+    calories on every call.
+    """
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def rank(self, original, alternatives, daily_calories=None, rank_by=DEFAULT_RANKING):
+        """
+        Rank alternatives for a profile with the given daily calories (None if unknown).
+
+        Returns (ranked alternatives, comparison) where comparison['items'] holds
+        the metrics of each ranked alternative in the same order.
+        """
+        if rank_by not in RANKING_PRESETS:
+            raise ValueError(f"Unknown ranking {rank_by!r}, expected one of {sorted(RANKING_PRESETS)}")
+
+        bucket = profile_bucket(daily_calories)
+        original_vector = _nutrient_vector(original)
+        alternative_vectors = [_nutrient_vector(alt) for alt in alternatives]
+        grades = [_nutriscore(alt) for alt in alternatives]
+
+        key = (
+            canonicalize_query(original.get('product_name', '')), bucket, rank_by,
+            tuple(original_vector), _nutriscore(original),
+            tuple((alt.get('product_name'), tuple(vector)) for alt, vector in zip(alternatives, alternative_vectors))
+        )
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                self._hits += 1
+            else:
+                self._misses += 1
+        cache_lookups.labels('comparison', 'memory_hit' if cached is not None else 'miss').inc()
+
+        if cached is None:
+            cached = self._compare(original_vector, _nutriscore(original), alternative_vectors, grades,
+                                   bucket, rank_by)
+            with self._lock:
+                self._results[key] = cached
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+
+        order = cached[0]
+        budget = float(daily_calories) if _known(daily_calories) else DEFAULT_DAILY_CALORIES
+        return [alternatives[index] for index in order], self._personalize(cached, budget, rank_by)
+
+    def stats(self):
+        """Hit/miss counters for this process"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._results),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _compare(self, original_vector, original_grade, alternative_vectors, grades, bucket, rank_by):
+        original = np.array(original_vector)
+        values = np.array(alternative_vectors, dtype=np.float64).reshape(len(alternative_vectors), len(NUTRIENTS))
+
+        # Deltas per 100g: alternative minus original
+        deltas = values - original
+        reference = DAILY_REFERENCE.copy()
+        reference[0] = _scoring_budget(bucket)
+        direction = np.where(HIGHER_IS_BETTER, 1.0, -1.0)
+        benefits = np.nan_to_num(deltas * direction / reference)
+
+        grade_gain = np.nan_to_num((original_grade - np.array(grades, dtype=np.float64)) / 4)
+        nutrient_weights, grade_weight = _preset_weights(rank_by)
+        scores = benefits @ nutrient_weights + grade_gain * grade_weight
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            calorie_reduction = np.where(original[0] > 0, -deltas[:, 0] / original[0], np.nan)
+
+        order = np.argsort(-scores, kind='stable')
+        items = []
+        for rank, index in enumerate(order.tolist(), start=1):
+            items.append({
+                'rank': rank,
+                'score': _rounded(scores[index], 4),
+                'calorie_delta': _rounded(deltas[index, 0], 1),
+                'calorie_reduction': _rounded(calorie_reduction[index], 4),
+                'macro_deltas': {
+                    name: _rounded(deltas[index, column], 3)
+                    for column, name in enumerate(NUTRIENT_NAMES) if column > 0
+                }
+            })
+        return order.tolist(), items, values[order, 0], deltas[order, 0], original[0], bucket is not None
+
+    def _personalize(self, cached, budget, rank_by):
+        order, items, calories, calorie_deltas, original_calories, personalized = cached
+        budget_share = calories / budget
+        # Eating one 100g serving a day instead of the original; like getPersonalizedWeightImpact()
+        # in script.js, a larger daily budget dampens the effect
+        weekly_weight_change = calorie_deltas * 7 / CALORIES_PER_KG * (DEFAULT_DAILY_CALORIES / budget)
+
+        return {
+            'rank_by': rank_by,
+            'profile': {
+                'personalized': personalized,
+                'daily_calories': round(budget)
+            },
+            'original': {
+                'calories': _rounded(original_calories, 1),
+                'daily_budget_share': _rounded(original_calories / budget, 4)
+            },
+            'items': [
+                dict(item,
+                     daily_budget_share=_rounded(budget_share[position], 4),
+                     weekly_weight_change_kg=_rounded(weekly_weight_change[position], 3),
+                     yearly_weight_change_kg=_rounded(weekly_weight_change[position] * 365 / 7, 2))
+                for position, item in enumerate(items)
+            ]
+        }
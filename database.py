@@ -1,74 +1,426 @@
 import sqlite3
+import atexit
+import base64
 import hashlib
-from datetime import datetime, timedelta
+import hmac
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 import logging
 
+import numpy as np
+
+from passwords import hashing_pool, needs_rehash, PasswordHashingBusy
+from metrics import db_query_duration
+from tracing import span
+from profile_metrics import compute_metrics, encode_profiles, profile_metrics, to_columns
+
 logger = logging.getLogger(__name__)
 
 DATABASE_NAME = 'mindfulbite.db'
 
-def get_db_connection():
-    """Create and return a database connection"""
-    conn = sqlite3.connect(DATABASE_NAME)
+# Connection pool and SQLite tuning
+DB_POOL_SIZE = int(os.environ.get('MINDFULBITE_DB_POOL_SIZE', 8))  # idle connections kept per process
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHE_SIZE_KIB = 16384  # page cache per connection
+DB_MMAP_SIZE = 256 * 1024 * 1024
+
+# Session mode: 'db' stores a random token in user_sessions; 'signed' issues an
+# HMAC-signed token that is verified without touching the database and needs
+# MINDFULBITE_SESSION_SECRET (signed tokens are never accepted in 'db' mode)
+SESSION_MODE = os.environ.get('MINDFULBITE_SESSION_MODE', 'db')
+SESSION_SECRET = os.environ.get('MINDFULBITE_SESSION_SECRET', '')
+if SESSION_MODE == 'signed' and not SESSION_SECRET:
+    raise RuntimeError("MINDFULBITE_SESSION_MODE=signed requires MINDFULBITE_SESSION_SECRET to be set")
+SESSION_LIFETIME = timedelta(days=7)
+SIGNED_TOKEN_PREFIX = 'v1.'
+REVOCATION_REFRESH_SECONDS = 5  # how stale another worker's logout can be
+REVOCATION_COMPACT_SECONDS = 600
+
+# Background cleanup of expired sessions
+SESSION_SWEEP_INTERVAL = int(os.environ.get('MINDFULBITE_SESSION_SWEEP_INTERVAL', 300))  # seconds, 0 disables
+SESSION_SWEEP_BATCH_SIZE = 500  # rows deleted per write transaction
+SESSION_SWEEP_BATCH_PAUSE = 0.05  # seconds between batches so logins can take the write lock
+SESSION_SWEEP_VACUUM_EVERY = 12  # run an incremental vacuum every N sweeps
+SESSION_SWEEP_VACUUM_PAGES = 1000
+
+# Rows loaded per chunk when recomputing derived profile metrics in bulk
+PROFILE_METRICS_CHUNK_SIZE = 50000
+
+# Write-behind buffering of bookkeeping columns such as users.last_login
+BOOKKEEPING_FLUSH_INTERVAL = float(os.environ.get('MINDFULBITE_BOOKKEEPING_FLUSH_INTERVAL', 5))  # seconds
+BOOKKEEPING_FLUSH_SIZE = 500  # flush early once this many rows are pending
+
+_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+_pool_pid = os.getpid()
+_pool_lock = threading.Lock()
+_request_scope = threading.local()
+
+def _connect():
+    """Open a new tuned connection"""
+    conn = sqlite3.connect(DATABASE_NAME, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
     conn.row_factory = sqlite3.Row  # This enables column access by name: row['column_name']
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KIB}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
     return conn
 
+def _check_pool_owner():
+    """Drop connections inherited across a fork (e.g. a preloading process manager)"""
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool_pid != os.getpid():
+                _pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+                _pool_pid = os.getpid()
+                _request_scope.__dict__.clear()
+
+def _acquire_connection():
+    _check_pool_owner()
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return _connect()
+
+def _release_connection(conn):
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+    except sqlite3.Error:
+        conn.close()
+
+class PooledConnection:
+    """
+    Connection handed to a helper. It behaves like sqlite3.Connection, but
+    close() returns it to the pool, or leaves it open when it belongs to the
+    current request scope.
+    """
+
+    def __init__(self, conn, scoped=False, operation=None):
+        self._conn = conn
+        self._scoped = scoped
+        self._operation = operation or 'unlabeled'
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    # Statements and commits are timed per operation for /metrics and traced
+    def execute(self, sql, parameters=()):
+        return self._timed('execute', self._conn.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed('executemany', self._conn.executemany, sql, seq_of_parameters)
+
+    def commit(self):
+        return self._timed('commit', self._conn.commit)
+
+    def _timed(self, op, call, *args):
+        started = time.perf_counter()
+        try:
+            with span(f'db.{op}', function=self._operation):
+                return call(*args)
+        finally:
+            db_query_duration.labels(self._operation).observe(time.perf_counter() - started)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._scoped:
+            # Leave the shared connection clean for the next helper in this request
+            if self._conn.in_transaction:
+                self._conn.rollback()
+        else:
+            _release_connection(self._conn)
+
+def get_db_connection(operation=None):
+    """
+    Return a pooled database connection (the request's shared one inside a request scope);
+    its statements are timed under the operation name, normally the calling helper's
+    """
+    conn = getattr(_request_scope, 'conn', None)
+    if conn is not None:
+        return PooledConnection(conn, scoped=True, operation=operation)
+    return PooledConnection(_acquire_connection(), operation=operation)
+
+def begin_request_scope():
+    """Share one connection between all helpers called until end_request_scope()"""
+    if getattr(_request_scope, 'conn', None) is None:
+        _request_scope.conn = _acquire_connection()
+
+def end_request_scope():
+    """Return the request's shared connection to the pool"""
+    conn = getattr(_request_scope, 'conn', None)
+    _request_scope.conn = None
+    if conn is not None:
+        _release_connection(conn)
+
 def hash_password(password):
-    """Hash a password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hash a password with the configured KDF on the hashing pool"""
+    return hashing_pool.hash(password)
 
 def verify_password(password, hashed):
-    """Verify a password against its hash"""
-    return hashlib.sha256(password.encode()).hexdigest() == hashed
+    """Verify a password against its hash on the hashing pool"""
+    return hashing_pool.verify(password, hashed)
+
+# Schema migrations, applied in order and tracked in PRAGMA user_version. Each one
+# runs in its own transaction; add new migrations at the end and never edit old ones.
+
+def _migration_001_baseline(conn):
+    """Tables that predate versioned migrations; CREATE IF NOT EXISTS leaves them as they are on existing databases"""
+    # Users table for authentication
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1
+        )
+    ''')
+    
+    # User profiles table for health metrics
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            weight REAL,
+            height REAL,
+            age INTEGER,
+            gender TEXT CHECK(gender IN ('male', 'female', 'other')),
+            activity_level TEXT CHECK(activity_level IN ('sedentary', 'light', 'moderate', 'active', 'very_active')),
+            bmi REAL,
+            daily_calories REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
+    
+    # User sessions table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            session_token TEXT UNIQUE NOT NULL,
+            expires_at TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
+
+def _migration_002_llm_cache(conn):
+    """Shared LLM result cache (persistent tier behind the in-process LRU)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key TEXT PRIMARY KEY,
+            namespace TEXT NOT NULL,
+            value TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_expires_at ON llm_cache (expires_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_namespace_created ON llm_cache (namespace, created_at)')
+
+def _migration_003_llm_inflight(conn):
+    """Cross-process single-flight locks for in-flight LLM calls"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_inflight (
+            flight_key TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            finished_at REAL,
+            result TEXT,
+            error TEXT
+        )
+    ''')
+
+def _migration_004_food_catalog(conn):
+    """Local food catalog, filled write-through from LLM results, with a full-text index"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS foods (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name_key TEXT UNIQUE NOT NULL,
+            product_name TEXT NOT NULL,
+            brands TEXT,
+            categories TEXT,
+            ingredients_text TEXT,
+            data TEXT NOT NULL,
+            source TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Full-text index over the catalog, kept in sync by triggers
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5(
+            product_name, brands, categories, ingredients_text,
+            content='foods', content_rowid='id'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS foods_fts_insert AFTER INSERT ON foods BEGIN
+            INSERT INTO foods_fts (rowid, product_name, brands, categories, ingredients_text)
+            VALUES (new.id, new.product_name, new.brands, new.categories, new.ingredients_text);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS foods_fts_delete AFTER DELETE ON foods BEGIN
+            INSERT INTO foods_fts (foods_fts, rowid, product_name, brands, categories, ingredients_text)
+            VALUES ('delete', old.id, old.product_name, old.brands, old.categories, old.ingredients_text);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS foods_fts_update AFTER UPDATE ON foods BEGIN
+            INSERT INTO foods_fts (foods_fts, rowid, product_name, brands, categories, ingredients_text)
+            VALUES ('delete', old.id, old.product_name, old.brands, old.categories, old.ingredients_text);
+            INSERT INTO foods_fts (rowid, product_name, brands, categories, ingredients_text)
+            VALUES (new.id, new.product_name, new.brands, new.categories, new.ingredients_text);
+        END
+    ''')
+
+def _migration_005_revoked_sessions(conn):
+    """Logged-out signed session tokens, kept until the token would have expired"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS revoked_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            token_id TEXT UNIQUE NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+
+def _migration_006_session_expiry_index(conn):
+    """Index for the session sweeper's expired-session deletes"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_sessions_expires_at ON user_sessions (expires_at)')
+
+def _migration_007_hot_path_indexes(conn):
+    """Indexes for profile and per-user session lookups; one profile row per user"""
+    # Keep only the newest profile row per user so the unique index can be built
+    duplicates = conn.execute('''
+        SELECT * FROM user_profiles
+        WHERE id NOT IN (SELECT MAX(id) FROM user_profiles GROUP BY user_id)
+    ''').fetchall()
+    for row in duplicates:
+        logger.warning(f"Removing duplicate user_profiles row (a newer one exists for the user): {dict(row)}")
+    conn.executemany('DELETE FROM user_profiles WHERE id = ?', [(row['id'],) for row in duplicates])
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_user_profiles_user_id ON user_profiles (user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_sessions_user_id ON user_sessions (user_id)')
+
+def _migration_008_alternatives_graph(conn):
+    """Stored food -> healthier alternative edges, served instead of regenerating them"""
+    # One row per food node whose alternatives have been generated
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS alternative_sets (
+            food_key TEXT PRIMARY KEY,
+            food_name TEXT NOT NULL,
+            calories REAL,
+            category TEXT,
+            generated_at REAL NOT NULL
+        )
+    ''')
+    
+    # The edges: one alternative record per row, in the order the LLM gave them
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS alternative_edges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            food_key TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            alternative_key TEXT NOT NULL,
+            calorie_delta REAL,
+            data TEXT NOT NULL,
+            generated_at REAL NOT NULL
+        )
+    ''')
+    
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_alternative_edges_food_key ON alternative_edges (food_key, position)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_alternative_edges_alternative_key ON alternative_edges (alternative_key)')
+
+def _migration_009_food_popularity(conn):
+    """Per-query hit counts for /api/food_search and /api/find_alternatives"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS food_popularity (
+            kind TEXT NOT NULL,
+            query_key TEXT NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            last_seen REAL NOT NULL,
+            PRIMARY KEY (kind, query_key)
+        )
+    ''')
+    
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_food_popularity_hits ON food_popularity (hits DESC)')
+
+def _migration_010_catalog_versions(conn):
+    """Per-row version counters behind HTTP validators for catalog responses"""
+    conn.execute('ALTER TABLE foods ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+
+MIGRATIONS = [
+    (1, _migration_001_baseline),
+    (2, _migration_002_llm_cache),
+    (3, _migration_003_llm_inflight),
+    (4, _migration_004_food_catalog),
+    (5, _migration_005_revoked_sessions),
+    (6, _migration_006_session_expiry_index),
+    (7, _migration_007_hot_path_indexes),
+    (8, _migration_008_alternatives_graph),
+    (9, _migration_009_food_popularity),
+    (10, _migration_010_catalog_versions),
+]
+
+def get_schema_version(conn):
+    """Current schema version of the database"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def run_migrations(conn):
+    """Apply pending migrations; returns the versions applied (none when the schema is current)"""
+    latest = MIGRATIONS[-1][0]
+    if get_schema_version(conn) >= latest:
+        return []
+    
+    applied = []
+    for version, migration in MIGRATIONS:
+        # BEGIN IMMEDIATE takes the write lock, so concurrently starting workers
+        # apply each migration exactly once
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"Applied schema migration {version}: {migration.__name__}")
+        applied.append(version)
+    return applied
 
 def init_database():
-    """Initialize the database with required tables"""
-    conn = get_db_connection()
+    """Bring the database schema up to date"""
+    conn = get_db_connection('init_database')
     try:
-        # Users table for authentication
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_login TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1
-            )
-        ''')
-        
-        # User profiles table for health metrics
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS user_profiles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                weight REAL,
-                height REAL,
-                age INTEGER,
-                gender TEXT CHECK(gender IN ('male', 'female', 'other')),
-                activity_level TEXT CHECK(activity_level IN ('sedentary', 'light', 'moderate', 'active', 'very_active')),
-                bmi REAL,
-                daily_calories REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-            )
-        ''')
+        run_migrations(conn)
         
-        # User sessions table
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS user_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                session_token TEXT UNIQUE NOT NULL,
-                expires_at TIMESTAMP NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-            )
-        ''')
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            logger.info("Incremental auto-vacuum is off; run `flask enable-incremental-vacuum` during "
+                        "maintenance to let the session sweeper return freed pages")
         
-        conn.commit()
         logger.info("Database initialized successfully")
         
     except Exception as e:
@@ -80,7 +432,7 @@ def init_database():
 
 def create_user(username, email, password):
     """Create a new user account"""
-    conn = get_db_connection()
+    conn = get_db_connection('create_user')
     try:
         # Check if username or email already exists
         existing = conn.execute(
@@ -110,6 +462,9 @@ def create_user(username, email, password):
         logger.info(f"User created successfully: {username}")
         return {"success": True, "user_id": user_id}
         
+    except PasswordHashingBusy:
+        logger.warning("User creation rejected: password hashing pool busy")
+        return {"success": False, "error": "Server busy, please try again", "busy": True}
     except Exception as e:
         logger.error(f"User creation failed: {e}")
         conn.rollback()
@@ -119,7 +474,7 @@ def create_user(username, email, password):
 
 def authenticate_user(username, password):
     """Authenticate user login"""
-    conn = get_db_connection()
+    conn = get_db_connection('authenticate_user')
     try:
         user = conn.execute(
             'SELECT id, username, email, password_hash, is_active FROM users WHERE username = ? OR email = ?',
@@ -135,12 +490,12 @@ def authenticate_user(username, password):
         if not verify_password(password, user['password_hash']):
             return {"success": False, "error": "Invalid password"}
         
-        # Update last login
-        conn.execute(
-            'UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?',
-            (user['id'],)
-        )
-        conn.commit()
+        # Upgrade legacy SHA-256 or outdated-cost hashes while we have the plain password
+        if needs_rehash(user['password_hash']):
+            schedule_password_rehash(user['id'], password)
+        
+        # Update last login (written behind, off the login path)
+        last_login_buffer.put(user['id'], _sql_timestamp())
         
         return {
             "success": True,
@@ -151,26 +506,139 @@ def authenticate_user(username, password):
             }
         }
         
+    except PasswordHashingBusy:
+        logger.warning("Login rejected: password hashing pool busy")
+        return {"success": False, "error": "Server busy, please try again", "busy": True}
     except Exception as e:
         logger.error(f"Authentication failed: {e}")
         return {"success": False, "error": "Authentication failed"}
     finally:
         conn.close()
 
-def create_session(user_id):
-    """Create a new session for the user"""
-    conn = get_db_connection()
+def _sql_timestamp():
+    """Current UTC time in the format CURRENT_TIMESTAMP uses"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+class WriteBehindBuffer:
+    """
+    Collects single-column bookkeeping writes in memory and flushes them in one
+    executemany transaction on a timer, when max_pending rows are waiting, and
+    at interpreter exit. Later writes for the same key replace earlier ones,
+    and pending() lets read paths see values until their commit has finished.
+    """
+
+    def __init__(self, name, sql, flush_interval=BOOKKEEPING_FLUSH_INTERVAL, max_pending=BOOKKEEPING_FLUSH_SIZE):
+        self.name = name
+        self.sql = sql  # takes (value, key)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._flushing = {}  # batch being written; still readable until its commit
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def put(self, key, value):
+        with self._lock:
+            self._pending[key] = value
+            size = len(self._pending)
+        self._ensure_flusher()
+        if size >= self.max_pending:
+            self._wakeup.set()
+
+    def pending(self, key):
+        """Value waiting to be written for key (or being written right now), or None"""
+        with self._lock:
+            value = self._pending.get(key)
+            return value if value is not None else self._flushing.get(key)
+
+    def flush(self):
+        """Write all pending values in one transaction; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+            if not batch:
+                return 0
+            
+            conn = get_db_connection(f'flush_{self.name}')
+            try:
+                conn.executemany(self.sql, [(value, key) for key, value in batch.items()])
+                conn.commit()
+                with self._lock:
+                    self._flushing = {}
+                return len(batch)
+            except Exception as e:
+                logger.error(f"Write-behind flush of {self.name} failed: {e}")
+                conn.rollback()
+                # Put the batch back without clobbering newer values
+                with self._lock:
+                    for key, value in batch.items():
+                        self._pending.setdefault(key, value)
+                    self._flushing = {}
+                return 0
+            finally:
+                conn.close()
+
+    def _ensure_flusher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+last_login_buffer = WriteBehindBuffer('last_login', 'UPDATE users SET last_login = ? WHERE id = ?')
+
+# Password upgrades found at login are hashed on a background thread and written behind
+password_hash_buffer = WriteBehindBuffer('password_hash', 'UPDATE users SET password_hash = ? WHERE id = ?')
+_rehash_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='password-rehash')
+_rehash_pending = set()
+_rehash_lock = threading.Lock()
+
+def schedule_password_rehash(user_id, password):
+    """Rehash a user's password with the configured KDF off the login path"""
+    with _rehash_lock:
+        if user_id in _rehash_pending or password_hash_buffer.pending(user_id) is not None:
+            return
+        _rehash_pending.add(user_id)
+    _rehash_executor.submit(_rehash_password, user_id, password)
+
+def _rehash_password(user_id, password):
     try:
-        # Clean up expired sessions
-        conn.execute(
-            'DELETE FROM user_sessions WHERE expires_at < CURRENT_TIMESTAMP'
-        )
+        password_hash_buffer.put(user_id, hash_password(password))
+        logger.info(f"Rehashed password for user {user_id}")
+    except PasswordHashingBusy:
+        logger.warning(f"Skipped password rehash for user {user_id}: hashing pool busy")
+    except Exception as e:
+        logger.error(f"Password rehash for user {user_id} failed: {e}")
+    finally:
+        with _rehash_lock:
+            _rehash_pending.discard(user_id)
+
+def create_session(user_id, user=None):
+    """Create a new session for the user (user is the dict from authenticate_user, if at hand)"""
+    if SESSION_MODE == 'signed':
+        return _create_signed_session(user_id, user)
+    
+    conn = get_db_connection('create_session')
+    try:
+        # Expired sessions are removed by the background sweeper (start_session_sweeper)
         
         # Create new session token
         import random
         import string
         session_token = ''.join(random.choices(string.ascii_letters + string.digits, k=32))
-        expires_at = datetime.now() + timedelta(days=7)  # 7 days expiry
+        expires_at = datetime.now() + SESSION_LIFETIME
         
         conn.execute(
             'INSERT INTO user_sessions (user_id, session_token, expires_at) VALUES (?, ?, ?)',
@@ -186,9 +654,15 @@ def create_session(user_id):
     finally:
         conn.close()
 
+def _is_signed_token(session_token):
+    return SESSION_MODE == 'signed' and session_token.startswith(SIGNED_TOKEN_PREFIX)
+
 def get_user_from_session(session_token):
     """Get user data from session token"""
-    conn = get_db_connection()
+    if _is_signed_token(session_token):
+        return _verify_signed_session(session_token)
+    
+    conn = get_db_connection('get_user_from_session')
     try:
         result = conn.execute('''
             SELECT u.id, u.username, u.email, us.expires_at
@@ -213,7 +687,10 @@ def get_user_from_session(session_token):
 
 def delete_session(session_token):
     """Delete a session (logout)"""
-    conn = get_db_connection()
+    if _is_signed_token(session_token):
+        return _revoke_signed_session(session_token)
+    
+    conn = get_db_connection('delete_session')
     try:
         conn.execute('DELETE FROM user_sessions WHERE session_token = ?', (session_token,))
         conn.commit()
@@ -224,9 +701,232 @@ def delete_session(session_token):
     finally:
         conn.close()
 
+def sweep_expired_sessions(batch_size=SESSION_SWEEP_BATCH_SIZE, pause=SESSION_SWEEP_BATCH_PAUSE):
+    """
+    Delete expired sessions and revocations of expired signed tokens in small
+    batches, each in its own short write transaction
+    """
+    deleted = 0
+    conn = get_db_connection('sweep_expired_sessions')
+    try:
+        conn.execute('DELETE FROM revoked_sessions WHERE expires_at <= ?', (time.time(),))
+        conn.commit()
+        
+        while True:
+            count = conn.execute('''
+                DELETE FROM user_sessions WHERE id IN (
+                    SELECT id FROM user_sessions
+                    WHERE expires_at < CURRENT_TIMESTAMP
+                    LIMIT ?
+                )
+            ''', (batch_size,)).rowcount
+            conn.commit()
+            deleted += count
+            if count < batch_size:
+                break
+            time.sleep(pause)
+        return deleted
+    except Exception as e:
+        logger.error(f"Session sweep failed: {e}")
+        conn.rollback()
+        return deleted
+    finally:
+        conn.close()
+
+def enable_incremental_vacuum():
+    """
+    Switch the database to incremental auto-vacuum so the session sweeper can hand
+    freed pages back to the filesystem. On an existing database this needs a full
+    VACUUM, which rewrites the file under an exclusive lock: run it during
+    maintenance. Returns False when it was already enabled.
+    """
+    conn = get_db_connection('enable_incremental_vacuum')
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            return False
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return True
+    finally:
+        conn.close()
+
+def incremental_vacuum(pages=SESSION_SWEEP_VACUUM_PAGES):
+    """Return up to `pages` free pages to the filesystem"""
+    conn = get_db_connection('incremental_vacuum')
+    try:
+        conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+        return True
+    except Exception as e:
+        logger.error(f"Incremental vacuum failed: {e}")
+        return False
+    finally:
+        conn.close()
+
+_session_sweeper = {'thread': None, 'stop': threading.Event()}
+
+def start_session_sweeper(interval=SESSION_SWEEP_INTERVAL):
+    """Start the background thread that removes expired sessions every `interval` seconds"""
+    if interval <= 0 or (_session_sweeper['thread'] and _session_sweeper['thread'].is_alive()):
+        return None
+    
+    stop = _session_sweeper['stop']
+    stop.clear()
+    
+    def run():
+        sweeps = 0
+        while not stop.wait(interval):
+            deleted = sweep_expired_sessions()
+            sweeps += 1
+            if deleted:
+                logger.info(f"Session sweeper removed {deleted} expired sessions")
+            if sweeps % SESSION_SWEEP_VACUUM_EVERY == 0:
+                incremental_vacuum()
+    
+    thread = threading.Thread(target=run, name='session-sweeper', daemon=True)
+    thread.start()
+    _session_sweeper['thread'] = thread
+    return thread
+
+def stop_session_sweeper():
+    """Ask the session sweeper to stop after its current sweep"""
+    _session_sweeper['stop'].set()
+
+# Signed sessions: "v1.<base64 payload>.<base64 HMAC-SHA256>" carrying the user and
+# expiry. Verification is pure CPU; logouts go to revoked_sessions, which every
+# worker mirrors in memory and re-reads at most every REVOCATION_REFRESH_SECONDS
+# (expired rows are deleted by the session sweeper, never on the read path).
+# A deactivated account keeps working until its token expires or is revoked.
+
+_revoked_tokens = {}  # token_id -> expires_at
+_revocation_state = {'last_id': 0, 'refreshed_at': 0.0, 'compacted_at': 0.0}
+_revocation_lock = threading.Lock()
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def _sign(message):
+    return _b64encode(hmac.new(SESSION_SECRET.encode(), message.encode(), hashlib.sha256).digest())
+
+def _create_signed_session(user_id, user=None):
+    """Issue a signed session token"""
+    if user is None:
+        conn = get_db_connection('_create_signed_session')
+        try:
+            row = conn.execute('SELECT id, username, email FROM users WHERE id = ?', (user_id,)).fetchone()
+            if not row:
+                return None
+            user = dict(row)
+        except Exception as e:
+            logger.error(f"Session creation failed: {e}")
+            return None
+        finally:
+            conn.close()
+    
+    payload = {
+        "uid": user_id,
+        "usr": user['username'],
+        "eml": user['email'],
+        "exp": int(time.time() + SESSION_LIFETIME.total_seconds()),
+        "jti": uuid.uuid4().hex
+    }
+    message = SIGNED_TOKEN_PREFIX + _b64encode(json.dumps(payload, separators=(',', ':')).encode())
+    return f"{message}.{_sign(message)}"
+
+def _decode_signed_session(session_token):
+    """Return the payload of a correctly signed, well-formed token, or None"""
+    try:
+        message, signature = session_token.rsplit('.', 1)
+        if not message.startswith(SIGNED_TOKEN_PREFIX) or not hmac.compare_digest(signature, _sign(message)):
+            return None
+        payload = json.loads(_b64decode(message[len(SIGNED_TOKEN_PREFIX):]))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or not all(key in payload for key in ('uid', 'usr', 'eml', 'exp', 'jti')):
+        return None
+    if not isinstance(payload['exp'], (int, float)) or not isinstance(payload['jti'], str):
+        return None
+    return payload
+
+def _verify_signed_session(session_token):
+    """Get user data from a signed token without a database read"""
+    payload = _decode_signed_session(session_token)
+    if not payload or payload['exp'] <= time.time():
+        return None
+    
+    refresh_revocations()
+    if payload.get('jti') in _revoked_tokens:
+        return None
+    
+    return {
+        "id": payload['uid'],
+        "username": payload['usr'],
+        "email": payload['eml']
+    }
+
+def _revoke_signed_session(session_token):
+    """Revoke a signed token in this worker and, through the database, in all others"""
+    payload = _decode_signed_session(session_token)
+    if not payload:
+        return True  # Forged or corrupt tokens are never accepted anyway
+    
+    with _revocation_lock:  # refresh_revocations iterates the set while compacting it
+        _revoked_tokens[payload['jti']] = payload['exp']
+    conn = get_db_connection('_revoke_signed_session')
+    try:
+        conn.execute(
+            'INSERT OR IGNORE INTO revoked_sessions (token_id, expires_at) VALUES (?, ?)',
+            (payload['jti'], payload['exp'])
+        )
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Session revocation failed: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def refresh_revocations(force=False):
+    """Pull revocations recorded by other workers since the last refresh, forgetting expired ones now and then"""
+    state = _revocation_state
+    now = time.time()
+    if not force and now - state['refreshed_at'] < REVOCATION_REFRESH_SECONDS:
+        return
+    
+    # One thread refreshes; the others carry on with the current set
+    if not _revocation_lock.acquire(blocking=force):
+        return
+    try:
+        state['refreshed_at'] = now
+        conn = get_db_connection('refresh_revocations')
+        try:
+            if now - state['compacted_at'] >= REVOCATION_COMPACT_SECONDS:
+                state['compacted_at'] = now
+                for token_id in [t for t, exp in _revoked_tokens.items() if exp <= now]:
+                    _revoked_tokens.pop(token_id, None)
+            
+            rows = conn.execute(
+                'SELECT id, token_id, expires_at FROM revoked_sessions WHERE id > ? AND expires_at > ? ORDER BY id',
+                (state['last_id'], now)
+            ).fetchall()
+            for row in rows:
+                _revoked_tokens[row['token_id']] = row['expires_at']
+            if rows:
+                state['last_id'] = rows[-1]['id']
+        except Exception as e:
+            logger.error(f"Revocation refresh failed: {e}")
+            conn.rollback()
+        finally:
+            conn.close()
+    finally:
+        _revocation_lock.release()
+
 def get_user_profile(user_id):
     """Get user profile data"""
-    conn = get_db_connection()
+    conn = get_db_connection('get_user_profile')
     try:
         profile = conn.execute(
             'SELECT * FROM user_profiles WHERE user_id = ?',
@@ -245,33 +945,10 @@ def get_user_profile(user_id):
 
 def update_user_profile(user_id, weight=None, height=None, age=None, gender=None, activity_level=None):
     """Update user profile with health metrics"""
-    conn = get_db_connection()
-    try:
-        # Calculate BMI if weight and height are provided
-        bmi = None
-        daily_calories = None
-        
-        if weight and height:
-            height_m = height / 100  # Convert cm to meters
-            bmi = round(weight / (height_m ** 2), 1)
-        
-        # Calculate daily calories using Mifflin-St Jeor equation
-        if weight and height and age and gender:
-            if gender.lower() == 'male':
-                bmr = 10 * weight + 6.25 * height - 5 * age + 5
-            else:  # female or other
-                bmr = 10 * weight + 6.25 * height - 5 * age - 161
-            
-            activity_multipliers = {
-                'sedentary': 1.2,
-                'light': 1.375,
-                'moderate': 1.55,
-                'active': 1.725,
-                'very_active': 1.9
-            }
-            
-            multiplier = activity_multipliers.get(activity_level, 1.55)
-            daily_calories = round(bmr * multiplier)
+    conn = get_db_connection('update_user_profile')
+    try:
+        # BMI and daily calories (Mifflin-St Jeor), same formulas as the bulk recompute
+        bmi, daily_calories = profile_metrics(weight, height, age, gender, activity_level)
         
         # Build update query dynamically
         updates = []
@@ -317,6 +994,505 @@ def update_user_profile(user_id, weight=None, height=None, age=None, gender=None
     finally:
         conn.close()
 
+def _same_metric(new, old):
+    # Elementwise equality that treats NULL == NULL as unchanged
+    return (new == old) | (np.isnan(new) & np.isnan(old))
+
+def recompute_profile_metrics(chunk_size=PROFILE_METRICS_CHUNK_SIZE):
+    """
+    Recompute bmi and daily_calories for every profile from its stored inputs,
+    e.g. after the activity multipliers or formulas change.
+
+    Profiles are loaded in rowid-ordered chunks and computed with NumPy; only
+    rows whose values actually change are written back, one executemany
+    transaction per chunk. Returns (profiles scanned, profiles updated).
+    """
+    conn = get_db_connection('recompute_profile_metrics')
+    scanned = updated = 0
+    last_rowid = 0
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None  # plain tuples are much cheaper than sqlite3.Row here
+        while True:
+            rows = cursor.execute('''
+                SELECT rowid, weight, height, age, gender, activity_level, bmi, daily_calories
+                FROM user_profiles WHERE rowid > ? ORDER BY rowid LIMIT ?
+            ''', (last_rowid, chunk_size)).fetchall()
+            if not rows:
+                break
+            
+            rowids, weights, heights, ages, genders, activity_levels, old_bmi, old_calories = zip(*rows)
+            last_rowid = rowids[-1]
+            scanned += len(rows)
+            
+            is_male, multiplier = encode_profiles(genders, activity_levels)
+            bmi, _, daily_calories = compute_metrics(weights, heights, ages, is_male, multiplier)
+            
+            changed = ~(_same_metric(bmi, np.array(old_bmi, dtype=np.float64)) &
+                        _same_metric(daily_calories, np.array(old_calories, dtype=np.float64)))
+            changed_ids = np.flatnonzero(changed)
+            changed_rows = list(zip(
+                to_columns(bmi[changed_ids]),
+                to_columns(daily_calories[changed_ids]),
+                np.array(rowids)[changed_ids].tolist()
+            ))
+            if changed_rows:
+                conn.executemany('''
+                    UPDATE user_profiles SET bmi = ?, daily_calories = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE rowid = ?
+                ''', changed_rows)
+                conn.commit()
+                updated += len(changed_rows)
+        
+        logger.info(f"Recomputed profile metrics: {updated} of {scanned} profiles changed")
+        return scanned, updated
+
+    except Exception as e:
+        logger.error(f"Profile metrics recompute failed: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def get_llm_cache_entry(cache_key):
+    """Get a cached LLM result as (value_json, expires_at), or None if missing or expired"""
+    conn = get_db_connection('get_llm_cache_entry')
+    try:
+        row = conn.execute(
+            'SELECT value, expires_at FROM llm_cache WHERE cache_key = ? AND expires_at > ?',
+            (cache_key, time.time())
+        ).fetchone()
+        
+        if row:
+            return row['value'], row['expires_at']
+        return None
+        
+    except Exception as e:
+        logger.error(f"LLM cache lookup failed: {e}")
+        return None
+    finally:
+        conn.close()
+
+def set_llm_cache_entry(cache_key, namespace, value, expires_at):
+    """Store (or replace) a cached LLM result"""
+    conn = get_db_connection('set_llm_cache_entry')
+    try:
+        conn.execute(
+            'INSERT OR REPLACE INTO llm_cache (cache_key, namespace, value, created_at, expires_at) VALUES (?, ?, ?, ?, ?)',
+            (cache_key, namespace, value, time.time(), expires_at)
+        )
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"LLM cache write failed: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def prune_llm_cache(namespace, max_entries):
+    """Drop expired entries, then the oldest ones beyond max_entries for a namespace"""
+    conn = get_db_connection('prune_llm_cache')
+    try:
+        expired = conn.execute(
+            'DELETE FROM llm_cache WHERE expires_at <= ?',
+            (time.time(),)
+        ).rowcount
+        
+        overflow = conn.execute('''
+            DELETE FROM llm_cache WHERE cache_key IN (
+                SELECT cache_key FROM llm_cache
+                WHERE namespace = ?
+                ORDER BY created_at DESC
+                LIMIT -1 OFFSET ?
+            )
+        ''', (namespace, max_entries)).rowcount
+        
+        conn.commit()
+        return expired + overflow
+    except Exception as e:
+        logger.error(f"LLM cache pruning failed: {e}")
+        conn.rollback()
+        return 0
+    finally:
+        conn.close()
+
+def get_alternative_set(food_key):
+    """Get stored alternatives for a food as (alternatives, generated_at), or None"""
+    conn = get_db_connection('get_alternative_set')
+    try:
+        node = conn.execute(
+            'SELECT generated_at FROM alternative_sets WHERE food_key = ?', (food_key,)
+        ).fetchone()
+        if not node:
+            return None
+        
+        edges = conn.execute(
+            'SELECT data FROM alternative_edges WHERE food_key = ? ORDER BY position', (food_key,)
+        ).fetchall()
+        return [json.loads(edge['data']) for edge in edges], node['generated_at']
+        
+    except Exception as e:
+        logger.error(f"Alternatives graph lookup failed: {e}")
+        return None
+    finally:
+        conn.close()
+
+def save_alternative_set(food_key, food_name, calories, category, edges):
+    """
+    Replace the stored alternatives of a food; edges are (alternative_key,
+    calorie_delta, alternative) tuples in display order
+    """
+    conn = get_db_connection('save_alternative_set')
+    try:
+        now = time.time()
+        conn.execute('DELETE FROM alternative_edges WHERE food_key = ?', (food_key,))
+        conn.executemany('''
+            INSERT INTO alternative_edges (food_key, position, alternative_key, calorie_delta, data, generated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [
+            (food_key, position, alternative_key, calorie_delta, json.dumps(alternative), now)
+            for position, (alternative_key, calorie_delta, alternative) in enumerate(edges)
+        ])
+        conn.execute('''
+            INSERT INTO alternative_sets (food_key, food_name, calories, category, generated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(food_key) DO UPDATE SET
+                food_name = excluded.food_name,
+                calories = excluded.calories,
+                category = excluded.category,
+                generated_at = excluded.generated_at
+        ''', (food_key, food_name, calories, category, now))
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Alternatives graph write failed: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def delete_alternative_sets(food_keys=None):
+    """Drop stored alternatives for the given foods (all foods when None); returns the number removed"""
+    conn = get_db_connection('delete_alternative_sets')
+    try:
+        if food_keys is None:
+            removed = conn.execute('DELETE FROM alternative_sets').rowcount
+            conn.execute('DELETE FROM alternative_edges')
+        else:
+            removed = 0
+            for food_key in food_keys:
+                removed += conn.execute('DELETE FROM alternative_sets WHERE food_key = ?', (food_key,)).rowcount
+                conn.execute('DELETE FROM alternative_edges WHERE food_key = ?', (food_key,))
+        conn.commit()
+        return removed
+    except Exception as e:
+        logger.error(f"Alternatives graph invalidation failed: {e}")
+        conn.rollback()
+        return 0
+    finally:
+        conn.close()
+
+def delete_expired_alternative_sets(max_age_seconds):
+    """Drop stored alternatives older than max_age_seconds; returns the number removed"""
+    conn = get_db_connection('delete_expired_alternative_sets')
+    try:
+        cutoff = time.time() - max_age_seconds
+        removed = conn.execute('DELETE FROM alternative_sets WHERE generated_at <= ?', (cutoff,)).rowcount
+        conn.execute('DELETE FROM alternative_edges WHERE food_key NOT IN (SELECT food_key FROM alternative_sets)')
+        conn.commit()
+        return removed
+    except Exception as e:
+        logger.error(f"Alternatives graph expiry failed: {e}")
+        conn.rollback()
+        return 0
+    finally:
+        conn.close()
+
+def add_food_popularity(counts):
+    """Add hit counts, given as {(kind, query_key): hits}, in one transaction"""
+    conn = get_db_connection('add_food_popularity')
+    try:
+        now = time.time()
+        conn.executemany('''
+            INSERT INTO food_popularity (kind, query_key, hits, last_seen)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(kind, query_key) DO UPDATE SET
+                hits = hits + excluded.hits,
+                last_seen = excluded.last_seen
+        ''', [(kind, query_key, hits, now) for (kind, query_key), hits in counts.items()])
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Food popularity write failed: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def get_popular_foods(limit):
+    """Most requested query keys across all kinds, as [(query_key, hits)]"""
+    conn = get_db_connection('get_popular_foods')
+    try:
+        rows = conn.execute('''
+            SELECT query_key, SUM(hits) AS total_hits FROM food_popularity
+            GROUP BY query_key ORDER BY total_hits DESC LIMIT ?
+        ''', (limit,)).fetchall()
+        return [(row['query_key'], row['total_hits']) for row in rows]
+    except Exception as e:
+        logger.error(f"Food popularity lookup failed: {e}")
+        return []
+    finally:
+        conn.close()
+
+def acquire_inflight_lock(flight_key, owner, lock_ttl):
+    """Try to become the process that runs the call for flight_key; returns True on success"""
+    conn = get_db_connection('acquire_inflight_lock')
+    try:
+        now = time.time()
+        # Stale locks (crashed owner) and old handed-off results can be taken over
+        conn.execute(
+            'DELETE FROM llm_inflight WHERE flight_key = ? AND expires_at <= ?',
+            (flight_key, now)
+        )
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO llm_inflight (flight_key, owner, expires_at) VALUES (?, ?, ?)',
+            (flight_key, owner, now + lock_ttl)
+        )
+        conn.commit()
+        return cursor.rowcount == 1
+    except Exception as e:
+        logger.error(f"In-flight lock acquisition failed: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def renew_inflight_lock(flight_key, owner, lock_ttl, result=None):
+    """Extend a lock this process still holds, storing progress in result; returns False once it is lost"""
+    conn = get_db_connection('renew_inflight_lock')
+    try:
+        cursor = conn.execute(
+            '''UPDATE llm_inflight SET expires_at = ?, result = ?
+               WHERE flight_key = ? AND owner = ? AND finished_at IS NULL''',
+            (time.time() + lock_ttl, result, flight_key, owner)
+        )
+        conn.commit()
+        return cursor.rowcount == 1
+    except Exception as e:
+        logger.error(f"In-flight lock renewal failed: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def get_inflight_state(flight_key, include_expired=False):
+    """Get the lock row for flight_key as a dict, or None if nobody holds it (or there is no row)"""
+    conn = get_db_connection('get_inflight_state')
+    try:
+        row = conn.execute(
+            'SELECT owner, expires_at, finished_at, result, error FROM llm_inflight WHERE flight_key = ?',
+            (flight_key,)
+        ).fetchone()
+        
+        if row and (include_expired or row['finished_at'] is not None or row['expires_at'] > time.time()):
+            return dict(row)
+        return None
+        
+    except Exception as e:
+        logger.error(f"In-flight lock lookup failed: {e}")
+        return None
+    finally:
+        conn.close()
+
+def finish_inflight(flight_key, owner, result=None, error=None, handoff_ttl=30):
+    """Publish the outcome of a call so waiting processes can pick it up"""
+    conn = get_db_connection('finish_inflight')
+    try:
+        now = time.time()
+        conn.execute(
+            '''UPDATE llm_inflight SET finished_at = ?, expires_at = ?, result = ?, error = ?
+               WHERE flight_key = ? AND owner = ?''',
+            (now, now + handoff_ttl, result, error, flight_key, owner)
+        )
+        # Clean up rows that nobody needs any more
+        conn.execute('DELETE FROM llm_inflight WHERE expires_at <= ?', (now,))
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"In-flight lock release failed: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def _text_field(value):
+    """Coerce an LLM-provided field to text for indexing"""
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return ', '.join(str(item) for item in value)
+    return str(value)
+
+def upsert_food(name_key, food, source):
+    """Add or refresh a food in the catalog (results of a direct lookup win over alternatives)"""
+    conn = get_db_connection('upsert_food')
+    try:
+        conn.execute('''
+            INSERT INTO foods (name_key, product_name, brands, categories, ingredients_text, data, source)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(name_key) DO UPDATE SET
+                product_name = excluded.product_name,
+                brands = excluded.brands,
+                categories = excluded.categories,
+                ingredients_text = excluded.ingredients_text,
+                data = excluded.data,
+                source = excluded.source,
+                updated_at = CURRENT_TIMESTAMP,
+                version = foods.version + 1
+            WHERE excluded.source = 'nutrition' OR foods.source != 'nutrition'
+        ''', (
+            name_key,
+            _text_field(food.get('product_name')),
+            _text_field(food.get('brands')),
+            _text_field(food.get('categories')),
+            _text_field(food.get('ingredients_text')),
+            json.dumps(food),
+            source
+        ))
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Food catalog write failed: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def get_food(name_key):
+    """Get a catalog food record by its normalized name"""
+    conn = get_db_connection('get_food')
+    try:
+        row = conn.execute('SELECT data FROM foods WHERE name_key = ?', (name_key,)).fetchone()
+        
+        if row:
+            return json.loads(row['data'])
+        return None
+        
+    except Exception as e:
+        logger.error(f"Food catalog lookup failed: {e}")
+        return None
+    finally:
+        conn.close()
+
+def get_search_version(query, name_key=None):
+    """
+    Version of what a search for query reads from the catalog: (version of the row
+    name_key, then the count, version sum and id sum of the rows its full-text match
+    covers), so adding, removing or changing any of them changes it. None if unavailable.
+    """
+    conn = get_db_connection('get_search_version')
+    try:
+        primary = conn.execute('SELECT version FROM foods WHERE name_key = ?', (name_key or '',)).fetchone()
+        covered = (0, 0, 0)
+        match = _fts_match_expression(query)
+        if match:
+            covered = tuple(conn.execute('''
+                SELECT COUNT(*), TOTAL(f.version), TOTAL(f.id)
+                FROM foods_fts
+                JOIN foods f ON f.id = foods_fts.rowid
+                WHERE foods_fts MATCH ?
+            ''', (match,)).fetchone())
+        return (primary['version'] if primary else None,) + covered
+    except Exception as e:
+        logger.error(f"Search version lookup failed: {e}")
+        return None
+    finally:
+        conn.close()
+
+def get_alternatives_version(food_key, name_key):
+    """
+    (generated_at of the stored alternatives of food_key, version of the catalog row
+    name_key) for a food, or None when no alternatives are stored for it
+    """
+    conn = get_db_connection('get_alternatives_version')
+    try:
+        row = conn.execute('''
+            SELECT s.generated_at, (SELECT version FROM foods WHERE name_key = ?) AS version
+            FROM alternative_sets s
+            WHERE s.food_key = ? AND EXISTS (SELECT 1 FROM alternative_edges e WHERE e.food_key = s.food_key)
+        ''', (name_key, food_key)).fetchone()
+        return (row['generated_at'], row['version']) if row else None
+    except Exception as e:
+        logger.error(f"Alternatives version lookup failed: {e}")
+        return None
+    finally:
+        conn.close()
+
+def get_food_names_since(last_id, limit=10000):
+    """
+    Get (id, name_key) pairs for catalog foods added after last_id, oldest first,
+    leaving out foods only known as suggested alternatives
+    """
+    conn = get_db_connection('get_food_names_since')
+    try:
+        rows = conn.execute(
+            "SELECT id, name_key FROM foods WHERE id > ? AND source != 'alternative' ORDER BY id LIMIT ?",
+            (last_id, limit)
+        ).fetchall()
+        return [(row['id'], row['name_key']) for row in rows]
+        
+    except Exception as e:
+        logger.error(f"Food catalog name listing failed: {e}")
+        return []
+    finally:
+        conn.close()
+
+def _fts_match_expression(query):
+    """Turn free text into an FTS5 query that matches all of its words"""
+    words = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{word}"' for word in words)
+
+def search_foods(query, limit=10, offset=0, exclude_key=None, include_alternatives=True):
+    """
+    Full-text search the food catalog, best matches first. Foods that were
+    looked up directly rank ahead of foods only known as suggested alternatives,
+    which are left out entirely unless include_alternatives is set.
+    
+    Returns (matches, total) where matches are (name_key, food) pairs and
+    total counts all matches (excluding exclude_key).
+    """
+    match = _fts_match_expression(query)
+    if not match:
+        return [], 0
+    
+    source_filter = '' if include_alternatives else "AND f.source != 'alternative'"
+    conn = get_db_connection('search_foods')
+    try:
+        rows = conn.execute(f'''
+            SELECT f.name_key, f.data
+            FROM foods_fts
+            JOIN foods f ON f.id = foods_fts.rowid
+            WHERE foods_fts MATCH ? AND f.name_key != ? {source_filter}
+            ORDER BY f.source = 'alternative', bm25(foods_fts, 10.0, 2.0, 1.0, 0.5)
+            LIMIT ? OFFSET ?
+        ''', (match, exclude_key or '', limit, offset)).fetchall()
+        
+        total = conn.execute(f'''
+            SELECT COUNT(*)
+            FROM foods_fts
+            JOIN foods f ON f.id = foods_fts.rowid
+            WHERE foods_fts MATCH ? AND f.name_key != ? {source_filter}
+        ''', (match, exclude_key or '')).fetchone()[0]
+        
+        return [(row['name_key'], json.loads(row['data'])) for row in rows], total
+        
+    except Exception as e:
+        logger.error(f"Food catalog search failed: {e}")
+        return [], 0
+    finally:
+        conn.close()
+
 # Initialize database when module is imported
 if __name__ == "__main__":
     init_database() 
\ No newline at end of file
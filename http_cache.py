@@ -0,0 +1,158 @@
+"""
+HTTP validators and compression for API responses.
+
+- content_etag(): a weak ETag derived from the response body, so identical
+  content always gets the same validator. It is weak because the gzip and
+  brotli encodings of a body share it.
+- ValidatorIndex: remembers the ETag last served for a request key together
+  with a version token of the data behind it (the catalog rows read, a stored
+  graph entry's timestamp...). A conditional request whose key and version
+  are unchanged gets its 304 before the view runs.
+- compress(): gzip (or brotli, when the brotli package is installed) for
+  bodies above a size threshold, with encoded bodies of recent ETags kept
+  so repeat views are not compressed again.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+COMPRESS_MIN_BYTES = int(os.environ.get('MINDFULBITE_COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # much faster than the default 11, still smaller than gzip
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript')
+
+def content_etag(body):
+    """Weak ETag of a response body"""
+    return 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header matches etag (weak comparison)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = _opaque(etag)
+    return any(_opaque(candidate) == opaque for candidate in if_none_match.split(','))
+
+def _opaque(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith('W/') else tag
+
+def choose_encoding(accept_encoding):
+    """Best content coding the client accepts: 'br', 'gzip' or None"""
+    accepted = {}
+    for part in (accept_encoding or '').lower().split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding] = quality
+    for coding in (('br', 'gzip') if BROTLI_AVAILABLE else ('gzip',)):
+        if accepted.get(coding, accepted.get('*', 0.0)) > 0:
+            return coding
+    return None
+
+def is_compressible(content_type):
+    return (content_type or '').split(';')[0].strip() in COMPRESSIBLE_TYPES
+
+class ValidatorIndex:
+    """
+    Bounded map of request key -> (data version, ETag) for answering
+    conditional requests without rebuilding the response, plus an LRU of
+    encoded bodies per (ETag, coding).
+    """
+
+    def __init__(self, max_entries=10000, max_encoded_entries=1000):
+        self.max_entries = max_entries
+        self.max_encoded_entries = max_encoded_entries
+
+        self._validators = OrderedDict()
+        self._encoded = OrderedDict()
+        self._lock = threading.Lock()
+        self._precondition_hits = 0
+        self._not_modified = 0
+        self._compressed = 0
+        self._encoded_hits = 0
+        self._bytes_saved = 0
+
+    def precheck(self, key, version, if_none_match):
+        """The remembered ETag when the request can be answered with a 304 straight away, else None"""
+        if version is None or not if_none_match:
+            return None
+        with self._lock:
+            entry = self._validators.get(key)
+            if entry is None or entry[0] != version or not etag_matches(if_none_match, entry[1]):
+                return None
+            self._validators.move_to_end(key)
+            self._precondition_hits += 1
+            return entry[1]
+
+    def remember(self, key, version, etag):
+        """Record the ETag served for key at this data version"""
+        if version is None:
+            return
+        with self._lock:
+            self._validators[key] = (version, etag)
+            self._validators.move_to_end(key)
+            while len(self._validators) > self.max_entries:
+                self._validators.popitem(last=False)
+
+    def count_not_modified(self):
+        with self._lock:
+            self._not_modified += 1
+
+    def compress(self, body, coding, etag=None):
+        """body encoded with coding ('br' or 'gzip'), reusing the encoding of an earlier identical body"""
+        cache_key = (etag, coding) if etag else None
+        if cache_key is not None:
+            with self._lock:
+                encoded = self._encoded.get(cache_key)
+                if encoded is not None:
+                    self._encoded.move_to_end(cache_key)
+                    self._encoded_hits += 1
+                    self._bytes_saved += len(body) - len(encoded)
+                    return encoded
+
+        if coding == 'br':
+            encoded = brotli.compress(body, quality=BROTLI_QUALITY)
+        else:
+            encoded = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+        with self._lock:
+            self._compressed += 1
+            self._bytes_saved += len(body) - len(encoded)
+            if cache_key is not None:
+                self._encoded[cache_key] = encoded
+                while len(self._encoded) > self.max_encoded_entries:
+                    self._encoded.popitem(last=False)
+        return encoded
+
+    def stats(self):
+        """Validator and compression counters for this process"""
+        with self._lock:
+            return {
+                'validators': len(self._validators),
+                'precondition_hits': self._precondition_hits,
+                'not_modified': self._not_modified,
+                'compressed': self._compressed,
+                'encoded_hits': self._encoded_hits,
+                'bytes_saved': self._bytes_saved,
+                'brotli': BROTLI_AVAILABLE
+            }
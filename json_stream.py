@@ -0,0 +1,73 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+class JSONArrayStreamParser:
+    """
+    Incrementally extract complete objects from a JSON array that arrives in chunks.
+
+    Anything before the opening '[' (such as a ```json fence) is ignored, and
+    parsing stops at the closing ']'. Only the object currently being read is
+    buffered, so each object can be handed on as soon as its closing brace arrives.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self._current = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        """Consume a chunk of text and return the list of objects completed by it"""
+        completed = []
+
+        for char in chunk:
+            if self.finished:
+                break
+
+            if not self.started:
+                if char == '[':
+                    self.started = True
+                continue
+
+            if self._depth == 0:
+                # Between array elements: only an object start or the array end matter
+                if char == '{':
+                    self._current = [char]
+                    self._depth = 1
+                elif char == ']':
+                    self.finished = True
+                continue
+
+            self._current.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    obj = self._decode(''.join(self._current))
+                    if obj is not None:
+                        completed.append(obj)
+                    self._current = []
+
+        return completed
+
+    def _decode(self, text):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping malformed streamed object: {e}")
+            return None
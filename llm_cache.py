@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from database import get_llm_cache_entry, set_llm_cache_entry, prune_llm_cache
+from metrics import cache_lookups
+from query_normalizer import canonicalize_query
+
+logger = logging.getLogger(__name__)
+
+# Prune the SQLite tier once every this many writes instead of on every write
+PRUNE_EVERY_WRITES = 100
+
+def normalize_query(query):
+    """Normalize a query so trivially different spellings share a cache key"""
+    return canonicalize_query(query)
+
+def make_cache_key(namespace, parts, model, prompt_version):
+    """Build a stable cache key from the normalized query parts, model and prompt version"""
+    raw = json.dumps([namespace, [normalize_query(part) for part in parts], model, prompt_version])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+class LLMResultCache:
+    """
+    Two-tier cache for LLM results.
+
+    Tier 1 is a bounded in-process LRU, tier 2 is the llm_cache table in
+    SQLite, which survives restarts and is shared by all worker processes.
+    Values must be JSON serializable.
+    """
+
+    def __init__(self, namespace, model, prompt_version, ttl_seconds,
+                 max_memory_entries=1000, max_persistent_entries=50000, persistent=True):
+        self.namespace = namespace
+        self.model = model
+        self.prompt_version = prompt_version
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_persistent_entries = max_persistent_entries
+        self.persistent = persistent
+
+        self._memory = OrderedDict()  # cache_key -> (value_json, expires_at)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._memory_hits = 0
+        self._persistent_hits = 0
+        self._misses = 0
+
+    def key(self, *parts):
+        """Cache key for the given query parts"""
+        return make_cache_key(self.namespace, parts, self.model, self.prompt_version)
+
+    def get(self, *parts):
+        """Return the cached value for the query parts, or None on a miss"""
+        cache_key = self.key(*parts)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            if entry and entry[1] > now:
+                self._memory.move_to_end(cache_key)
+                self._memory_hits += 1
+                cache_lookups.labels(self.namespace, 'memory_hit').inc()
+                return json.loads(entry[0])
+            if entry:
+                del self._memory[cache_key]
+
+        if self.persistent:
+            entry = get_llm_cache_entry(cache_key)
+            if entry:
+                self._remember(cache_key, entry[0], entry[1])
+                with self._lock:
+                    self._persistent_hits += 1
+                cache_lookups.labels(self.namespace, 'persistent_hit').inc()
+                return json.loads(entry[0])
+
+        with self._lock:
+            self._misses += 1
+        cache_lookups.labels(self.namespace, 'miss').inc()
+        return None
+
+    def peek(self, *parts):
+        """Like get(), but without counting the lookup or filling the memory tier"""
+        cache_key = self.key(*parts)
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            if entry and entry[1] > time.time():
+                return json.loads(entry[0])
+        if self.persistent:
+            entry = get_llm_cache_entry(cache_key)
+            if entry:
+                return json.loads(entry[0])
+        return None
+
+    def set(self, value, *parts):
+        """Store a value for the query parts in both tiers"""
+        cache_key = self.key(*parts)
+        value_json = json.dumps(value)
+        expires_at = time.time() + self.ttl_seconds
+
+        self._remember(cache_key, value_json, expires_at)
+
+        if self.persistent:
+            set_llm_cache_entry(cache_key, self.namespace, value_json, expires_at)
+            with self._lock:
+                self._writes += 1
+                should_prune = self._writes % PRUNE_EVERY_WRITES == 0
+            if should_prune:
+                removed = prune_llm_cache(self.namespace, self.max_persistent_entries)
+                if removed:
+                    logger.info(f"Pruned {removed} entries from {self.namespace} cache")
+
+    def clear_memory(self):
+        """Drop the in-process tier (the SQLite tier is left untouched)"""
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        """Hit/miss counters for this process"""
+        with self._lock:
+            hits = self._memory_hits + self._persistent_hits
+            lookups = hits + self._misses
+            return {
+                'namespace': self.namespace,
+                'memory_entries': len(self._memory),
+                'memory_hits': self._memory_hits,
+                'persistent_hits': self._persistent_hits,
+                'misses': self._misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _remember(self, cache_key, value_json, expires_at):
+        with self._lock:
+            self._memory[cache_key] = (value_json, expires_at)
+            self._memory.move_to_end(cache_key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
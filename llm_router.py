@@ -0,0 +1,412 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from metrics import llm_request_duration, llm_tokens
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Threads shared by all routers; each routed call uses one, plus one more when hedged.
+# Sized so every request admission control lets in (MINDFULBITE_MAX_IN_FLIGHT) can run a
+# primary and a hedge next to the background prefetch, refresh and warm-up calls; the
+# executor only starts threads as they are needed.
+ROUTER_WORKERS = int(os.environ.get(
+    'MINDFULBITE_ROUTER_WORKERS', 2 * (int(os.environ.get('MINDFULBITE_MAX_IN_FLIGHT', 128)) + 16)
+))
+QUEUED_POLL_SECONDS = 0.05  # how often a call whose primary waits for a router thread re-checks
+
+_executor = ThreadPoolExecutor(max_workers=ROUTER_WORKERS, thread_name_prefix='llm-router')
+
+# Token accumulator of the innermost track_usage() block, if any
+_usage = contextvars.ContextVar('llm_usage', default=None)
+
+class LLMRouteTimeout(Exception):
+    """Raised when no candidate model answered before the call's deadline"""
+
+class TokenUsage:
+    """Tokens spent by the routed calls made inside a track_usage() block"""
+
+    def __init__(self):
+        self.total_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, tokens):
+        with self._lock:
+            self.total_tokens += tokens
+
+@contextmanager
+def track_usage():
+    """Count the tokens of every routed LLM call made in this block, hedges included"""
+    usage = TokenUsage()
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+class LatencyTracker:
+    """Rolling latency percentiles and error rate over the last window calls to one model"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)  # (latency seconds, ok)
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self._lock:
+            self._samples.append((latency, ok))
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, pct):
+        """Latency percentile of successful calls, or None without samples"""
+        with self._lock:
+            latencies = sorted(latency for latency, ok in self._samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(pct / 100 * len(latencies)))]
+
+    def error_rate(self):
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+class ModelRouter:
+    """
+    Route a chat completion to an ordered list of candidate models.
+
+    Every call has a deadline (timeout seconds). If the primary model has not
+    answered by its rolling p95 latency, a hedged request goes to the next
+    model and whichever answers first wins; if the primary fails outright,
+    the next model is tried straight away. Hedges are capped at
+    max_hedge_ratio of calls so a slow upstream cannot double token spend.
+    Models whose recent error rate exceeds max_error_rate are moved to the
+    back of the list until they recover.
+    """
+
+    def __init__(self, name, client, models, timeout, default_hedge_delay=None, min_hedge_delay=0.5,
+                 max_hedge_ratio=0.1, max_error_rate=0.5, min_samples=20):
+        self.name = name
+        self.client = client
+        self.models = list(models)
+        self.timeout = timeout
+        self.default_hedge_delay = default_hedge_delay or timeout / 2
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+
+        self._trackers = {model: LatencyTracker() for model in self.models}
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._hedges = 0
+        self._fallback_wins = 0
+        self._failovers = 0
+        self._timeouts = 0
+
+    @property
+    def primary_model(self):
+        return self.models[0]
+
+    def create(self, **kwargs):
+        """
+        chat.completions.create(**kwargs) on the best candidate model.
+
+        With stream=True the hedge races on the response headers and the losing
+        stream is closed. Raises the last model error, or LLMRouteTimeout.
+        """
+        with span('llm', task=self.name) as route_span:
+            return self._create(route_span, kwargs)
+
+    def _create(self, route_span, kwargs):
+        deadline = time.monotonic() + self.timeout
+        candidates = self._ranked_models()
+        with self._lock:
+            self._calls += 1
+
+        pending = {}  # future -> model
+        started_at = {}  # model -> when a router thread picked its call up
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            model = candidates[next_index]
+            next_index += 1
+            context = contextvars.copy_context()
+            future = _executor.submit(context.run, self._call_model, model, deadline, kwargs, started_at)
+            pending[future] = model
+            return model
+
+        primary = launch()
+        hedge_delay = self._hedge_delay(primary)
+        hedged = False
+        last_error = None
+
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            # The hedge delay runs from when the primary call started, not from when it
+            # was queued: hedging a call that waits for a thread would only add load
+            primary_started = started_at.get(primary)
+            if hedged or next_index >= len(candidates):
+                wait_until = deadline
+            elif primary_started is None:
+                wait_until = min(now + QUEUED_POLL_SECONDS, deadline)
+            else:
+                wait_until = min(primary_started + hedge_delay, deadline)
+            done, _ = wait(list(pending), timeout=max(0.0, wait_until - now), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"Router {self.name}: {model} failed: {e}")
+                    continue
+                self._discard(pending, kwargs)
+                if model != primary:
+                    with self._lock:
+                        self._fallback_wins += 1
+                route_span.set(model=model, attempts=next_index, hedged=hedged)
+                return response
+
+            if not pending and next_index < len(candidates):
+                # Everything in flight failed: fail over to the next model
+                with self._lock:
+                    self._failovers += 1
+                launch()
+            elif (not done and not hedged and next_index < len(candidates) and primary_started is not None
+                  and time.monotonic() >= primary_started + hedge_delay):
+                # The primary is past its hedge delay; hedge at most once per call
+                hedged = True
+                if self._may_hedge():
+                    model = launch()
+                    logger.info(f"Router {self.name}: {primary} slower than its p95, hedging with {model}")
+
+        # Calls still pending mean the deadline passed, whatever failed before
+        timed_out = bool(pending)
+        self._discard(pending, kwargs)
+        route_span.set(attempts=next_index, hedged=hedged)
+        if not timed_out and last_error is not None:
+            raise last_error
+        with self._lock:
+            self._timeouts += 1
+        raise LLMRouteTimeout(f"Router {self.name}: no model answered within {self.timeout}s")
+
+    def stats(self):
+        """Per-model latency and error counters for this process"""
+        with self._lock:
+            summary = {
+                'name': self.name,
+                'calls': self._calls,
+                'hedges': self._hedges,
+                'fallback_wins': self._fallback_wins,
+                'failovers': self._failovers,
+                'timeouts': self._timeouts
+            }
+        summary['models'] = [{
+            'model': model,
+            'samples': len(tracker),
+            'p50': tracker.percentile(50),
+            'p95': tracker.percentile(95),
+            'error_rate': round(tracker.error_rate(), 4)
+        } for model, tracker in self._trackers.items()]
+        return summary
+
+    def _call_model(self, model, deadline, kwargs, started_at=None):
+        started = time.monotonic()
+        if started_at is not None:
+            started_at[model] = started
+        remaining = deadline - started
+        if remaining <= 0:
+            raise LLMRouteTimeout(f"Router {self.name}: deadline passed before calling {model}")
+        try:
+            # Retries would run past the deadline; the router's failover replaces them
+            with span('llm.call', task=self.name, model=model) as call_span:
+                response = self.client.with_options(timeout=remaining, max_retries=0).chat.completions.create(
+                    model=model, **kwargs
+                )
+        except Exception:
+            self._record_failure(model, time.monotonic() - started)
+            raise
+        self._record_success(model, time.monotonic() - started, response, call_span)
+        return response
+
+    def _record_failure(self, model, elapsed):
+        self._trackers[model].record(elapsed, False)
+        llm_request_duration.labels(self.name, model, 'error').observe(elapsed)
+
+    def _record_success(self, model, elapsed, response, call_span):
+        self._trackers[model].record(elapsed, True)
+        llm_request_duration.labels(self.name, model, 'ok').observe(elapsed)
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            llm_tokens.labels(self.name, model, 'prompt').inc(usage.prompt_tokens or 0)
+            llm_tokens.labels(self.name, model, 'completion').inc(usage.completion_tokens or 0)
+            call_span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+            sink = _usage.get()
+            if sink is not None:
+                sink.add((usage.prompt_tokens or 0) + (usage.completion_tokens or 0))
+
+    def _ranked_models(self):
+        healthy = []
+        unhealthy = []
+        for model in self.models:
+            tracker = self._trackers[model]
+            if len(tracker) >= self.min_samples and tracker.error_rate() > self.max_error_rate:
+                unhealthy.append(model)
+            else:
+                healthy.append(model)
+        return healthy + unhealthy
+
+    def _hedge_delay(self, model):
+        tracker = self._trackers[model]
+        p95 = tracker.percentile(95) if len(tracker) >= self.min_samples else None
+        return max(self.min_hedge_delay, p95 if p95 is not None else self.default_hedge_delay)
+
+    def _may_hedge(self):
+        with self._lock:
+            # A little slack so hedging works before many calls have been made
+            if self._hedges + 1 > self.max_hedge_ratio * self._calls + 1:
+                return False
+            self._hedges += 1
+            return True
+
+    def _discard(self, pending, kwargs):
+        # Losing calls cannot be interrupted; drop queued ones and close late streams
+        for future in pending:
+            if not future.cancel() and kwargs.get('stream'):
+                future.add_done_callback(_close_stream)
+        pending.clear()
+
+def _close_stream(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        future.result().close()
+    except Exception as e:
+        logger.warning(f"Failed to close losing stream: {e}")
+
+class AsyncModelRouter:
+    """
+    asyncio counterpart of a ModelRouter for an AsyncOpenAI client.
+
+    Routing, hedging and failover follow the wrapped router, and latency
+    trackers and counters are shared with it, so sync and async callers
+    learn from each other and router.stats() covers both. A call is a task
+    on the event loop rather than a thread, and losing calls are cancelled.
+    """
+
+    def __init__(self, router, client):
+        self.router = router
+        self.client = client
+        self.name = router.name
+
+    async def create(self, **kwargs):
+        """Awaitable chat.completions.create(**kwargs) on the best candidate model"""
+        with span('llm', task=self.name) as route_span:
+            return await self._create(route_span, kwargs)
+
+    async def _create(self, route_span, kwargs):
+        router = self.router
+        deadline = time.monotonic() + router.timeout
+        candidates = router._ranked_models()
+        with router._lock:
+            router._calls += 1
+
+        pending = {}  # task -> model
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            model = candidates[next_index]
+            next_index += 1
+            pending[asyncio.ensure_future(self._call_model(model, deadline, kwargs))] = model
+            return model
+
+        primary = launch()
+        hedge_at = time.monotonic() + router._hedge_delay(primary)
+        hedged = False
+        last_error = None
+
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                wait_until = deadline if hedged or next_index >= len(candidates) else min(hedge_at, deadline)
+                done, _ = await asyncio.wait(list(pending), timeout=max(0.0, wait_until - now),
+                                             return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    model = pending.pop(task)
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        last_error = e
+                        logger.warning(f"Router {self.name}: {model} failed: {e}")
+                        continue
+                    if model != primary:
+                        with router._lock:
+                            router._fallback_wins += 1
+                    route_span.set(model=model, attempts=next_index, hedged=hedged)
+                    return response
+
+                if not pending and next_index < len(candidates):
+                    with router._lock:
+                        router._failovers += 1
+                    launch()
+                elif not done and not hedged and next_index < len(candidates):
+                    hedged = True
+                    if router._may_hedge():
+                        model = launch()
+                        logger.info(f"Router {self.name}: {primary} slower than its p95, hedging with {model}")
+        finally:
+            # Calls still pending mean the deadline passed, whatever failed before
+            timed_out = bool(pending)
+            # Also runs when the caller is cancelled, so no call outlives its request
+            for task in pending:
+                task.cancel()
+                if kwargs.get('stream'):
+                    task.add_done_callback(_close_async_stream)
+            pending.clear()
+
+        route_span.set(attempts=next_index, hedged=hedged)
+        if not timed_out and last_error is not None:
+            raise last_error
+        with router._lock:
+            router._timeouts += 1
+        raise LLMRouteTimeout(f"Router {self.name}: no model answered within {router.timeout}s")
+
+    async def _call_model(self, model, deadline, kwargs):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMRouteTimeout(f"Router {self.name}: deadline passed before calling {model}")
+        started = time.monotonic()
+        try:
+            with span('llm.call', task=self.name, model=model) as call_span:
+                response = await self.client.with_options(timeout=remaining, max_retries=0).chat.completions.create(
+                    model=model, **kwargs
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.router._record_failure(model, time.monotonic() - started)
+            raise
+        self.router._record_success(model, time.monotonic() - started, response, call_span)
+        return response
+
+def _close_async_stream(task):
+    if task.cancelled() or task.exception() is not None:
+        return
+    asyncio.ensure_future(task.result().close())
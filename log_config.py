@@ -0,0 +1,127 @@
+"""
+Logging setup that keeps log I/O off the request threads.
+
+configure_logging() installs a QueueHandler on the root logger. A
+QueueListener thread does the actual writing, including the files of routed
+loggers (e.g. request traces), which go to their own handler instead of the
+main stream. The queue is bounded: when it is full, records below WARNING are
+dropped (and counted) rather than blocking the caller; warnings and errors
+wait for room instead of being lost.
+Large LLM payloads go through log_payload(), which samples and truncates
+them. Errors are logged in full through the normal logger calls.
+"""
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = logging.BASIC_FORMAT
+LOG_QUEUE_SIZE = int(os.environ.get('MINDFULBITE_LOG_QUEUE_SIZE', 10000))
+LOG_PAYLOAD_MAX_CHARS = int(os.environ.get('MINDFULBITE_LOG_PAYLOAD_MAX_CHARS', 500))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get('MINDFULBITE_LOG_PAYLOAD_SAMPLE_RATE', 0.05))
+
+_listener = None
+_handler = None
+_configure_lock = threading.Lock()
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records below WARNING instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, record):
+        with self._lock:
+            unreported, self._unreported = self._unreported, 0
+        if unreported:
+            # Tell the reader how many records went missing, once there is room again
+            notice = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                       f"Log queue full, dropped {unreported} records", None, None)
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                with self._lock:
+                    self._unreported += unreported
+        if record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                self._unreported += 1
+
+class _ExcludeLoggers(logging.Filter):
+    """Rejects records from the given loggers and their children"""
+
+    def __init__(self, names):
+        super().__init__()
+        self.names = tuple(names)
+
+    def filter(self, record):
+        return not any(record.name == name or record.name.startswith(name + '.') for name in self.names)
+
+def configure_logging(level=logging.INFO, stream=None, routes=None):
+    """
+    Route all logging through a bounded queue drained by a background writer
+    (idempotent). routes maps logger names to the handler that writes their
+    records instead of the main stream.
+    """
+    global _listener, _handler
+    with _configure_lock:
+        if _listener is not None:
+            return
+        routes = routes or {}
+        writer = logging.StreamHandler(stream)
+        writer.setFormatter(logging.Formatter(LOG_FORMAT))
+        writer.addFilter(_ExcludeLoggers(routes))
+        handlers = [writer]
+        for name, handler in routes.items():
+            handler.addFilter(logging.Filter(name))
+            handlers.append(handler)
+
+        _handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(_handler)
+        root.setLevel(level)
+
+        _listener = QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_shutdown)
+
+def _shutdown():
+    """Drain the queue, then write any later records (from other atexit hooks) directly"""
+    _listener.stop()
+    root = logging.getLogger()
+    root.removeHandler(_handler)
+    for handler in _listener.handlers:
+        root.addHandler(handler)
+
+def dropped_records():
+    """Number of log records dropped because the queue was full"""
+    return _handler.dropped if _handler else 0
+
+def truncate(text, limit=LOG_PAYLOAD_MAX_CHARS):
+    """Cut text to limit characters, noting how much was left out"""
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more chars]"
+
+def log_payload(logger, label, payload, level=logging.INFO):
+    """
+    Log a sampled, truncated LLM payload. The payload is only converted to
+    text when the record is actually kept.
+    """
+    if not logger.isEnabledFor(level) or random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    logger.log(level, f"{label}: {truncate(payload)}")
@@ -0,0 +1,101 @@
+"""
+Prometheus metrics for the request path, served by /metrics.
+
+With several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory shared by the workers before they start. Each process then writes
+its samples to memory-mapped files in that directory and /metrics
+aggregates all of them. Call mark_process_dead(pid) from the process
+manager's child-exit hook to drop a dead worker's live samples. Without
+prometheus_client installed, every metric is a no-op.
+"""
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import (
+        CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    logger.warning("prometheus_client not installed; /metrics is disabled")
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+def _metric(kind, name, documentation, labelnames, **kwargs):
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    return {'counter': Counter, 'histogram': Histogram}[kind](name, documentation, labelnames, **kwargs)
+
+http_request_duration = _metric(
+    'histogram', 'mindfulbite_http_request_duration_seconds',
+    'Time to produce a response (headers, for streamed responses) per route',
+    ['route', 'method', 'status'], buckets=HTTP_BUCKETS
+)
+llm_request_duration = _metric(
+    'histogram', 'mindfulbite_llm_request_duration_seconds',
+    'Upstream chat-completion call latency per task and model',
+    ['task', 'model', 'outcome'], buckets=LLM_BUCKETS
+)
+llm_tokens = _metric(
+    'counter', 'mindfulbite_llm_tokens',
+    'Tokens reported by the upstream per task, model and kind (prompt or completion)',
+    ['task', 'model', 'kind']
+)
+llm_json_parse_failures = _metric(
+    'counter', 'mindfulbite_llm_json_parse_failures',
+    'LLM answers that were not valid JSON, per task',
+    ['task']
+)
+fallback_alternatives = _metric(
+    'counter', 'mindfulbite_fallback_alternatives',
+    'Times canned fallback alternatives were served instead of LLM results',
+    []
+)
+db_query_duration = _metric(
+    'histogram', 'mindfulbite_db_query_duration_seconds',
+    'SQLite statement execution time per database.py function',
+    ['function'], buckets=DB_BUCKETS
+)
+cache_lookups = _metric(
+    'counter', 'mindfulbite_cache_lookups',
+    'LLM result cache lookups per cache and result (memory_hit, persistent_hit, miss)',
+    ['cache', 'result']
+)
+admission_rejections = _metric(
+    'counter', 'mindfulbite_admission_rejections',
+    'LLM-bound requests turned away per reason (user_rate, ip_rate, queue_full, queue_timeout)',
+    ['reason']
+)
+
+def render():
+    """(body, content type) for the /metrics endpoint"""
+    if not PROMETHEUS_AVAILABLE:
+        return b'# prometheus_client is not installed\n', CONTENT_TYPE_LATEST
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+def mark_process_dead(pid):
+    """Clean up a dead worker's live samples in multiprocess mode"""
+    if PROMETHEUS_AVAILABLE and MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
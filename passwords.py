@@ -0,0 +1,141 @@
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Algorithm and cost for new hashes, e.g. "scrypt:16384:8:1" (n, r, p) or "pbkdf2_sha256:600000"
+PASSWORD_KDF = os.environ.get('MINDFULBITE_PASSWORD_KDF', 'scrypt:16384:8:1')
+
+# Hashing limits: at most HASH_WORKERS hashes run at once, HASH_QUEUE_SIZE more may wait
+# up to HASH_QUEUE_TIMEOUT seconds for a turn before the request is turned away
+HASH_WORKERS = int(os.environ.get('MINDFULBITE_HASH_WORKERS', os.cpu_count() or 2))
+HASH_QUEUE_SIZE = int(os.environ.get('MINDFULBITE_HASH_QUEUE_SIZE', 32))
+HASH_QUEUE_TIMEOUT = 2.0
+
+SALT_BYTES = 16
+
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing pool is saturated and the caller should retry later"""
+
+class Scrypt:
+    """Memory-hard scrypt; encoded as scrypt$n$r$p$salt$hash"""
+    name = 'scrypt'
+
+    def __init__(self, n=16384, r=8, p=1):
+        self.n, self.r, self.p = int(n), int(r), int(p)
+
+    def params(self):
+        return [self.n, self.r, self.p]
+
+    def derive(self, password, salt):
+        # maxmem must cover 128 * n * r bytes plus some slack
+        return hashlib.scrypt(password.encode(), salt=salt, n=self.n, r=self.r, p=self.p,
+                              maxmem=256 * self.n * self.r + 1024 * 1024, dklen=32)
+
+class PBKDF2:
+    """Iterated PBKDF2-HMAC-SHA256; encoded as pbkdf2_sha256$iterations$salt$hash"""
+    name = 'pbkdf2_sha256'
+
+    def __init__(self, iterations=600000):
+        self.iterations = int(iterations)
+
+    def params(self):
+        return [self.iterations]
+
+    def derive(self, password, salt):
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, self.iterations)
+
+HASHERS = {hasher.name: hasher for hasher in (Scrypt, PBKDF2)}
+
+def hasher_from_spec(spec):
+    """Build a hasher from "name:param:param..." (the format of PASSWORD_KDF)"""
+    name, *params = spec.split(':')
+    if name not in HASHERS:
+        raise ValueError(f"Unknown password KDF: {name}")
+    return HASHERS[name](*params)
+
+default_hasher = hasher_from_spec(PASSWORD_KDF)
+
+def hash_password(password, hasher=None):
+    """Hash a password with the configured KDF, returning the encoded string"""
+    hasher = hasher or default_hasher
+    salt = os.urandom(SALT_BYTES)
+    digest = hasher.derive(password, salt)
+    fields = [hasher.name] + [str(param) for param in hasher.params()] + [salt.hex(), digest.hex()]
+    return '$'.join(fields)
+
+def verify_password(password, encoded):
+    """Verify a password against an encoded hash (including legacy unsalted SHA-256)"""
+    if '$' not in encoded:
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, encoded)
+
+    name, *fields = encoded.split('$')
+    if name not in HASHERS or len(fields) < 2:
+        logger.error(f"Unrecognized password hash format: {name}")
+        return False
+    *params, salt, digest = fields
+    hasher = HASHERS[name](*params)
+    return hmac.compare_digest(hasher.derive(password, bytes.fromhex(salt)).hex(), digest)
+
+def needs_rehash(encoded):
+    """True when a hash was made with a different algorithm or cost than the configured one"""
+    if '$' not in encoded:
+        return True
+    name, *fields = encoded.split('$')
+    return name != default_hasher.name or fields[:-2] != [str(param) for param in default_hasher.params()]
+
+class HashingPool:
+    """
+    Bounds how many password hashes run at once.
+
+    Hashing is CPU-bound and the request thread needs the result before it
+    can answer, so hashes run on the calling thread; the pool only caps their
+    concurrency at `workers` so a burst of logins cannot take every core from
+    other requests. Up to queue_size more callers wait for a turn; when every
+    turn and queue slot stays taken for longer than queue_timeout,
+    PasswordHashingBusy is raised instead of piling up more work.
+    """
+
+    def __init__(self, workers=HASH_WORKERS, queue_size=HASH_QUEUE_SIZE, queue_timeout=HASH_QUEUE_TIMEOUT):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._turns = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._rejected = 0
+
+    def run(self, fn, *args):
+        deadline = time.monotonic() + self.queue_timeout
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._reject()
+        try:
+            if not self._turns.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                self._reject()
+            try:
+                return fn(*args)
+            finally:
+                self._turns.release()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self.run(hash_password, password)
+
+    def verify(self, password, encoded):
+        return self.run(verify_password, password, encoded)
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'rejected': self._rejected}
+
+    def _reject(self):
+        with self._lock:
+            self._rejected += 1
+        raise PasswordHashingBusy("Password hashing pool is saturated")
+
+hashing_pool = HashingPool()
@@ -0,0 +1,97 @@
+import atexit
+import logging
+import threading
+import time
+
+from database import add_food_popularity, get_popular_foods
+from query_normalizer import canonicalize_query
+
+logger = logging.getLogger(__name__)
+
+class PopularityCounter:
+    """
+    Approximate per-query hit counts kept in memory and added to the
+    food_popularity table every flush_interval seconds (and at exit).
+
+    Memory is bounded: once more than 2 * capacity distinct queries are
+    pending, only the capacity most frequent ones are kept. Rare queries may
+    be undercounted, but heavy hitters, the ones warm-up cares about, are not.
+    """
+
+    def __init__(self, flush_interval=60, capacity=5000, enabled=True):
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.enabled = enabled
+
+        self._counts = {}  # (kind, query_key) -> hits since the last flush
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._recorded = 0
+        self._evicted = 0
+        if enabled:
+            atexit.register(self.flush)
+
+    def record(self, kind, query):
+        """Count one request for a query"""
+        if not self.enabled:
+            return
+        key = (kind, canonicalize_query(query))
+        if not key[1]:
+            return
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._recorded += 1
+            if len(self._counts) > 2 * self.capacity:
+                self._shrink()
+        self._ensure_flusher()
+
+    def flush(self):
+        """Add pending counts to SQLite; returns the number of queries written"""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, {}
+            if not counts:
+                return 0
+            if not add_food_popularity(counts):
+                # Keep the counts for the next flush
+                with self._lock:
+                    for key, hits in counts.items():
+                        self._counts[key] = self._counts.get(key, 0) + hits
+                return 0
+            return len(counts)
+
+    def top(self, limit):
+        """Most requested query keys, including counts not flushed yet, as [(query_key, hits)]"""
+        totals = dict(get_popular_foods(limit * 2))
+        with self._lock:
+            for (kind, query_key), hits in self._counts.items():
+                totals[query_key] = totals.get(query_key, 0) + hits
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._counts), 'recorded': self._recorded, 'evicted': self._evicted}
+
+    def _shrink(self):
+        # Caller holds self._lock
+        ranked = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)
+        self._evicted += len(ranked) - self.capacity
+        self._counts = dict(ranked[:self.capacity])
+
+    def _ensure_flusher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='popularity-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Popularity flush failed: {e}")
@@ -0,0 +1,171 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class _Job:
+    def __init__(self, future):
+        self.future = future
+        self.created_at = time.monotonic()
+
+class Prefetcher:
+    """
+    Run speculative work in a bounded background pool and park the result
+    until a follow-up request claims it.
+
+    Jobs nobody claims within claim_ttl seconds are cancelled: queued jobs
+    never start, and results of jobs that were already running are dropped.
+    At most max_pending jobs are queued or running at once; finished results
+    waiting to be claimed do not count against it.
+    """
+
+    def __init__(self, name, fn, max_workers=4, max_pending=16, claim_ttl=60):
+        self.name = name
+        self.fn = fn
+        self.max_pending = max_pending
+        self.claim_ttl = claim_ttl
+        self.enabled = max_workers > 0
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"prefetch-{name}") if self.enabled else None
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._claimed = 0
+        self._rejected = 0
+        self._cancelled = 0
+
+    def submit(self, key, *args):
+        """Start fn(*args) in the background for key; returns False if skipped"""
+        if not self.enabled:
+            return False
+
+        with self._lock:
+            self._sweep()
+            if key in self._jobs:
+                return False
+            if sum(1 for job in self._jobs.values() if not job.future.done()) >= self.max_pending:
+                self._rejected += 1
+                return False
+            self._jobs[key] = _Job(self._executor.submit(self.fn, *args))
+            self._submitted += 1
+
+        logger.info(f"Prefetch {self.name} started for {key}")
+        return True
+
+    def claim(self, key, finished_only=False):
+        """
+        Take the in-flight or finished job for key; returns its Future or None.
+        With finished_only a job that is still queued or running is left in place.
+        """
+        with self._lock:
+            self._sweep()
+            job = self._jobs.get(key)
+            if job is None or (finished_only and not job.future.done()):
+                return None
+            del self._jobs[key]
+            if job.future.cancelled():
+                return None
+            self._claimed += 1
+            return job.future
+
+    def stats(self):
+        """Prefetch counters for this process"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'pending': len(self._jobs),
+                'submitted': self._submitted,
+                'claimed': self._claimed,
+                'rejected': self._rejected,
+                'cancelled': self._cancelled
+            }
+
+    def _sweep(self):
+        # Caller holds self._lock
+        cutoff = time.monotonic() - self.claim_ttl
+        expired = [key for key, job in self._jobs.items() if job.created_at < cutoff]
+        for key in expired:
+            self._jobs.pop(key).future.cancel()
+            self._cancelled += 1
+        if expired:
+            logger.info(f"Prefetch {self.name} dropped {len(expired)} unclaimed jobs")
+
+class AsyncPrefetcher:
+    """
+    Prefetcher for the asyncio server: fn is a coroutine function and each
+    job is a task on the running event loop, so the speculative work uses
+    the async clients and shares in-flight calls with the request handlers
+    instead of tying up a thread. Same claim_ttl and max_pending rules as
+    Prefetcher; submit() and claim() must be called on the loop.
+    """
+
+    def __init__(self, name, fn, max_pending=16, claim_ttl=60, enabled=True):
+        self.name = name
+        self.fn = fn
+        self.max_pending = max_pending
+        self.claim_ttl = claim_ttl
+        self.enabled = enabled
+
+        self._jobs = {}
+        self._submitted = 0
+        self._claimed = 0
+        self._rejected = 0
+        self._cancelled = 0
+
+    def submit(self, key, *args):
+        """Start fn(*args) as a task for key; returns False if skipped"""
+        if not self.enabled:
+            return False
+
+        self._sweep()
+        if key in self._jobs:
+            return False
+        if sum(1 for job in self._jobs.values() if not job.future.done()) >= self.max_pending:
+            self._rejected += 1
+            return False
+        # A fresh context, so the job is not traced as part of the request that started it
+        task = asyncio.get_running_loop().create_task(self.fn(*args), context=contextvars.Context())
+        task.add_done_callback(_consume_result)
+        self._jobs[key] = _Job(task)
+        self._submitted += 1
+
+        logger.info(f"Prefetch {self.name} started for {key}")
+        return True
+
+    def claim(self, key):
+        """Take the running or finished task for key, or None"""
+        self._sweep()
+        job = self._jobs.pop(key, None)
+        if job is None or job.future.cancelled():
+            return None
+        self._claimed += 1
+        return job.future
+
+    def stats(self):
+        """Prefetch counters for this process"""
+        return {
+            'name': self.name,
+            'pending': len(self._jobs),
+            'submitted': self._submitted,
+            'claimed': self._claimed,
+            'rejected': self._rejected,
+            'cancelled': self._cancelled
+        }
+
+    def _sweep(self):
+        cutoff = time.monotonic() - self.claim_ttl
+        expired = [key for key, job in self._jobs.items() if job.created_at < cutoff]
+        for key in expired:
+            self._jobs.pop(key).future.cancel()
+            self._cancelled += 1
+        if expired:
+            logger.info(f"Prefetch {self.name} dropped {len(expired)} unclaimed jobs")
+
+def _consume_result(task):
+    # Unclaimed failures are expected; don't let asyncio log them as never retrieved
+    if not task.cancelled():
+        task.exception()
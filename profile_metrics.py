@@ -0,0 +1,67 @@
+import numpy as np
+
+# Multipliers applied to BMR (Mifflin-St Jeor) to estimate total daily energy expenditure
+ACTIVITY_MULTIPLIERS = {
+    'sedentary': 1.2,
+    'light': 1.375,
+    'moderate': 1.55,
+    'active': 1.725,
+    'very_active': 1.9
+}
+DEFAULT_ACTIVITY_MULTIPLIER = 1.55
+
+# Mifflin-St Jeor sex constant: +5 for men, -161 for women (and anyone else)
+MALE_BMR_OFFSET = 5
+FEMALE_BMR_OFFSET = -161
+
+def compute_metrics(weight, height, age, is_male, multiplier):
+    """
+    Vectorized BMI, BMR and daily calories (TDEE) over equally sized arrays.
+
+    weight is in kg and height in cm. Missing (None/NaN) or zero inputs give
+    NaN for the metrics that need them. BMI is rounded to one decimal and
+    daily calories to whole numbers, as stored in user_profiles.
+    """
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    age = np.asarray(age, dtype=np.float64)
+    is_male = np.asarray(is_male, dtype=bool)
+    multiplier = np.asarray(multiplier, dtype=np.float64)
+
+    has_body = (weight > 0) & (height > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        height_m = height / 100  # Convert cm to meters
+        bmi = np.where(has_body, np.round(weight / (height_m * height_m), 1), np.nan)
+
+    offset = np.where(is_male, MALE_BMR_OFFSET, FEMALE_BMR_OFFSET)
+    bmr = np.where(has_body & (age > 0), 10 * weight + 6.25 * height - 5 * age + offset, np.nan)
+    daily_calories = np.round(bmr * multiplier)
+    return bmi, bmr, daily_calories
+
+def encode_profiles(genders, activity_levels):
+    """
+    Turn gender and activity_level columns into (is_male, multiplier) arrays.
+
+    The multiplier is NaN for profiles without a gender, so no calorie
+    estimate is produced for them.
+    """
+    is_male = np.array([bool(g) and g.lower() == 'male' for g in genders], dtype=bool)
+    multiplier = np.array([
+        ACTIVITY_MULTIPLIERS.get(a, DEFAULT_ACTIVITY_MULTIPLIER) if g else np.nan
+        for g, a in zip(genders, activity_levels)
+    ], dtype=np.float64)
+    return is_male, multiplier
+
+def profile_metrics(weight, height, age, gender, activity_level):
+    """Return (bmi, daily_calories) for one profile, None where inputs are missing"""
+    is_male, multiplier = encode_profiles([gender], [activity_level])
+    bmi, _, daily_calories = compute_metrics([weight], [height], [age], is_male, multiplier)
+    return to_column(bmi[0]), to_column(daily_calories[0], int)
+
+def to_column(value, cast=float):
+    """Convert a computed metric to a Python value for SQLite (NaN becomes NULL)"""
+    return None if np.isnan(value) else cast(value)
+
+def to_columns(values):
+    """to_column over a whole array, returning a list"""
+    return [None if value != value else value for value in values.tolist()]
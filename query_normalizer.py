@@ -0,0 +1,213 @@
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+# Regional and spelling variants mapped to one canonical form (applied after singularizing)
+SYNONYMS = {
+    'aubergine': 'eggplant',
+    'brinjal': 'eggplant',
+    'courgette': 'zucchini',
+    'capsicum': 'bell pepper',
+    'garbanzo bean': 'chickpea',
+    'garbanzo': 'chickpea',
+    'yoghurt': 'yogurt',
+    'doughnut': 'donut',
+    'hamburger': 'burger',
+    'icecream': 'ice cream',
+    'soda pop': 'soft drink',
+    'fizzy drink': 'soft drink',
+    'maize': 'corn',
+    'prawn': 'shrimp',
+}
+
+# Words that look plural but are not, or whose singular the simple rules get wrong
+SINGULAR_EXCEPTIONS = {
+    'hummus': 'hummus',
+    'couscous': 'couscous',
+    'asparagus': 'asparagus',
+    'molasses': 'molasses',
+    'swiss': 'swiss',
+    'grits': 'grits',
+    'quinoa': 'quinoa',
+    'cookies': 'cookie',
+    'brownies': 'brownie',
+    'smoothies': 'smoothie',
+    'veggies': 'veggie',
+    'pies': 'pie',
+    'fries': 'fry',
+    'leaves': 'leaf',
+    'loaves': 'loaf',
+    'knives': 'knife',
+}
+
+def singularize(word):
+    """Reduce an English plural to its singular with a few suffix rules"""
+    if word in SINGULAR_EXCEPTIONS:
+        return SINGULAR_EXCEPTIONS[word]
+    if len(word) <= 3 or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'ches', 'shes', 'xes', 'zes', 'sses')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+def _apply_synonyms(words):
+    # Longest phrase first so "garbanzo bean" wins over "garbanzo"
+    result = []
+    i = 0
+    while i < len(words):
+        for length in (3, 2, 1):
+            phrase = ' '.join(words[i:i + length])
+            if len(words) - i >= length and phrase in SYNONYMS:
+                result.append(SYNONYMS[phrase])
+                i += length
+                break
+        else:
+            result.append(words[i])
+            i += 1
+    return result
+
+def canonicalize_query(query):
+    """
+    Canonical form of a food query: lowercase, accents and punctuation stripped,
+    whitespace collapsed, words singularized and common synonyms unified.
+
+    "French Fries ", "french-fries" and "FRENCH FRY" all become "french fry".
+    """
+    text = unicodedata.normalize('NFKD', str(query)).encode('ascii', 'ignore').decode()
+    text = re.sub(r"[^\w\s]|_", ' ', text.lower())
+    words = [singularize(word) for word in text.split()]
+    return ' '.join(_apply_synonyms(words))
+
+def trigrams(text):
+    """Padded character trigrams of each word, as in PostgreSQL's pg_trgm"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return frozenset(grams)
+
+def edit_similarity(a, b):
+    """1 - Levenshtein distance / length of the longer word; 1.0 for equal words"""
+    if a == b:
+        return 1.0
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return 1.0 - previous[-1] / max(len(a), len(b))
+
+class TrigramIndex:
+    """
+    In-memory character-trigram index resolving a query to the most similar known name.
+
+    A name matches when it has the same number of words as the query and each
+    word is within a typo of the word in the same position: their edit
+    similarity (see edit_similarity) is at least threshold. Only typos inside
+    a word are tolerated, so "apple" never resolves to "apple pie" and
+    "chicken soup" never to "chicken stew". The score of a match is that of
+    its least similar word.
+
+    Each edit changes at most three trigrams of a word, so a name within k
+    edits of a query word must contain one of that word's 3k + 1 rarest
+    trigrams (prefix filtering). Candidates come from the query word for which
+    these trigrams are rarest, so lookups stay cheap even with hundreds of
+    thousands of names.
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self._names = []  # id -> name
+        self._grams = []  # id -> trigram set
+        self._word_counts = []  # id -> number of words
+        self._ids = {}  # name -> id
+        self._postings = defaultdict(list)  # trigram -> ids
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name):
+        """Index a (canonical) name; adding it again is a no-op"""
+        with self._lock:
+            if not name or name in self._ids:
+                return
+            grams = trigrams(name)
+            name_id = len(self._names)
+            self._names.append(name)
+            self._grams.append(grams)
+            self._word_counts.append(len(name.split()))
+            self._ids[name] = name_id
+            for gram in grams:
+                self._postings[gram].append(name_id)
+
+    def lookup(self, query):
+        """Return (name, similarity) for the best match at or above the threshold, or None"""
+        if query in self._ids:
+            return query, 1.0
+
+        query_words = query.split()
+        if not query_words or self.threshold <= 0:
+            return None
+
+        # Per word: its trigrams, its edit budget, and how many of its trigrams a
+        # matching name must still contain
+        word_bounds = []
+        candidates = None
+        for word in query_words:
+            grams = trigrams(word)
+            max_edits = self._max_edits(word)
+            word_bounds.append((word, grams, max_edits, len(grams) - 3 * max_edits))
+            if len(grams) <= 3 * max_edits:
+                continue  # too short to filter on
+            prefix = sorted(grams, key=lambda gram: len(self._postings.get(gram, ())))[:3 * max_edits + 1]
+            if candidates is None or sum(len(self._postings.get(gram, ())) for gram in prefix) < len(candidates):
+                candidates = set()
+                for gram in prefix:
+                    candidates.update(self._postings.get(gram, ()))
+        if candidates is None:
+            return None  # no word long enough to filter on; only exact names resolve
+
+        query_grams = trigrams(query)
+        best = None
+        best_score = (0.0, 0.0)
+        for name_id in candidates:
+            if self._word_counts[name_id] != len(query_words):
+                continue
+            grams = self._grams[name_id]
+            if any(len(word_grams & grams) < required for word, word_grams, max_edits, required in word_bounds):
+                continue
+            similarity = self._word_similarity(word_bounds, self._names[name_id].split())
+            if similarity is None:
+                continue
+            shared = len(grams & query_grams)
+            overlap = shared / (len(grams) + len(query_grams) - shared)
+            if (similarity, overlap) > best_score:
+                best, best_score = name_id, (similarity, overlap)
+
+        if best is None:
+            return None
+        return self._names[best], round(best_score[0], 4)
+
+    def _max_edits(self, word):
+        # A matching word may be longer than the query word, so the edit budget is
+        # (1 - t) * len / t rather than (1 - t) * len
+        return int((1 - self.threshold) * len(word) / self.threshold + 1e-9)
+
+    def _word_similarity(self, word_bounds, name_words):
+        # Similarity of the least similar word pair, or None below the threshold
+        lowest = 1.0
+        for (word, word_grams, max_edits, required), name_word in zip(word_bounds, name_words):
+            if abs(len(word) - len(name_word)) > max_edits:
+                return None
+            lowest = min(lowest, edit_similarity(word, name_word))
+            if lowest < self.threshold:
+                return None
+        return lowest
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from database import acquire_inflight_lock, get_inflight_state, finish_inflight
+
+logger = logging.getLogger(__name__)
+
+class SingleFlightError(Exception):
+    """Raised in waiting callers when the shared call failed in another process"""
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls so only one runs at a time.
+
+    Within a process, callers with the same key wait on the thread that is
+    already running the call and get its result or exception. With
+    cross_process=True a lock row in SQLite extends this to other worker
+    processes: the lock holder publishes its (JSON serializable) result and
+    the others poll for it.
+    """
+
+    def __init__(self, name, cross_process=False, lock_ttl=60, handoff_ttl=30, poll_interval=0.1):
+        self.name = name
+        self.cross_process = cross_process
+        self.lock_ttl = lock_ttl
+        self.handoff_ttl = handoff_ttl
+        self.poll_interval = poll_interval
+
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._leaders = 0
+        self._followers = 0
+        self._remote_followers = 0
+
+    def do(self, key, fn):
+        """Run fn() for key, or wait for the identical call already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call:
+                self._followers += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if self.cross_process:
+                call.result = self._run_across_processes(key, fn)
+            else:
+                call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stream(self, key, generate):
+        """
+        do() for a call that produces a list item by item: the leader yields the
+        items of generate() as they arrive, and callers that join meanwhile (through
+        do() or stream(), in this or another process) get the complete list once it
+        is done. A leader whose consumer goes away still finishes the call for them.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call:
+                self._followers += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            yield from call.result
+            return
+
+        lock = None  # (flight_key, owner) while this process holds the cross-process lock
+        try:
+            if self.cross_process:
+                flight_key = f"{self.name}:{key}"
+                owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+                if not acquire_inflight_lock(flight_key, owner, self.lock_ttl):
+                    # Another process is producing it: wait for its complete list
+                    call.result = self._run_across_processes(key, lambda: list(generate()))
+                    yield from call.result
+                    return
+                lock = (flight_key, owner)
+
+            items = []
+            iterator = iter(generate())
+            try:
+                for item in iterator:
+                    items.append(item)
+                    yield item
+            except GeneratorExit:
+                items.extend(iterator)
+                call.result = items
+                raise
+            call.result = items
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            if lock is not None:
+                if call.error is not None:
+                    finish_inflight(*lock, error=str(call.error), handoff_ttl=self.handoff_ttl)
+                else:
+                    finish_inflight(*lock, result=json.dumps(call.result), handoff_ttl=self.handoff_ttl)
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """Leader/follower counters for this process"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'in_flight': len(self._calls),
+                'leaders': self._leaders,
+                'followers': self._followers,
+                'remote_followers': self._remote_followers
+            }
+
+    def _run_across_processes(self, key, fn):
+        flight_key = f"{self.name}:{key}"
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        deadline = time.monotonic() + self.lock_ttl
+
+        while time.monotonic() < deadline:
+            if acquire_inflight_lock(flight_key, owner, self.lock_ttl):
+                return self._run_as_owner(flight_key, owner, fn)
+
+            state = get_inflight_state(flight_key)
+            while state and state['finished_at'] is None and time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                state = get_inflight_state(flight_key)
+
+            if state and state['finished_at'] is not None:
+                with self._lock:
+                    self._remote_followers += 1
+                if state['error'] is not None:
+                    raise SingleFlightError(state['error'])
+                return json.loads(state['result'])
+            # Lock vanished without a result (owner crashed or row expired): try to take over
+
+        logger.warning(f"Gave up waiting for in-flight call {flight_key}, calling directly")
+        return fn()
+
+    def _run_as_owner(self, flight_key, owner, fn):
+        try:
+            result = fn()
+        except Exception as e:
+            finish_inflight(flight_key, owner, error=str(e), handoff_ttl=self.handoff_ttl)
+            raise
+        finish_inflight(flight_key, owner, result=json.dumps(result), handoff_ttl=self.handoff_ttl)
+        return result
+
+class AsyncSingleFlight:
+    """
+    asyncio version of SingleFlight for one event loop: callers with the same
+    key await the coroutine already running for it. Coalescing is in-process
+    only; the cross-process lock would have to be polled from a thread.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+        self._calls = {}
+        self._leaders = 0
+        self._followers = 0
+
+    async def do(self, key, fn):
+        """Await fn() for key, or the identical call already in flight"""
+        call = self._calls.get(key)
+        if call is not None:
+            self._followers += 1
+            # Shielded so a follower that goes away does not cancel the leader's call
+            return await asyncio.shield(call)
+
+        call = asyncio.ensure_future(fn())
+        self._calls[key] = call
+        self._leaders += 1
+        call.add_done_callback(lambda done: self._calls.pop(key, None))
+        return await asyncio.shield(call)
+
+    def stats(self):
+        """Leader/follower counters for this process"""
+        return {
+            'name': self.name,
+            'in_flight': len(self._calls),
+            'leaders': self._leaders,
+            'followers': self._followers
+        }
@@ -147,15 +147,15 @@ async function searchFood() {
         currentFood = data.products[0];
         displayOriginalFood(currentFood);
 
+        // Show results now so streamed alternatives appear as they arrive
+        if (resultsSection) {
+            resultsSection.style.display = 'block';
+        }
+
         // Search for alternatives using dedicated LLM endpoint
         console.log('About to call findAlternativesLLM with:', currentFood);
         await findAlternativesLLM(currentFood);
         console.log('findAlternativesLLM completed');
-
-        // Show results
-        if (resultsSection) {
-            resultsSection.style.display = 'block';
-        }
         
     } catch (err) {
         console.error('Search error:', err);
@@ -165,10 +165,53 @@ async function searchFood() {
     }
 }
 
-// LLM-powered alternative finding
-async function findAlternativesLLM(food) {
-            console.log('Finding alternatives using LLM for:', food.product_name);
+// LLM-powered alternative finding, streamed so each alternative renders as soon as it is ready
+function findAlternativesLLM(food) {
+    console.log('Finding alternatives using LLM for:', food.product_name);
+    
+    if (!window.EventSource) {
+        return findAlternativesLLMBatch(food);
+    }
     
+    const calories = getCalories(food);
+    const category = food.categories || '';
+    const url = `/api/find_alternatives/stream?food_name=${encodeURIComponent(food.product_name)}&calories=${calories}&category=${encodeURIComponent(category)}`;
+    
+    currentAlternatives = [];
+    
+    return new Promise((resolve) => {
+        const source = new EventSource(url);
+        
+        source.addEventListener('alternative', (event) => {
+            const alternative = JSON.parse(event.data);
+            currentAlternatives.push(alternative);
+            appendAlternativeButton(alternative, currentAlternatives.length - 1);
+        });
+        
+        source.addEventListener('done', () => {
+            source.close();
+            console.log('Alternatives stream finished with', currentAlternatives.length, 'alternatives');
+            if (currentAlternatives.length === 0) {
+                displayAlternativeButtons([]);
+            }
+            resolve();
+        });
+        
+        source.onerror = () => {
+            // EventSource would keep reconnecting; stop and use the batch endpoint instead
+            source.close();
+            if (currentAlternatives.length === 0) {
+                console.warn('Alternatives stream failed, falling back to batch request');
+                findAlternativesLLMBatch(food).then(resolve);
+            } else {
+                resolve();
+            }
+        };
+    });
+}
+
+// Non-streaming alternative finding (fallback when streaming is unavailable)
+async function findAlternativesLLMBatch(food) {
     try {
         const calories = getCalories(food);
         const category = food.categories || '';
@@ -379,25 +422,7 @@ function displayAlternativeButtons(alternatives) {
         console.log('Rendering', alternatives.length, 'alternatives to DOM');
         
         alternativeButtons.innerHTML = '<h3>AI-Recommended Healthier Alternatives</h3>' + 
-            alternatives.map((alternative, index) => {
-                const calories = getCalories(alternative);
-                const nutriScore = alternative.nutriscore_grade ? 
-                    `<span class="nutri-score nutri-${alternative.nutriscore_grade.toLowerCase()}">${alternative.nutriscore_grade.toUpperCase()}</span>` : '';
-                const brand = alternative.brands ? `<div class="brand">${alternative.brands}</div>` : '';
-                const healthBenefit = alternative.health_benefits ? `<div class="health-benefit">${alternative.health_benefits}</div>` : '';
-                
-                return `
-                    <button class="alternative-btn" data-index="${index}">
-                        <div class="alt-name">${alternative.product_name || 'Unknown Product'}</div>
-                        ${brand}
-                        <div class="alt-info">
-                            <span class="alt-calories">${calories} cal</span>
-                            ${nutriScore}
-                        </div>
-                        ${healthBenefit}
-                    </button>
-                `;
-            }).join('');
+            alternatives.map(renderAlternativeButton).join('');
             
         alternativeButtons.style.display = 'block';
         
@@ -414,6 +439,42 @@ function displayAlternativeButtons(alternatives) {
     }
 }
 
+// Build the button markup for one alternative
+function renderAlternativeButton(alternative, index) {
+    const calories = getCalories(alternative);
+    const nutriScore = alternative.nutriscore_grade ? 
+        `<span class="nutri-score nutri-${alternative.nutriscore_grade.toLowerCase()}">${alternative.nutriscore_grade.toUpperCase()}</span>` : '';
+    const brand = alternative.brands ? `<div class="brand">${alternative.brands}</div>` : '';
+    const healthBenefit = alternative.health_benefits ? `<div class="health-benefit">${alternative.health_benefits}</div>` : '';
+    
+    return `
+        <button class="alternative-btn" data-index="${index}">
+            <div class="alt-name">${alternative.product_name || 'Unknown Product'}</div>
+            ${brand}
+            <div class="alt-info">
+                <span class="alt-calories">${calories} cal</span>
+                ${nutriScore}
+            </div>
+            ${healthBenefit}
+        </button>
+    `;
+}
+
+// Add one streamed alternative to the list
+function appendAlternativeButton(alternative, index) {
+    if (!alternativeButtons) return;
+    
+    if (index === 0) {
+        alternativeButtons.innerHTML = '<h3>AI-Recommended Healthier Alternatives</h3>';
+        alternativeButtons.style.display = 'block';
+        if (alternativesSection) {
+            alternativesSection.style.display = 'block';
+        }
+    }
+    
+    alternativeButtons.insertAdjacentHTML('beforeend', renderAlternativeButton(alternative, index));
+}
+
 // Show detailed alternative information
 function showAlternativeDetails(index) {
     selectedAlternative = currentAlternatives[index];
@@ -0,0 +1,58 @@
+import os
+import queue
+
+import pytest
+
+import database
+
+def _drain_pool():
+    while True:
+        try:
+            database._pool.get_nowait().close()
+        except queue.Empty:
+            return
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, migrated database for the test; pooled connections never outlive it"""
+    _drain_pool()
+    monkeypatch.setattr(database, 'DATABASE_NAME', str(tmp_path / 'mindfulbite.db'))
+    database.init_database()
+    yield database
+    # Write-behind buffers flush at exit; write their rows into this database instead
+    database._rehash_executor.submit(lambda: None).result()
+    database.password_hash_buffer.flush()
+    database.last_login_buffer.flush()
+    _drain_pool()
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The Flask app module, imported with its state files in a temporary directory"""
+    directory = tmp_path_factory.mktemp('app')
+    os.environ.update(
+        MINDFULBITE_ADMISSION_DIR=str(directory / 'admission'),
+        MINDFULBITE_TRACE_FILE=str(directory / 'traces.jsonl'),
+        MINDFULBITE_TRACE_SAMPLE_RATE='0',
+        MINDFULBITE_WARMUP_TOP_N='0'
+    )
+    original = database.DATABASE_NAME
+    database.DATABASE_NAME = str(directory / 'import.db')
+    try:
+        import app
+    finally:
+        database.DATABASE_NAME = original
+    return app
+
+@pytest.fixture
+def client(db, app_module, monkeypatch):
+    """Test client for the app, on the test's fresh database and with empty in-process indexes"""
+    from http_cache import ValidatorIndex
+    from query_normalizer import TrigramIndex
+
+    monkeypatch.setattr(app_module, 'http_validators', ValidatorIndex())
+    monkeypatch.setattr(app_module, 'food_name_index', TrigramIndex(threshold=app_module.food_name_index.threshold))
+    monkeypatch.setitem(app_module._food_name_index_state, 'last_id', 0)
+    monkeypatch.setitem(app_module._food_name_index_state, 'refreshed_at', 0.0)
+    monkeypatch.setattr(app_module, 'prefetch_alternatives', lambda food_data: False)
+    yield app_module.app.test_client()
+    app_module.food_popularity.flush()
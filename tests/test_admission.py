@@ -0,0 +1,54 @@
+import os
+
+import admission
+
+def test_reused_pid_does_not_inherit_a_dead_process_count(tmp_path):
+    path = str(tmp_path / 'in-flight.admission')
+    limit = admission.SharedConcurrencyLimit(path, limit=1, max_queue=0)
+    # A previous process with our PID died holding a slot
+    with limit._locked() as table:
+        admission._PROCESS.pack_into(table, admission._HEADER.size, os.getpid(), 1, 0, 1)
+
+    assert limit.try_acquire()
+    assert limit.usage() == (1, 0)
+    limit.release()
+    assert limit.usage() == (0, 0)
+
+def test_dead_process_slots_are_reclaimed(tmp_path):
+    limit = admission.SharedConcurrencyLimit(str(tmp_path / 'in-flight.admission'), limit=2, max_queue=0)
+    pid = os.fork()
+    if pid == 0:
+        limit.try_acquire()
+        limit.try_acquire()
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    assert limit.try_acquire()
+    assert limit.usage() == (1, 0)
+
+def test_full_limit_rejects_then_admits_after_release(tmp_path):
+    limit = admission.SharedConcurrencyLimit(str(tmp_path / 'in-flight.admission'), limit=1, max_queue=1,
+                                             poll_interval=0.001)
+    assert limit.acquire(0.01) == admission.ACQUIRED
+    assert limit.acquire(0.01) == admission.QUEUE_TIMEOUT
+    limit.release()
+    assert limit.acquire(0.01) == admission.ACQUIRED
+
+def test_token_bucket_allows_burst_then_asks_to_wait(tmp_path):
+    buckets = admission.SharedTokenBuckets(str(tmp_path / 'rate.admission'), rate=1, burst=2)
+    assert buckets.take('user:1') == 0.0
+    assert buckets.take('user:1') == 0.0
+    assert 0 < buckets.take('user:1') <= 1
+    assert buckets.take('user:2') == 0.0
+
+def test_controller_rejects_over_rate_with_retry_after(tmp_path):
+    controller = admission.AdmissionController(str(tmp_path), user_rate=1, user_burst=1, ip_rate=0, ip_burst=0,
+                                               max_in_flight=1, max_queue=0, queue_timeout=0)
+    assert controller.check_rate(7, '127.0.0.1') is None
+    rejection = controller.check_rate(7, '127.0.0.1')
+    assert (rejection.reason, rejection.status, rejection.retry_after) == ('user_rate', 429, 1)
+
+    assert controller.acquire() is None
+    assert controller.acquire().status == 503
+    controller.release()
+    assert controller.stats()['in_flight'] == 0
@@ -0,0 +1,164 @@
+import threading
+
+import pytest
+
+from llm_cache import normalize_query
+
+ALTERNATIVES = [{
+    'product_name': 'Cauliflower Crust Pizza', 'brands': 'Generic', 'categories': 'Frozen Foods',
+    'nutriments': {'energy-kcal_100g': 180, 'proteins_100g': 9, 'carbohydrates_100g': 20, 'fat_100g': 7,
+                   'fiber_100g': 3, 'sugars_100g': 2, 'sodium_100g': 0.4}
+}]
+
+@pytest.fixture
+def signed_in(client, db):
+    user_id = db.create_user('dana', 'dana@example.com', 'password123')['user_id']
+    client.set_cookie('session_token', db.create_session(user_id))
+    return client
+
+@pytest.fixture
+def canned_alternatives(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'get_healthier_alternatives_from_llm', lambda *args: ALTERNATIVES)
+
+def test_session_is_looked_up_once_per_request(signed_in, app_module, canned_alternatives, monkeypatch):
+    lookups = []
+    lookup = app_module.get_user_from_session
+
+    def counting_lookup(token):
+        lookups.append(token)
+        return lookup(token)
+
+    monkeypatch.setattr(app_module, 'get_user_from_session', counting_lookup)
+    response = signed_in.get('/api/find_alternatives', query_string={
+        'food_name': 'Pepperoni Pizza', 'calories': 300, 'category': 'Frozen Foods'
+    })
+    response.close()
+    assert response.status_code == 200
+    assert response.get_json()['count'] == 1
+    assert len(lookups) == 1
+
+def find_alternatives(client, **headers):
+    return client.get('/api/find_alternatives', headers=headers, query_string={
+        'food_name': 'Pepperoni Pizza', 'calories': 300, 'category': 'Frozen Foods'
+    })
+
+def test_not_modified_after_the_view_releases_the_admission_slot(client, app_module, canned_alternatives):
+    in_flight = app_module.admission.stats()['in_flight']
+    first = find_alternatives(client)
+    first.close()
+    etag = first.headers['ETag']
+
+    second = find_alternatives(client, **{'If-None-Match': etag})
+    second.close()
+    assert second.status_code == 304
+    assert second.headers['ETag'] == etag
+    assert second.get_data() == b''
+    assert app_module.admission.stats()['in_flight'] == in_flight
+
+def pizza(name, protein=12):
+    return {'product_name': name, 'brands': 'Generic', 'categories': 'Frozen Foods',
+            'nutriments': {'energy-kcal_100g': 300, 'proteins_100g': protein, 'carbohydrates_100g': 33,
+                           'fat_100g': 12, 'fiber_100g': 2, 'sugars_100g': 4, 'sodium_100g': 0.6}}
+
+def add_food(db, food):
+    db.upsert_food(normalize_query(food['product_name']), food, 'nutrition')
+
+def search(client, **headers):
+    response = client.get('/api/food_search', query_string={'query': 'pepperoni pizza'}, headers=headers)
+    response.close()
+    return response
+
+def test_food_search_304_survives_unrelated_catalog_writes(client, db, app_module):
+    add_food(db, pizza('Pepperoni Pizza'))
+    first = search(client)
+    assert first.status_code == 200 and first.get_json()['source'] == 'catalog'
+    etag = first.headers['ETag']
+    assert search(client, **{'If-None-Match': etag}).status_code == 304  # remembers the version
+
+    add_food(db, pizza('Green Salad'))
+    hits = app_module.http_validators.stats()['precondition_hits']
+    second = search(client, **{'If-None-Match': etag})
+    assert second.status_code == 304
+    assert app_module.http_validators.stats()['precondition_hits'] == hits + 1  # the view did not run
+
+def test_unconditional_requests_skip_the_version_lookup(client, db, app_module, monkeypatch):
+    add_food(db, pizza('Pepperoni Pizza'))
+    lookups = []
+    monkeypatch.setattr(app_module, 'response_version', lambda *args: lookups.append(args))
+
+    response = search(client)
+    assert response.status_code == 200 and response.headers['ETag']
+    assert not lookups
+
+def test_food_search_version_follows_matching_rows(client, db, app_module):
+    add_food(db, pizza('Pepperoni Pizza'))
+    etag = search(client).headers['ETag']
+
+    add_food(db, pizza('Pepperoni Pizza Slices'))
+    response = search(client, **{'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [food['product_name'] for food in response.get_json()['products']] == ['Pepperoni Pizza', 'Pepperoni Pizza Slices']
+
+    etag = response.headers['ETag']
+    add_food(db, pizza('Pepperoni Pizza', protein=15))
+    response = search(client, **{'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['products'][0]['nutriments']['proteins_100g'] == 15
+
+def test_alternatives_version_follows_the_original_row(client, db, app_module):
+    add_food(db, pizza('Pepperoni Pizza'))
+    app_module.alternatives_graph.store('Pepperoni Pizza', 300, 'Frozen Foods', ALTERNATIVES)
+    first = find_alternatives(client)
+    first.close()
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    cached = find_alternatives(client, **{'If-None-Match': etag})
+    cached.close()
+    assert cached.status_code == 304
+
+    add_food(db, pizza('Pepperoni Pizza', protein=20))
+    changed = find_alternatives(client, **{'If-None-Match': etag})
+    changed.close()
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+def test_stream_joins_a_running_prefetch_instead_of_calling_the_llm_again(client, app_module, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    fetches = []
+
+    def slow_fetch(*args):
+        fetches.append(args)
+        started.set()
+        release.wait(5)
+        return ALTERNATIVES
+
+    monkeypatch.setattr(app_module, '_fetch_healthier_alternatives_from_llm', slow_fetch)
+    monkeypatch.setattr(app_module, 'stream_healthier_alternatives_from_llm',
+                        lambda *args: pytest.fail('the stream must join the prefetch'))
+    key = app_module.alternatives_request_key('Pizza', '266', 'Frozen Foods')
+    assert app_module.alternatives_prefetcher.submit(key, 'Pizza', '266', 'Frozen Foods')
+    assert started.wait(5)
+    threading.Timer(0.1, release.set).start()
+
+    response = client.get('/api/find_alternatives/stream', query_string={
+        'food_name': 'Pizza', 'calories': 266, 'category': 'Frozen Foods'})
+    body = response.get_data(as_text=True)
+    response.close()
+    assert 'Cauliflower Crust Pizza' in body and '"count": 1' in body
+    assert len(fetches) == 1
+    # The running job was joined, not claimed, so it is still there for its own claim
+    assert app_module.alternatives_prefetcher.claim(key).result(5) == ALTERNATIVES
+
+def test_food_search_does_not_answer_a_query_with_a_longer_dish(client, db, app_module, monkeypatch):
+    add_food(db, pizza('Apple Pie'))
+    apple = {'product_name': 'Apple', 'brands': 'Generic', 'categories': 'Fruits',
+             'nutriments': {'energy-kcal_100g': 52, 'proteins_100g': 0.3, 'carbohydrates_100g': 14,
+                            'fat_100g': 0.2, 'fiber_100g': 2.4, 'sugars_100g': 10, 'sodium_100g': 0}}
+    monkeypatch.setattr(app_module, 'get_food_nutrition_from_llm', lambda query: apple)
+
+    response = client.get('/api/food_search', query_string={'query': 'apple'})
+    body = response.get_json()
+    response.close()
+    assert body['source'] != 'catalog'
+    assert body['products'][0]['product_name'] == 'Apple'
@@ -0,0 +1,62 @@
+import pytest
+
+from comparison_engine import ComparisonEngine
+
+def food(name, calories, protein=5, sugars=5, fiber=2, grade=None):
+    result = {'product_name': name, 'nutriments': {
+        'energy-kcal_100g': calories, 'proteins_100g': protein, 'carbohydrates_100g': 30, 'fat_100g': 10,
+        'fiber_100g': fiber, 'sugars_100g': sugars, 'sodium_100g': 0.5}}
+    if grade:
+        result['nutriscore_grade'] = grade
+    return result
+
+ORIGINAL = food('Pepperoni Pizza', 300, protein=12, sugars=4)
+ALTERNATIVES = [
+    food('Cheese Pizza', 280, protein=12, sugars=4),
+    food('Protein Wrap', 250, protein=30, sugars=3),
+    food('Veggie Flatbread', 180, protein=8, sugars=3, fiber=5),
+]
+
+def names(ranked):
+    return [alt['product_name'] for alt in ranked]
+
+def test_presets_rank_by_their_own_weights():
+    engine = ComparisonEngine()
+
+    ranked, comparison = engine.rank(ORIGINAL, ALTERNATIVES, 2000, 'calories')
+    assert names(ranked) == ['Veggie Flatbread', 'Protein Wrap', 'Cheese Pizza']
+    assert [item['rank'] for item in comparison['items']] == [1, 2, 3]
+    assert [item['calorie_delta'] for item in comparison['items']] == [-120, -50, -20]
+
+    ranked, comparison = engine.rank(ORIGINAL, ALTERNATIVES, 2000, 'protein')
+    assert names(ranked)[0] == 'Protein Wrap'
+    assert comparison['items'][0]['macro_deltas']['protein'] == 18
+
+    with pytest.raises(ValueError):
+        engine.rank(ORIGINAL, ALTERNATIVES, 2000, 'cheapest')
+
+def test_profile_reports_its_own_daily_calories_while_sharing_the_bucket_ranking():
+    engine = ComparisonEngine()
+
+    ranked, comparison = engine.rank(ORIGINAL, ALTERNATIVES, 2000, 'calories')
+    assert comparison['profile'] == {'personalized': True, 'daily_calories': 2000}
+    assert comparison['items'][0]['daily_budget_share'] == round(180 / 2000, 4)
+
+    nearby, nearby_comparison = engine.rank(ORIGINAL, ALTERNATIVES, 2080, 'calories')
+    assert engine.stats()['hits'] == 1  # same 100 kcal bucket
+    assert names(nearby) == names(ranked)
+    assert nearby_comparison['profile']['daily_calories'] == 2080
+    assert nearby_comparison['original']['daily_budget_share'] == round(300 / 2080, 4)
+
+def test_weight_change_scales_with_the_daily_budget():
+    engine = ComparisonEngine()
+
+    _, default = engine.rank(ORIGINAL, ALTERNATIVES, None, 'calories')
+    assert default['profile'] == {'personalized': False, 'daily_calories': 2000}
+    flatbread = default['items'][0]
+    assert flatbread['weekly_weight_change_kg'] == round(-120 * 7 / 7700, 3)
+    assert flatbread['yearly_weight_change_kg'] == round(-120 * 365 / 7700, 2)
+
+    _, doubled = engine.rank(ORIGINAL, ALTERNATIVES, 4000, 'calories')
+    assert doubled['items'][0]['yearly_weight_change_kg'] == round(-120 * 365 / 7700 / 2, 2)
+    assert doubled['items'][0]['daily_budget_share'] == round(180 / 4000, 4)
@@ -0,0 +1,34 @@
+import database
+
+class RecordingHistogram:
+    def __init__(self):
+        self.functions = []
+
+    def labels(self, function):
+        self.functions.append(function)
+        return self
+
+    def observe(self, value):
+        pass
+
+def test_statements_are_timed_under_the_helper_that_ran_them(db, monkeypatch):
+    histogram = RecordingHistogram()
+    monkeypatch.setattr(database, 'db_query_duration', histogram)
+
+    db.upsert_food('pizza', {'product_name': 'Pizza'}, 'nutrition')
+    db.get_food('pizza')
+    assert set(histogram.functions) == {'upsert_food', 'get_food'}
+
+def test_helpers_sharing_a_request_connection_keep_their_own_labels(db, monkeypatch):
+    histogram = RecordingHistogram()
+    monkeypatch.setattr(database, 'db_query_duration', histogram)
+
+    db.begin_request_scope()
+    try:
+        user_id = db.create_user('erin', 'erin@example.com', 'password123')['user_id']
+        db.get_user_profile(user_id)
+    finally:
+        db.end_request_scope()
+    db.last_login_buffer.put(user_id, '2026-01-01 00:00:00')
+    db.last_login_buffer.flush()
+    assert set(histogram.functions) == {'create_user', 'get_user_profile', 'flush_last_login'}
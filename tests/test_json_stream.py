@@ -0,0 +1,32 @@
+import pytest
+
+from json_stream import JSONArrayStreamParser
+
+TEXT = '```json\n[\n  {"product_name": "Cauliflower {crust} \\"pizza\\"", "nutriments": {"energy-kcal_100g": 180}},\n  {"product_name": "Veggie wrap"}\n]\n```'
+
+def feed_all(parser, chunks):
+    objects = []
+    for chunk in chunks:
+        objects.extend(parser.feed(chunk))
+    return objects
+
+@pytest.mark.parametrize('size', [1, 2, 7, len(TEXT)])
+def test_objects_are_complete_whatever_the_chunking(size):
+    parser = JSONArrayStreamParser()
+    objects = feed_all(parser, [TEXT[i:i + size] for i in range(0, len(TEXT), size)])
+    assert objects == [
+        {'product_name': 'Cauliflower {crust} "pizza"', 'nutriments': {'energy-kcal_100g': 180}},
+        {'product_name': 'Veggie wrap'}
+    ]
+    assert parser.finished
+
+def test_each_object_is_returned_as_soon_as_it_closes():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"a": 1}, {"b"') == [{'a': 1}]
+    assert parser.feed(': 2}') == [{'b': 2}]
+    assert not parser.finished
+
+def test_malformed_objects_are_skipped_and_text_after_the_array_ignored():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"a": 1,}, {"b": 2}] [{"c": 3}]') == [{'b': 2}]
+    assert parser.finished
@@ -0,0 +1,47 @@
+import time
+
+from llm_cache import LLMResultCache, make_cache_key
+
+def make_cache(**kwargs):
+    return LLMResultCache('nutrition', 'model', 1, **{'ttl_seconds': 60, **kwargs})
+
+def test_queries_differing_only_in_spelling_share_a_key():
+    assert make_cache_key('nutrition', ['  Apple  PIE '], 'model', 1) == make_cache_key('nutrition', ['apple pie'], 'model', 1)
+    assert make_cache_key('nutrition', ['apple pie'], 'model', 2) != make_cache_key('nutrition', ['apple pie'], 'model', 1)
+
+def test_memory_tier_evicts_least_recently_used(db):
+    cache = make_cache(max_memory_entries=2, persistent=False)
+    cache.set('a', 'apple')
+    cache.set('b', 'bread')
+    assert cache.get('apple') == 'a'  # bread is now the oldest
+    cache.set('c', 'cheese')
+    assert cache.get('bread') is None
+    assert cache.get('apple') == 'a' and cache.get('cheese') == 'c'
+    assert cache.stats()['memory_entries'] == 2
+
+def test_expired_entries_are_misses_in_both_tiers(db, monkeypatch):
+    cache = make_cache(ttl_seconds=10)
+    cache.set('a', 'apple')
+    later = time.time() + 11
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert cache.get('apple') is None
+    assert cache.stats()['memory_entries'] == 0
+
+def test_sqlite_tier_answers_after_memory_is_cleared(db):
+    cache = make_cache()
+    cache.set({'product_name': 'Apple'}, 'apple')
+    cache.clear_memory()
+    assert cache.get('apple') == {'product_name': 'Apple'}
+    assert cache.stats()['memory_entries'] == 1  # promoted back into memory
+    assert make_cache().get('apple') == {'product_name': 'Apple'}  # another process's cache
+
+def test_hits_and_misses_are_counted_per_tier(db):
+    cache = make_cache()
+    assert cache.get('apple') is None
+    cache.set('a', 'apple')
+    assert cache.get('apple') == 'a'
+    cache.clear_memory()
+    assert cache.get('apple') == 'a'
+    stats = cache.stats()
+    assert (stats['memory_hits'], stats['persistent_hits'], stats['misses']) == (1, 1, 1)
+    assert stats['hit_rate'] == round(2 / 3, 4)
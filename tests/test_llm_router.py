@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+import llm_router
+from llm_router import LLMRouteTimeout, ModelRouter
+
+class FakeClient:
+    """Stands in for the OpenAI client: each model maps to a function of the call's kwargs"""
+
+    def __init__(self, behaviours):
+        self.behaviours = behaviours
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def with_options(self, **options):
+        return self
+
+    def _create(self, model, **kwargs):
+        self.calls.append(model)
+        return self.behaviours[model]()
+
+def answer(text, delay=0.0):
+    def respond():
+        time.sleep(delay)
+        return SimpleNamespace(text=text, usage=None)
+    return respond
+
+def fail(delay=0.0):
+    def respond():
+        time.sleep(delay)
+        raise RuntimeError('upstream error')
+    return respond
+
+def test_primary_answers():
+    client = FakeClient({'a': answer('A'), 'b': answer('B')})
+    router = ModelRouter('test', client, ['a', 'b'], timeout=2)
+    assert router.create(messages=[]).text == 'A'
+    assert client.calls == ['a']
+
+def test_failover_after_error():
+    client = FakeClient({'a': fail(), 'b': answer('B')})
+    router = ModelRouter('test', client, ['a', 'b'], timeout=2)
+    assert router.create(messages=[]).text == 'B'
+    assert router.stats()['failovers'] == 1
+
+def test_all_models_fail_raises_last_error():
+    router = ModelRouter('test', FakeClient({'a': fail(), 'b': fail()}), ['a', 'b'], timeout=2)
+    with pytest.raises(RuntimeError):
+        router.create(messages=[])
+
+def test_deadline_after_an_error_is_a_timeout():
+    # The primary fails, the fallback is still running when the deadline passes
+    router = ModelRouter('test', FakeClient({'a': fail(), 'b': answer('B', delay=1)}), ['a', 'b'], timeout=0.2)
+    with pytest.raises(LLMRouteTimeout):
+        router.create(messages=[])
+    assert router.stats()['timeouts'] == 1
+
+def test_hedge_wins_over_slow_primary():
+    client = FakeClient({'a': answer('A', delay=1), 'b': answer('B')})
+    router = ModelRouter('test', client, ['a', 'b'], timeout=2, default_hedge_delay=0.05, min_hedge_delay=0.05)
+    assert router.create(messages=[]).text == 'B'
+    assert router.stats()['hedges'] == 1
+
+def test_queued_primary_is_not_hedged(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(llm_router, '_executor', executor)
+    release = threading.Event()
+    executor.submit(release.wait, 5)  # the only router thread is busy
+    threading.Timer(0.3, release.set).start()
+
+    client = FakeClient({'a': answer('A', delay=0.02), 'b': answer('B')})
+    router = ModelRouter('test', client, ['a', 'b'], timeout=2, default_hedge_delay=0.1, min_hedge_delay=0.1)
+    assert router.create(messages=[]).text == 'A'
+    assert router.stats()['hedges'] == 0
+    assert client.calls == ['a']
+    executor.shutdown()
@@ -0,0 +1,48 @@
+import logging
+import multiprocessing
+import queue
+import threading
+
+import tracing
+from log_config import DroppingQueueHandler
+
+def make_record(level, msg):
+    return logging.LogRecord('test', level, __file__, 0, msg, None, None)
+
+def test_full_queue_drops_info_but_keeps_errors():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    handler.enqueue(make_record(logging.INFO, 'first'))
+    handler.enqueue(make_record(logging.INFO, 'dropped'))
+    assert handler.dropped == 1
+
+    writer = threading.Thread(target=handler.enqueue, args=(make_record(logging.ERROR, 'kept'),))
+    writer.start()
+    writer.join(0.2)
+    assert writer.is_alive()  # waits for room instead of dropping
+
+    assert handler.queue.get(timeout=1).getMessage() == 'first'
+    writer.join(5)
+    assert not writer.is_alive()
+    assert handler.queue.get(timeout=1).getMessage() == 'kept'
+    assert handler.dropped == 1
+
+def write_lines(path, writer_id):
+    handler = tracing.SharedRotatingFileHandler(path, maxBytes=300, backupCount=1000)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    for i in range(200):
+        handler.handle(make_record(logging.INFO, f'{writer_id}-{i:03d}'))
+    handler.close()
+
+def test_processes_sharing_a_trace_file_lose_no_lines_on_rotation(tmp_path):
+    path = str(tmp_path / 'traces.jsonl')
+    writers = [multiprocessing.Process(target=write_lines, args=(path, n)) for n in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join(30)
+
+    lines = []
+    for file in tmp_path.glob('traces.jsonl*'):
+        if not file.name.endswith('.lock'):
+            lines.extend(file.read_text().splitlines())
+    assert sorted(lines) == sorted(f'{n}-{i:03d}' for n in range(4) for i in range(200))
@@ -0,0 +1,44 @@
+import logging
+
+import database
+
+def schema(conn):
+    return sorted(tuple(row) for row in conn.execute('SELECT type, name, sql FROM sqlite_master'))
+
+def test_rerunning_migrations_is_a_no_op(db):
+    conn = db._connect()
+    try:
+        before = schema(conn)
+        assert db.run_migrations(conn) == []
+        assert schema(conn) == before
+        assert db.get_schema_version(conn) == db.MIGRATIONS[-1][0]
+    finally:
+        conn.close()
+
+def test_upgrading_a_baseline_database_matches_a_fresh_one(db, tmp_path, monkeypatch, caplog):
+    fresh = db._connect()
+    try:
+        expected = schema(fresh)
+    finally:
+        fresh.close()
+
+    # A database from before versioned migrations: the original tables at user_version 0,
+    # with the duplicate profile rows the unique index has to clear out
+    monkeypatch.setattr(database, 'DATABASE_NAME', str(tmp_path / 'baseline.db'))
+    conn = database._connect()
+    try:
+        database._migration_001_baseline(conn)
+        conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('bo', 'bo@example.com', 'x')")
+        conn.execute('INSERT INTO user_profiles (user_id, weight) VALUES (1, 80)')
+        conn.execute('INSERT INTO user_profiles (user_id, weight) VALUES (1, 78)')
+        conn.commit()
+
+        with caplog.at_level(logging.WARNING, logger='database'):
+            applied = database.run_migrations(conn)
+        assert applied == [version for version, migration in database.MIGRATIONS]
+        assert database.get_schema_version(conn) == database.MIGRATIONS[-1][0]
+        assert schema(conn) == expected
+        assert [row['weight'] for row in conn.execute('SELECT weight FROM user_profiles')] == [78]
+        assert "'weight': 80.0" in caplog.text
+    finally:
+        conn.close()
@@ -0,0 +1,58 @@
+import hashlib
+import threading
+
+import pytest
+
+import database
+import passwords
+
+def test_hash_round_trip():
+    encoded = passwords.hash_password('secret')
+    assert encoded.startswith(passwords.default_hasher.name + '$')
+    assert passwords.verify_password('secret', encoded)
+    assert not passwords.verify_password('wrong', encoded)
+    assert not passwords.needs_rehash(encoded)
+
+def test_legacy_sha256_verifies_and_needs_rehash():
+    legacy = hashlib.sha256(b'secret').hexdigest()
+    assert passwords.verify_password('secret', legacy)
+    assert passwords.needs_rehash(legacy)
+
+def test_pool_runs_on_caller_thread():
+    pool = passwords.HashingPool(workers=2, queue_size=0)
+    assert pool.run(threading.current_thread) is threading.current_thread()
+
+def test_pool_rejects_when_saturated():
+    pool = passwords.HashingPool(workers=1, queue_size=0, queue_timeout=0.05)
+    started, release = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(5)
+
+    holder = threading.Thread(target=pool.run, args=(hold,))
+    holder.start()
+    started.wait(5)
+    with pytest.raises(passwords.PasswordHashingBusy):
+        pool.run(lambda: None)
+    release.set()
+    holder.join()
+    assert pool.stats()['rejected'] == 1
+    assert pool.run(lambda: 'ok') == 'ok'
+
+def test_login_rehashes_legacy_hash_in_background(db):
+    user_id = db.create_user('bob', 'bob@example.com', 'hunter22')['user_id']
+    conn = db.get_db_connection()
+    conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (hashlib.sha256(b'hunter22').hexdigest(), user_id))
+    conn.commit()
+    conn.close()
+
+    assert db.authenticate_user('bob', 'hunter22')['success']
+    database._rehash_executor.submit(lambda: None).result(timeout=10)
+    database.password_hash_buffer.flush()
+
+    conn = db.get_db_connection()
+    stored = conn.execute('SELECT password_hash FROM users WHERE id = ?', (user_id,)).fetchone()[0]
+    conn.close()
+    assert not passwords.needs_rehash(stored)
+    assert db.authenticate_user('bob', 'hunter22')['success']
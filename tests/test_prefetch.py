@@ -0,0 +1,47 @@
+import asyncio
+
+from prefetch import AsyncPrefetcher, Prefetcher
+from singleflight import AsyncSingleFlight
+
+def test_async_prefetch_shares_the_call_with_a_concurrent_request():
+    flight = AsyncSingleFlight('alternatives')
+    calls = []
+
+    async def generate(name):
+        async def fetch():
+            calls.append(name)
+            await asyncio.sleep(0.05)
+            return [f'{name} light']
+        return await flight.do(name, fetch)
+
+    async def scenario():
+        prefetcher = AsyncPrefetcher('alternatives', generate)
+        assert prefetcher.submit('pizza', 'pizza')
+        await asyncio.sleep(0)  # the prefetch is in flight when the request arrives
+        direct = await generate('pizza')
+        prefetched = await prefetcher.claim('pizza')
+        return direct, prefetched, prefetcher.stats()
+
+    direct, prefetched, stats = asyncio.run(scenario())
+    assert calls == ['pizza']
+    assert direct == prefetched == ['pizza light']
+    assert stats['claimed'] == 1 and stats['pending'] == 0
+
+def test_async_prefetch_cancels_unclaimed_jobs():
+    async def scenario():
+        prefetcher = AsyncPrefetcher('alternatives', asyncio.sleep, claim_ttl=0)
+        prefetcher.submit('slow', 10)
+        await asyncio.sleep(0.01)
+        return prefetcher.claim('slow'), prefetcher.stats()
+
+    task, stats = asyncio.run(scenario())
+    assert task is None
+    assert stats['cancelled'] == 1
+
+def test_finished_unclaimed_jobs_do_not_block_new_prefetches():
+    prefetcher = Prefetcher('alternatives', lambda value: value, max_workers=1, max_pending=1)
+    assert prefetcher.submit('a', 1)
+    prefetcher._jobs['a'].future.result(5)  # finished, parked until claimed
+    assert prefetcher.submit('b', 2)
+    assert prefetcher.claim('a').result() == 1
+    assert prefetcher.stats()['rejected'] == 0
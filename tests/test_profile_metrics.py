@@ -0,0 +1,72 @@
+import itertools
+
+import pytest
+
+from profile_metrics import profile_metrics
+
+PROFILES = [
+    (70, 175, 30, 'male', 'moderate'),
+    (58.5, 162, 41, 'female', 'light'),
+    (92.3, 181.5, 55, 'male', 'very_active'),
+    (64, 170, 29, 'other', 'sedentary'),
+    (80, 180, 35, 'female', None),  # default activity multiplier
+    (70, 175, None, 'male', 'active'),  # no age: BMI only
+    (70, 175, 30, None, 'active'),  # no gender: BMI only
+    (70, None, 30, 'male', 'active'),  # no height: nothing
+    (None, None, None, None, None),
+]
+
+def reference_metrics(weight, height, age, gender, activity_level):
+    # The formulas update_user_profile used before the NumPy implementation
+    bmi = daily_calories = None
+    if weight and height:
+        bmi = round(weight / (height / 100) ** 2, 1)
+    if weight and height and age and gender:
+        offset = 5 if gender.lower() == 'male' else -161
+        multipliers = {'sedentary': 1.2, 'light': 1.375, 'moderate': 1.55, 'active': 1.725, 'very_active': 1.9}
+        daily_calories = round((10 * weight + 6.25 * height - 5 * age + offset) * multipliers.get(activity_level, 1.55))
+    return bmi, daily_calories
+
+@pytest.mark.parametrize('profile', PROFILES + [(92.3, 181.5, 55, 'Male', 'unknown')])
+def test_scalar_metrics_match_the_original_formulas(profile):
+    assert profile_metrics(*profile) == reference_metrics(*profile)
+
+def test_scalar_metrics_round_like_python_across_a_grid():
+    for weight, height, age in itertools.product(range(40, 160, 7), range(140, 210, 3), (18, 33, 70)):
+        for weight in (weight, weight + 0.25, weight + 0.45):
+            profile = (weight, height, age, 'female', 'active')
+            assert profile_metrics(*profile) == reference_metrics(*profile), profile
+
+def insert_profiles(db, profiles):
+    conn = db.get_db_connection()
+    try:
+        conn.executemany('''
+            INSERT INTO user_profiles (user_id, weight, height, age, gender, activity_level, bmi, daily_calories)
+            VALUES (?, ?, ?, ?, ?, ?, 1, 1)
+        ''', [(user_id,) + profile for user_id, profile in enumerate(profiles, start=1)])
+        conn.commit()
+    finally:
+        conn.close()
+
+def stored_metrics(db):
+    conn = db.get_db_connection()
+    try:
+        return [(row['bmi'], row['daily_calories'])
+                for row in conn.execute('SELECT bmi, daily_calories FROM user_profiles ORDER BY user_id')]
+    finally:
+        conn.close()
+
+def test_bulk_recompute_matches_the_scalar_path_and_handles_partial_profiles(db):
+    insert_profiles(db, PROFILES)
+
+    assert db.recompute_profile_metrics(chunk_size=4) == (len(PROFILES), len(PROFILES))
+    assert stored_metrics(db) == [profile_metrics(*profile) for profile in PROFILES]
+    assert db.recompute_profile_metrics(chunk_size=4) == (len(PROFILES), 0)  # nothing left to change
+
+def test_recompute_command_reports_the_counts(db, app_module):
+    insert_profiles(db, PROFILES[:3])
+
+    result = app_module.app.test_cli_runner().invoke(args=['recompute-profile-metrics', '--chunk-size', '2'])
+    assert result.exit_code == 0
+    assert 'Recomputed 3 profiles (3 changed)' in result.output
+    assert stored_metrics(db) == [profile_metrics(*profile) for profile in PROFILES[:3]]
@@ -0,0 +1,59 @@
+import pytest
+
+from query_normalizer import TrigramIndex, canonicalize_query, edit_similarity
+
+CATALOG = [
+    'chicken stew', 'apple juice', 'chicken burger', 'chocolate cake', 'chicken butter masala',
+    'chicken soup', 'banana', 'spaghetti bolognese', 'apple pie', 'apple'
+]
+
+@pytest.fixture
+def index():
+    index = TrigramIndex()
+    for name in CATALOG:
+        index.add(canonicalize_query(name))
+    return index
+
+def test_canonicalize_query():
+    assert canonicalize_query('French Fries ') == 'french fry'
+    assert canonicalize_query('french-fries') == 'french fry'
+    assert canonicalize_query('Aubergines') == 'eggplant'
+
+def test_edit_similarity():
+    assert edit_similarity('banana', 'banana') == 1.0
+    assert edit_similarity('chiken', 'chicken') == pytest.approx(6 / 7)
+    assert edit_similarity('soup', 'stew') < 0.5
+
+def test_exact_name(index):
+    assert index.lookup('chicken soup') == ('chicken soup', 1.0)
+
+@pytest.mark.parametrize('query, expected', [
+    ('chiken soup', 'chicken soup'),
+    ('bananna', 'banana'),
+    ('spagetti bolognese', 'spaghetti bolognese'),
+    ('chocolate caek', None),  # transposition in a short word is two edits
+])
+def test_typos_within_a_word(index, query, expected):
+    match = index.lookup(query)
+    assert (match[0] if match else None) == expected
+
+@pytest.mark.parametrize('query', [
+    'chicken noodle',
+    'pineapple juice',
+    'chicken burrito',
+    'chocolate cookie',
+    'chicken tikka masala',
+    'apple tart',
+])
+def test_different_words_do_not_match(query):
+    # Each query shares a long word with a catalog name but differs in another word
+    index = TrigramIndex()
+    for name in CATALOG:
+        if name != canonicalize_query(query):
+            index.add(name)
+    assert index.lookup(canonicalize_query(query)) is None
+
+def test_word_count_must_match(index):
+    assert index.lookup(canonicalize_query('Apple Pies')) == ('apple pie', 1.0)
+    assert index.lookup('aple') == ('apple', 0.8)
+    assert index.lookup('apple tarte') is None
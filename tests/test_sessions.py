@@ -0,0 +1,92 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import database
+
+PUBLISHED_SECRET = 'mindfulbite-session-secret-change-in-production'
+
+@pytest.fixture
+def user(db):
+    result = db.create_user('alice', 'alice@example.com', 'correct horse battery')
+    assert result['success']
+    return {'id': result['user_id'], 'username': 'alice', 'email': 'alice@example.com'}
+
+@pytest.fixture
+def signed_mode(monkeypatch):
+    monkeypatch.setattr(database, 'SESSION_MODE', 'signed')
+    monkeypatch.setattr(database, 'SESSION_SECRET', 'test-secret')
+    database._revoked_tokens.clear()
+    database._revocation_state.update(last_id=0, refreshed_at=0.0, compacted_at=0.0)
+
+def forge(payload, secret):
+    message = database.SIGNED_TOKEN_PREFIX + database._b64encode(json.dumps(payload).encode())
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(database, 'SESSION_SECRET', secret)
+        return f"{message}.{database._sign(message)}"
+
+def claims(user):
+    return {'uid': user['id'], 'usr': user['username'], 'eml': user['email'],
+            'exp': int(time.time()) + 3600, 'jti': 'forged'}
+
+def test_signed_token_rejected_in_db_mode(user):
+    assert database.SESSION_MODE == 'db'
+    for secret in (PUBLISHED_SECRET, database.SESSION_SECRET, ''):
+        assert database.get_user_from_session(forge(claims(user), secret)) is None
+
+def test_db_session_round_trip(user):
+    token = database.create_session(user['id'])
+    assert database.get_user_from_session(token) == user
+    assert database.delete_session(token)
+    assert database.get_user_from_session(token) is None
+
+def test_signed_session_round_trip(user, signed_mode):
+    token = database.create_session(user['id'], user)
+    assert token.startswith(database.SIGNED_TOKEN_PREFIX)
+    assert database.get_user_from_session(token) == user
+
+    assert database.delete_session(token)
+    assert database.get_user_from_session(token) is None
+
+def test_signed_mode_rejects_other_secrets(user, signed_mode):
+    assert database.get_user_from_session(forge(claims(user), PUBLISHED_SECRET)) is None
+    token = database.create_session(user['id'], user)
+    assert database.get_user_from_session(token[:-2] + ('AA' if not token.endswith('AA') else 'BB')) is None
+
+@pytest.mark.parametrize('payload', [[1, 2], 'admin', 42, {'uid': 1}, {'uid': 1, 'usr': 'a', 'eml': 'e', 'exp': 'x', 'jti': 'j'}])
+def test_signed_mode_rejects_malformed_payloads(db, signed_mode, payload):
+    assert database.get_user_from_session(forge(payload, 'test-secret')) is None
+    assert database.delete_session(forge(payload, 'test-secret'))
+
+def test_expired_signed_token(user, signed_mode):
+    assert database.get_user_from_session(forge(dict(claims(user), exp=int(time.time()) - 1), 'test-secret')) is None
+
+def test_revocations_compacted_by_sweeper_not_reads(user, signed_mode):
+    token = database.create_session(user['id'], user)
+    database.delete_session(token)
+    conn = database.get_db_connection()
+    conn.execute('UPDATE revoked_sessions SET expires_at = ?', (time.time() - 1,))
+    conn.commit()
+    conn.close()
+
+    database.refresh_revocations(force=True)
+    conn = database.get_db_connection()
+    assert conn.execute('SELECT COUNT(*) FROM revoked_sessions').fetchone()[0] == 1
+    conn.close()
+
+    database.sweep_expired_sessions()
+    conn = database.get_db_connection()
+    assert conn.execute('SELECT COUNT(*) FROM revoked_sessions').fetchone()[0] == 0
+    conn.close()
+
+def test_signed_mode_requires_secret(tmp_path):
+    env = dict(os.environ, MINDFULBITE_SESSION_MODE='signed')
+    env.pop('MINDFULBITE_SESSION_SECRET', None)
+    result = subprocess.run([sys.executable, '-c', 'import database'], cwd=os.path.dirname(database.__file__),
+                            env=env, capture_output=True, text=True)
+    assert result.returncode != 0
+    assert 'MINDFULBITE_SESSION_SECRET' in result.stderr
@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight, SingleFlightError
+
+def run_concurrently(flight, key, fn, callers):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight('test')
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        return {'answer': 42}
+
+    results, errors = run_concurrently(flight, 'pizza', fetch, 5)
+    assert len(calls) == 1
+    assert results == [{'answer': 42}] * 5 and not errors
+    assert flight.stats()['in_flight'] == 0
+
+def test_followers_get_the_leaders_error():
+    flight = SingleFlight('test')
+
+    def fail():
+        time.sleep(0.1)
+        raise ValueError('upstream down')
+
+    results, errors = run_concurrently(flight, 'pizza', fail, 3)
+    assert not results
+    assert [str(e) for e in errors] == ['upstream down'] * 3
+
+def test_cross_process_follower_reads_the_published_result(db):
+    leader = SingleFlight('test', cross_process=True, poll_interval=0.01)
+    follower = SingleFlight('test', cross_process=True, poll_interval=0.01)  # another process's instance
+    started, release = threading.Event(), threading.Event()
+
+    def fetch():
+        started.set()
+        release.wait(5)
+        return ['light pizza']
+
+    thread = threading.Thread(target=leader.do, args=('pizza', fetch))
+    thread.start()
+    assert started.wait(5)
+    threading.Timer(0.1, release.set).start()
+    assert follower.do('pizza', lambda: pytest.fail('follower must not call')) == ['light pizza']
+    thread.join(5)
+    assert follower.stats()['remote_followers'] == 1
+
+def test_cross_process_follower_gets_the_leaders_failure(db):
+    leader = SingleFlight('test', cross_process=True, poll_interval=0.01)
+    follower = SingleFlight('test', cross_process=True, poll_interval=0.01)
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('model unavailable')
+
+    leader_errors = []
+
+    def lead():
+        try:
+            leader.do('pizza', fail)
+        except RuntimeError as e:
+            leader_errors.append(str(e))
+
+    thread = threading.Thread(target=lead)
+    thread.start()
+    assert started.wait(5)
+    threading.Timer(0.1, release.set).start()
+    with pytest.raises(SingleFlightError, match='model unavailable'):
+        follower.do('pizza', lambda: pytest.fail('follower must not call'))
+    thread.join(5)
+    assert leader_errors == ['model unavailable']
+
+def test_async_callers_share_one_call_and_survive_a_cancelled_follower():
+    flight = AsyncSingleFlight('test')
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'done'
+
+    async def scenario():
+        impatient = asyncio.ensure_future(flight.do('pizza', fetch))
+        patient = [asyncio.ensure_future(flight.do('pizza', fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        impatient.cancel()
+        return await asyncio.gather(*patient)
+
+    assert asyncio.run(scenario()) == ['done'] * 3
+    assert len(calls) == 1
+    assert flight.stats()['in_flight'] == 0
+
+def test_stream_leader_yields_progressively_and_followers_get_the_full_list():
+    flight = SingleFlight('test')
+    release = threading.Event()
+    calls = []
+
+    def generate():
+        calls.append(1)
+        yield 'salad'
+        release.wait(5)
+        yield 'soup'
+
+    leader = flight.stream('pizza', generate)
+    assert next(leader) == 'salad'
+
+    followers = []
+    threads = [
+        threading.Thread(target=lambda: followers.append(flight.do('pizza', generate))),
+        threading.Thread(target=lambda: followers.append(list(flight.stream('pizza', generate))))
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    assert not followers
+    release.set()
+    assert list(leader) == ['soup']
+    for thread in threads:
+        thread.join(5)
+    assert followers == [['salad', 'soup']] * 2
+    assert len(calls) == 1
+    assert flight.stats()['in_flight'] == 0
+
+def test_stream_finishes_for_followers_when_the_leaders_consumer_goes_away():
+    flight = SingleFlight('test')
+
+    def generate():
+        yield from ['salad', 'soup', 'wrap']
+
+    leader = flight.stream('pizza', generate)
+    assert next(leader) == 'salad'
+    follower = []
+    thread = threading.Thread(target=lambda: follower.append(flight.do('pizza', generate)))
+    thread.start()
+    leader.close()
+    thread.join(5)
+    assert follower == [['salad', 'soup', 'wrap']]
+
+def test_cross_process_follower_reads_a_streamed_result(db):
+    leader = SingleFlight('test', cross_process=True, poll_interval=0.01)
+    follower = SingleFlight('test', cross_process=True, poll_interval=0.01)
+
+    stream = leader.stream('pizza', lambda: iter(['salad', 'soup']))
+    assert next(stream) == 'salad'
+    threading.Timer(0.1, lambda: list(stream)).start()
+    assert list(follower.stream('pizza', lambda: pytest.fail('follower must not call'))) == ['salad', 'soup']
+    assert follower.stats()['remote_followers'] == 1
@@ -0,0 +1,59 @@
+import threading
+
+import warmup
+from llm_cache import LLMResultCache
+
+def test_only_one_process_warms_each_item(db, monkeypatch):
+    monkeypatch.setattr(warmup, 'WARMUP_POLL_SECONDS', 0.01)
+    warm, warmed = set(), []
+    lock = threading.Lock()
+
+    def warm_item(item):
+        with lock:
+            warmed.append(item)
+            warm.add(item)
+
+    warmers = [
+        warmup.CacheWarmer('foods', lambda: ['apple', 'bread', 'cheese'], lambda item: item in warm, warm_item,
+                           rate=0, start_delay=0)
+        for _ in range(3)
+    ]
+    threads = [threading.Thread(target=warmer._warm_all) for warmer in warmers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert sorted(warmed) == ['apple', 'bread', 'cheese']
+    states = sorted(warmer.status()['state'] for warmer in warmers)
+    assert states == ['done', 'done_elsewhere', 'done_elsewhere']
+    assert all(warmer.ready() for warmer in warmers)
+
+def test_finished_warm_up_is_not_repeated_by_a_new_worker(db):
+    warmed = []
+    first = warmup.CacheWarmer('foods', lambda: ['apple'], lambda item: False, warmed.append, rate=0)
+    first._warm_all()
+    second = warmup.CacheWarmer('foods', lambda: ['apple'], lambda item: False, warmed.append, rate=0)
+    second._warm_all()
+    assert warmed == ['apple']
+    assert second.status()['state'] == 'done_elsewhere'
+
+def test_peek_leaves_cache_counters_alone(db):
+    cache = LLMResultCache('nutrition', 'model', 1, ttl_seconds=60)
+    cache.set({'product_name': 'Apple'}, 'apple')
+    cache.clear_memory()
+    assert cache.peek('apple') == {'product_name': 'Apple'}
+    assert cache.peek('pear') is None
+    stats = cache.stats()
+    assert (stats['memory_hits'], stats['persistent_hits'], stats['misses'], stats['memory_entries']) == (0, 0, 0, 0)
+
+def test_takeover_continues_a_dead_warmers_budget(db):
+    db.acquire_inflight_lock('warmup:foods', 'dead-worker', 60)
+    db.renew_inflight_lock('warmup:foods', 'dead-worker', -1, result='{"state": "running", "tokens": 150}')
+    warmed = []
+    warmer = warmup.CacheWarmer('foods', lambda: ['apple'], lambda item: False, warmed.append,
+                                rate=0, token_budget=100)
+    warmer._warm_all()
+    assert warmed == []
+    assert warmer.status()['state'] == 'budget_spent'
+    assert warmer.status()['tokens_spent'] == 150
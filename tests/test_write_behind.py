@@ -0,0 +1,46 @@
+import atexit
+import threading
+
+import database
+
+def test_pending_value_readable_until_commit(db, monkeypatch):
+    user_id = db.create_user('carol', 'carol@example.com', 'password123')['user_id']
+    buffer = database.WriteBehindBuffer('last_login', 'UPDATE users SET last_login = ? WHERE id = ?')
+    buffer.put(user_id, '2026-01-01 00:00:00')
+
+    committing, finish = threading.Event(), threading.Event()
+    connect = database.get_db_connection
+
+    class SlowCommit:
+        def __init__(self, conn):
+            self._conn = conn
+
+        def __getattr__(self, name):
+            return getattr(self._conn, name)
+
+        def commit(self):
+            committing.set()
+            finish.wait(5)
+            self._conn.commit()
+
+    monkeypatch.setattr(database, 'get_db_connection', lambda operation=None: SlowCommit(connect(operation)))
+    flusher = threading.Thread(target=buffer.flush)
+    flusher.start()
+    assert committing.wait(5)
+    assert buffer.pending(user_id) == '2026-01-01 00:00:00'
+    finish.set()
+    flusher.join()
+
+    assert buffer.pending(user_id) is None
+    conn = connect()
+    assert conn.execute('SELECT last_login FROM users WHERE id = ?', (user_id,)).fetchone()[0] == '2026-01-01 00:00:00'
+    conn.close()
+
+def test_newer_value_wins_over_failed_flush(db):
+    buffer = database.WriteBehindBuffer('broken', 'UPDATE no_such_table SET x = ? WHERE id = ?')
+    buffer.put(1, 'old')
+    assert buffer.flush() == 0
+    assert buffer.pending(1) == 'old'
+    buffer.put(1, 'new')
+    assert buffer.pending(1) == 'new'
+    atexit.unregister(buffer.flush)  # the table never exists
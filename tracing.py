@@ -0,0 +1,224 @@
+"""
+Lightweight per-request tracing.
+
+Each request gets a trace with a request ID. Code on the request path opens
+nested spans with `with span('name', key=value):`, and the spans follow the
+request into worker threads that copy the contextvars context. When no trace
+is active (background jobs, CLI commands), span() does nothing.
+
+Finished traces of slow requests (over TRACE_SLOW_MS), plus a random
+TRACE_SAMPLE_RATE fraction of the rest, are logged as JSON lines to the
+TRACE_LOGGER logger. configure_logging() routes that logger to
+trace_file_handler(), so the file is written by the logging listener thread
+rather than the request thread.
+"""
+import contextvars
+import fcntl
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+TRACE_FILE = os.environ.get('MINDFULBITE_TRACE_FILE', 'traces.jsonl')
+TRACE_SLOW_MS = float(os.environ.get('MINDFULBITE_TRACE_SLOW_MS', 2000))
+TRACE_SAMPLE_RATE = float(os.environ.get('MINDFULBITE_TRACE_SAMPLE_RATE', 0.01))
+TRACE_FILE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_FILE_BACKUPS = 5
+MAX_SPANS_PER_TRACE = 500  # spans past this are counted but not kept
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+_span_ids = itertools.count(1)
+
+TRACE_LOGGER = 'mindfulbite.traces'
+_trace_log = logging.getLogger(TRACE_LOGGER)
+_trace_log.setLevel(logging.INFO)
+
+class Span:
+    __slots__ = ('id', 'parent', 'name', 'start', 'duration', 'attrs')
+
+    def __init__(self, span_id, parent, name, start, attrs):
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.start = start
+        self.duration = None
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Attach attributes (model, tokens, row counts...) to the span"""
+        self.attrs.update(attrs)
+
+class Trace:
+    def __init__(self, name, request_id):
+        self.name = name
+        self.request_id = request_id
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.spans = []
+        self.dropped_spans = 0
+        self.attrs = {}
+        self._lock = threading.Lock()
+
+    def _add(self, span):
+        with self._lock:
+            if len(self.spans) >= MAX_SPANS_PER_TRACE:
+                self.dropped_spans += 1
+                return False
+            self.spans.append(span)
+            return True
+
+    def to_dict(self, duration):
+        with self._lock:
+            spans = [{
+                'id': span.id,
+                'parent': span.parent,
+                'name': span.name,
+                'start_ms': round((span.start - self.start) * 1000, 3),
+                'duration_ms': round(span.duration * 1000, 3) if span.duration is not None else None,
+                **span.attrs
+            } for span in self.spans]
+        return {
+            'request_id': self.request_id,
+            'name': self.name,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round(duration * 1000, 3),
+            **self.attrs,
+            'spans': spans,
+            'dropped_spans': self.dropped_spans
+        }
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+def new_request_id(incoming=None):
+    """Reuse a well-formed incoming request ID, otherwise make a new one"""
+    if incoming and _VALID_REQUEST_ID.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+def start_trace(name, request_id):
+    """Begin a trace for the current request"""
+    trace = Trace(name, request_id)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+def current_trace():
+    return _current_trace.get()
+
+def current_request_id():
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+@contextmanager
+def span(name, **attrs):
+    """Record a nested span in the current trace (a no-op outside one)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield _NOOP_SPAN
+        return
+
+    parent = _current_span.get()
+    current = Span(next(_span_ids), parent.id if parent else None, name, time.perf_counter(), attrs)
+    kept = trace._add(current)
+    token = _current_span.set(current) if kept else None
+    try:
+        yield current
+    except Exception as e:
+        current.attrs['error'] = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        if token is not None:
+            _current_span.reset(token)
+
+def finish_trace(trace, **attrs):
+    """End the trace, writing it out when it was slow or sampled"""
+    duration = time.perf_counter() - trace.start
+    _current_trace.set(None)
+    _current_span.set(None)
+
+    if duration * 1000 >= TRACE_SLOW_MS:
+        reason = 'slow'
+    elif random.random() < TRACE_SAMPLE_RATE:
+        reason = 'sampled'
+    else:
+        return
+    trace.attrs.update(attrs, reason=reason)
+    _write(trace.to_dict(duration))
+
+def _write(record):
+    try:
+        _trace_log.info(json.dumps(record, default=str))
+    except Exception as e:
+        logger.error(f"Failed to write trace: {e}")
+
+class SharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that several processes can append to. Each write and
+    rollover happens under an flock on a sidecar lock file, and a file that
+    another process rotated away is reopened before writing.
+    """
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, delay=True, **kwargs)
+        self._lock_path = self.baseFilename + '.lock'
+        self._lock_fd = None
+
+    def emit(self, record):
+        try:
+            if self._lock_fd is None:
+                self._lock_fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                self._reopen_if_rotated()
+                super().emit(record)
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        except Exception:
+            self.handleError(record)
+
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            current = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            current = None
+        opened = os.fstat(self.stream.fileno())
+        if current is None or (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino):
+            self.stream.close()
+            self.stream = None  # reopened by the next write (delay=True)
+
+    def close(self):
+        with self.lock:
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+        super().close()
+
+def trace_file_handler(path=None):
+    """Handler that appends trace lines to the shared rotating trace file"""
+    handler = SharedRotatingFileHandler(
+        path or TRACE_FILE, maxBytes=TRACE_FILE_MAX_BYTES, backupCount=TRACE_FILE_BACKUPS
+    )
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    return handler
@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from database import acquire_inflight_lock, renew_inflight_lock, get_inflight_state, finish_inflight
+from llm_router import track_usage
+
+logger = logging.getLogger(__name__)
+
+WARMUP_LEASE_TTL = 180  # seconds; renewed after every item, so a dead warmer is replaced this soon
+WARMUP_HOLD_SECONDS = int(os.environ.get('MINDFULBITE_WARMUP_HOLD_SECONDS', 3600))  # no new warm-up this soon after one
+WARMUP_POLL_SECONDS = 5  # how often standby workers check on the warmer
+
+class CacheWarmer:
+    """
+    Background warm-up of caches for the most popular items after a start.
+
+    items_fn() returns the items to warm, most important first. Each item
+    for which is_warm(item) is false is passed to warm(item), at most rate
+    items per second, until the LLM tokens spent reach token_budget. The
+    warmer becomes ready once ready_coverage of the items are warm, or when
+    it has done all it can (finished, budget spent, or failed), so a
+    readiness probe never waits forever.
+
+    With shared=True the warm-up runs once across all worker processes: the
+    process holding the llm_inflight lease row for the warmer does the work,
+    and the others stand by, tracking coverage, until it finishes. The
+    tokens spent are stored in the lease, so a standby that takes over from
+    a dead warmer continues with what is left of the same budget, and a
+    finished warm-up is not repeated for WARMUP_HOLD_SECONDS. is_warm must
+    not have side effects, since standby workers call it repeatedly.
+    """
+
+    def __init__(self, name, items_fn, is_warm, warm, rate=1.0, token_budget=200000, ready_coverage=0.8,
+                 start_delay=5.0, enabled=True, shared=True):
+        self.name = name
+        self.items_fn = items_fn
+        self.is_warm = is_warm
+        self.warm = warm
+        self.rate = rate
+        self.token_budget = token_budget
+        self.ready_coverage = ready_coverage
+        self.start_delay = start_delay
+        self.enabled = enabled
+        self.shared = shared
+
+        self._lease_key = f"warmup:{name}"
+        self._owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        self._lock = threading.Lock()
+        self._thread = None
+        self._state = 'pending' if enabled else 'disabled'
+        self._total = 0
+        self._warm = 0
+        self._warmed_now = 0
+        self._failed = 0
+        self._tokens = 0
+        self._ready = not enabled
+
+    def start(self):
+        """Start warming in a daemon thread (a no-op when disabled or already started)"""
+        with self._lock:
+            if not self.enabled or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=f"warmup-{self.name}", daemon=True)
+            self._thread.start()
+
+    def ready(self):
+        with self._lock:
+            return self._ready
+
+    def status(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self._state,
+                'ready': self._ready,
+                'coverage': round(self._warm / self._total, 4) if self._total else float(self._ready),
+                'target_coverage': self.ready_coverage,
+                'items': self._total,
+                'warm': self._warm,
+                'warmed_now': self._warmed_now,
+                'failed': self._failed,
+                'tokens_spent': self._tokens,
+                'token_budget': self.token_budget
+            }
+
+    def _run(self):
+        time.sleep(self.start_delay)
+        try:
+            self._warm_all()
+        except Exception as e:
+            logger.error(f"Warm-up {self.name} failed: {e}")
+            self._finish('failed')
+
+    def _warm_all(self):
+        items = list(self.items_fn())
+        with self._lock:
+            self._total = len(items)
+            self._state = 'running'
+        logger.info(f"Warm-up {self.name}: {len(items)} items")
+
+        pending = self._recount(items)
+        if not pending:
+            self._finish('done')
+            return
+
+        if self.shared:
+            spent = self._wait_for_lease(items)
+            if spent is None:
+                return
+            with self._lock:
+                self._state = 'running'
+                self._tokens = spent
+            pending = self._recount(items)
+
+        state = self._warm_pending(pending)
+        self._finish(state)
+        if self.shared:
+            finish_inflight(self._lease_key, self._owner, result=self._progress(state),
+                            handoff_ttl=WARMUP_HOLD_SECONDS)
+
+    def _recount(self, items):
+        """Count the warm items; returns the others"""
+        pending = [item for item in items if not self.is_warm(item)]
+        with self._lock:
+            self._warm = 0
+        for _ in range(len(items) - len(pending)):
+            self._mark_warm()
+        return pending
+
+    def _progress(self, state):
+        with self._lock:
+            return json.dumps({'state': state, 'tokens': self._tokens})
+
+    def _wait_for_lease(self, items):
+        """
+        Block until this process holds the warm-up lease, returning the tokens
+        earlier warmers already spent, or None once another process has
+        finished the warm-up.
+        """
+        spent = 0
+        while True:
+            lease = get_inflight_state(self._lease_key, include_expired=True)
+            finished = lease is not None and lease['finished_at'] is not None
+            if lease and lease['result'] and not finished:
+                # A running (or dead) warmer's spending counts against this round's budget
+                spent = json.loads(lease['result']).get('tokens', spent)
+            if finished and lease['expires_at'] > time.time():
+                with self._lock:
+                    self._tokens = json.loads(lease['result']).get('tokens', 0) if lease['result'] else 0
+                self._recount(items)
+                self._finish('done_elsewhere')
+                return None
+            if acquire_inflight_lock(self._lease_key, self._owner, WARMUP_LEASE_TTL):
+                return 0 if finished else spent
+            with self._lock:
+                self._state = 'standby'
+                self._tokens = spent
+            self._recount(items)
+            time.sleep(WARMUP_POLL_SECONDS)
+
+    def _warm_pending(self, pending):
+        """Warm the pending items within the budget; returns the final state"""
+        interval = 1 / self.rate if self.rate > 0 else 0
+        for item in pending:
+            if self._tokens >= self.token_budget:
+                logger.info(f"Warm-up {self.name}: token budget of {self.token_budget} spent")
+                return 'budget_spent'
+            if self.shared and not renew_inflight_lock(self._lease_key, self._owner, WARMUP_LEASE_TTL,
+                                                       result=self._progress('running')):
+                logger.warning(f"Warm-up {self.name}: lost the warm-up lease, stopping")
+                return 'lease_lost'
+            started = time.monotonic()
+            try:
+                with track_usage() as usage:
+                    self.warm(item)
+                with self._lock:
+                    self._tokens += usage.total_tokens
+                if self.is_warm(item):
+                    self._mark_warm(warmed_now=True)
+                else:
+                    with self._lock:
+                        self._failed += 1
+            except Exception as e:
+                logger.warning(f"Warm-up {self.name} failed for {item}: {e}")
+                with self._lock:
+                    self._failed += 1
+
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+        return 'done'
+
+    def _mark_warm(self, warmed_now=False):
+        with self._lock:
+            self._warm += 1
+            if warmed_now:
+                self._warmed_now += 1
+            if not self._ready and self._total and self._warm / self._total >= self.ready_coverage:
+                self._ready = True
+                logger.info(f"Warm-up {self.name}: ready at {self._warm}/{self._total} items warm")
+
+    def _finish(self, state):
+        with self._lock:
+            self._state = state
+            self._ready = True
+        logger.info(f"Warm-up {self.name} {state}: {self._warm}/{self._total} items warm, {self._tokens} tokens")